@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+import logging as log
+
+from src.data_structure.graph.callbacks.callback import CallbackResult, NormalizedResult
+
+
+class CrawlCheckpoint:
+    """
+    Periodic checkpoint of a crawl in a SQLite file. The checkpoint holds the urls that are waiting in the frontier,
+    the visited urls and every record that was added to the graphs, so a crawl that was stopped can continue from
+    the last checkpoint without fetching the finished pages again.
+    The changes are buffered in memory and written together in one transaction, so the file always holds a
+    consistent state. The checkpoint can be shared between threads.
+    """
+
+    def __init__(self, path: str, interval: float = 30):
+        self._path = path
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, depth INTEGER)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS records (domain TEXT, url TEXT, data TEXT, type TEXT)")
+
+    def push(self, urls: List[str], canonical_urls: List[str], depth: int) -> None:
+        """
+        Record urls that were added to the frontier
+        :param urls: List of urls
+        :param canonical_urls: The canonical form of the urls, as kept in the visited set
+        :param depth: The depth of the urls from their seed
+        :return:
+        """
+        with self._lock:
+            self._buffer.append(("INSERT OR IGNORE INTO seen VALUES (?)", [(url,) for url in canonical_urls]))
+            self._buffer.append(("INSERT OR REPLACE INTO frontier VALUES (?, ?)", [(url, depth) for url in urls]))
+
+    def done(self, url: str) -> None:
+        """
+        Record that the url was crawled and everything that was found in it was recorded
+        :param url: The url that was crawled
+        :return:
+        """
+        with self._lock:
+            self._buffer.append(("DELETE FROM frontier WHERE url = ?", [(url,)]))
+        self.flush(force=False)
+
+    def append(self, record: CallbackResult) -> None:
+        """
+        Record data that was added to a graph
+        :param record: CallbackResult
+        :return:
+        """
+        with self._lock:
+            self._buffer.append(("INSERT INTO records VALUES (?, ?, ?, ?)",
+                                 [(record.domain, record.url, record.data, record.type)]))
+
+    def extend(self, records: List[CallbackResult]) -> None:
+        """
+        Record a batch of data that was added to a graph
+        :param records: List of CallbackResult
+        :return:
+        """
+        with self._lock:
+            self._buffer.append(("INSERT INTO records VALUES (?, ?, ?, ?)",
+                                 [(record.domain, record.url, record.data, record.type) for record in records]))
+
+    def flush(self, force: bool = True) -> None:
+        """
+        Write the buffered changes to the file
+        :param force: When False the changes are written only if the checkpoint interval has passed
+        :return:
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._last_flush < self._interval:
+                return
+
+            with self._connection:
+                for statement, rows in self._buffer:
+                    self._connection.executemany(statement, rows)
+            log.debug(f"Checkpoint of {len(self._buffer)} changes written to {self._path}")
+            self._buffer = []
+            self._last_flush = time.monotonic()
+
+    def load(self) -> Tuple[List[Tuple[str, int]], List[str], List[CallbackResult]]:
+        """
+        Load the state of the last checkpoint
+        :return: The frontier as (url, depth) tuples, the canonical visited urls and the graph records
+        """
+        with self._lock:
+            frontier = self._connection.execute("SELECT url, depth FROM frontier").fetchall()
+            seen = [row[0] for row in self._connection.execute("SELECT url FROM seen")]
+            records = [NormalizedResult(*row) for row in
+                       self._connection.execute("SELECT domain, url, data, type FROM records ORDER BY rowid")]
+        log.info(f"Loaded checkpoint with {len(frontier)} urls to crawl, {len(seen)} visited urls and "
+                 f"{len(records)} graph records")
+        return frontier, seen, records
+
+    def clear(self) -> None:
+        """
+        Delete the state of the checkpoint, once the crawl has finished and its results were saved
+        :return:
+        """
+        with self._lock:
+            self._buffer = []
+            with self._connection:
+                for table in ("frontier", "seen", "records"):
+                    self._connection.execute(f"DELETE FROM {table}")
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
@@ -0,0 +1,62 @@
+import asyncio
+import importlib.util
+import logging as log
+from urllib.parse import urlsplit
+
+import httpx
+
+import src.utils.constants as consts
+from src.utils.config import Config
+
+
+class HttpClient:
+    """
+    Long lived http client of a crawler. The connections are kept alive and reused between requests, the number of
+    open connections is capped globally and for each host. The client has to be closed when the crawl ends.
+    """
+
+    def __init__(self, config: Config, headers: dict = None):
+        timeout = config.get(consts.CRAWLER_SECTION, consts.TIMEOUT_CONFIG_TOKEN, return_as_string=False)
+        max_connections = config.get(consts.CRAWLER_SECTION, consts.MAX_CONNECTIONS_CONFIG_TOKEN,
+                                     default_value=100, return_as_string=False)
+        max_keepalive = config.get(consts.CRAWLER_SECTION, consts.MAX_KEEPALIVE_CONNECTIONS_CONFIG_TOKEN,
+                                   default_value=20, return_as_string=False)
+        keepalive_expiry = config.get(consts.CRAWLER_SECTION, consts.KEEPALIVE_EXPIRY_CONFIG_TOKEN,
+                                      default_value=30, return_as_string=False)
+        self._max_host_connections = config.get(consts.CRAWLER_SECTION, consts.MAX_HOST_CONNECTIONS_CONFIG_TOKEN,
+                                                default_value=10, return_as_string=False)
+        http2 = config.get(consts.CRAWLER_SECTION, consts.HTTP2_CONFIG_TOKEN, default_value=False,
+                           return_as_string=False)
+        if http2 and importlib.util.find_spec("h2") is None:
+            log.warning("HTTP/2 is enabled but the h2 package is not installed. Falling back to HTTP/1.1")
+            http2 = False
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                              keepalive_expiry=keepalive_expiry)
+        self._client = httpx.AsyncClient(headers=headers, timeout=timeout, limits=limits, http2=http2, verify=False)
+        self._host_connections = {}
+        log.info(f"Http client created with {max_connections} connections, {self._max_host_connections} per host, "
+                 f"http2={http2}")
+
+    async def get(self, url: str) -> httpx.Response:
+        """
+        Send a GET request. Waits when the host of the url already has the maximum number of open requests
+        :param url: string. The url to fetch
+        :return: httpx.Response
+        """
+        async with self._get_host_limit(urlsplit(url).netloc):
+            return await self._client.get(url)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    def _get_host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_connections:
+            self._host_connections[host] = asyncio.Semaphore(self._max_host_connections)
+        return self._host_connections[host]
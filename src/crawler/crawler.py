@@ -1,146 +1,375 @@
-import time
-
 import httpx
-import requests
-import joblib
 
 import asyncio
-from typing import List, Generator
+import time
+from operator import attrgetter
+from typing import List
+from urllib.parse import urlsplit
 import logging as log
 
 from src.data_structure.graph.callbacks.callback import GraphCallback
-from src.crawler.filter import UrlFilter
+from src.crawler.checkpoint import CrawlCheckpoint
+from src.crawler.client import HttpClient
+from src.crawler.filter import ROBOTS_DROP, UrlFilter
+from src.crawler.frontier import Frontier
+from src.crawler.retry import GAVE_UP_COUNTER, PERMANENT_FAILURES_COUNTER, RECOVERED_COUNTER, \
+    RETRYABLE_FAILURES_COUNTER, RetryPolicy
+from src.crawler.robots import MAX_ROBOTS_REDIRECTS, ROBOTS_MISSING_STATUS_CODES, ROBOTS_PATH, SITEMAP_PATH, \
+    parse_sitemap
+from src.crawler.scheduler import HostScheduler, parse_retry_after
 from src.utils.config import Config
-from src.utils.tools import clean_url, os
+from src.utils.tools import clean_url, parse_url
+from src.crawler.parsers.html import ParsedPage, extract_page
+from src.crawler.parsers.pool import ParserPool
 from src.crawler.parsers.url import URLsParser
 import src.utils.constants as consts
+from src.data_structure.factory import create_graph
 from src.data_structure.graph.graph import WebGraph
 
+FRONTIER_POLL_INTERVAL = 0.05  # Seconds to wait before checking the frontier again when no url can be crawled
+MAX_SITEMAP_FILES = 50  # The number of sitemap files of a seed host to fetch, counting the nested sitemaps
+
 
 class WebSpider:
-    def __init__(self, callbacks: List[GraphCallback], url_filter: UrlFilter, start_seed: str, config: Config):
+    def __init__(self, callbacks: List[GraphCallback], url_filter: UrlFilter, start_seed: str, config: Config,
+                 parser_pool: ParserPool = None, frontier: Frontier = None, checkpoint: CrawlCheckpoint = None,
+                 retry_policy: RetryPolicy = None):
+        self._config = config
+        self._parser_pool = parser_pool
         self._callbacks = callbacks
         self._filter = url_filter
+        # Crawlers of the same build share one frontier so every url is fetched once across all the seeds
+        self._frontier = frontier if frontier is not None else Frontier(url_filter, checkpoint=checkpoint,
+                                                                        scheduler=HostScheduler(config))
+        # The retry budget is kept for the whole build when the policy is shared as well
+        self._retry_policy = retry_policy or RetryPolicy(config)
         self._start_seed = clean_url(start_seed)
-        self._data_structure = WebGraph(config=config)
+        self._data_structure = create_graph(config=config)
+        # Everything that is added to the graph is recorded in the checkpoint, if there is one
+        self._data_structure.journal = checkpoint
         self._url_parser = URLsParser()
         self._max_depth = config.get(consts.CRAWLER_SECTION, consts.MAX_DEPTH_CONFIG_TOKEN, return_as_string=False)
-        self._max_retries = config.get(consts.CRAWLER_SECTION, consts.MAX_RETIRES_CONFIG_TOKEN, return_as_string=False)
-        self._timeout = config.get(consts.CRAWLER_SECTION, consts.TIMEOUT_CONFIG_TOKEN, return_as_string=False)
         self._max_requests = config.get(consts.CRAWLER_SECTION, consts.MAX_REQUEST_CONFIG_TOKEN, return_as_string=False)
+        # The sitemaps of the seed hosts are read when the filter obeys robots.txt, since they are listed in it
+        self._sitemaps = config.get(consts.CRAWLER_SECTION, consts.SITEMAPS_CONFIG_TOKEN,
+                                    default_value=True, return_as_string=False)
+        self._max_sitemap_urls = config.get(consts.CRAWLER_SECTION, consts.MAX_SITEMAP_URLS_CONFIG_TOKEN,
+                                            default_value=10000, return_as_string=False)
         log.warning(f"Max depth is set to {self._max_depth}")
-        self._stop_scaling_up = False
         self._headers = {
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36",
             "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
             "accept-language": "en-US;en;q=0.9",
             "accept-encoding": "gzip, deflate, br",
         }
-        self._max_threads = os.cpu_count() * 2
-        self._exception_count = 0
+        self._client = None
+        # The progress of the crawl: the urls of the pages that were fetched and the number of urls that failed
+        self._fetched_urls = []
+        self._errors = 0
+        self._stopped = False
+
+    @property
+    def fetched_urls(self) -> List[str]:
+        """
+        The urls of the pages that were fetched so far, in the order they were fetched
+        """
+        return self._fetched_urls
 
-    def parse_for_url(self, response: requests.Response) -> List[str]:
+    @property
+    def errors(self) -> int:
         """
-        Parse the given responses for urls
-        :param response: Http response to scrape from
+        The number of urls that failed or got an error response
+        """
+        return self._errors
+
+    def stop(self) -> None:
+        """
+        Stop the crawl. The workers finish the urls they are crawling and take no more urls from the frontier, which
+        keeps the rest of the urls, so the crawl can be resumed from its checkpoint
+        :return:
+        """
+        self._stopped = True
+
+    def parse_for_url(self, page: ParsedPage) -> List[str]:
+        """
+        Parse the given page for urls. Links to visited urls are added to the graph as well
+        :param page: The links and text extracted from the http response
         :return: List of urls -> List of string [url1, url2, ...]
         """
 
-        urls = []
-        for res in self._url_parser.parse(response):
-            # Try to filter the url based on rules. If it came back empty it means that the url is not valid
-            if self._filter.filter([res.data]):
-                # Need to add the url to the data structure. The data structure will know how to handle the data.
-                # Each data structure has its own way of handling the data
-                self._data_structure.add(res)
-                urls.append(res.data)
+        # Try to filter the urls based on rules
+        results = self._filter.filter_allowed(self._url_parser.parse(page), key=attrgetter('data'))
+        # Need to add the urls to the data structure. The data structure will know how to handle the data.
+        # Each data structure has its own way of handling the data
+        self._data_structure.add_many(results)
+        links = [res.data for res in results]
 
-        log.debug(f"Found {len(urls)} urls in the responses")
-        return urls
+        log.debug(f"Found {len(links)} urls in the responses")
+        return links
 
-    async def callbacks(self, response: requests.Response) -> None:
+    async def callbacks(self, page: ParsedPage) -> None:
         """
-        Run the callbacks on the given responses. The callbacks will be run in a sequential manner
-        :param response: Http responses to run the callbacks on. Need to have a content attribute
+        Run the callbacks on the given page. The callbacks will be run in a sequential manner
+        :param page: The links and text extracted from the http response
         :return:
         """
         for callback in self._callbacks:
-            callback.process(graph=self._data_structure, data=response)
+            callback.process(graph=self._data_structure, data=page)
 
     async def crawl(self, start_seed=None) -> WebGraph:
         """
-        Crawl the web starting from the given seed. The search is done in a BFS manner and will stop when the max depth
-        is reached or when there are no more urls to crawl.
+        Crawl the web starting from the given seed. The urls are kept in a frontier queue, that can be shared with
+        the crawlers of other seeds, and a fixed pool of workers fetches them. Each response is parsed and passed to
+        the callbacks as soon as it arrives, and the urls found in it are pushed to the frontier until the max depth
+        is reached.
         :param start_seed: Url to start crawling from
         :return: WebGraph object
         """
-        depth = 0
         if not start_seed:
             start_seed = [self._start_seed]
 
-        url_pool = start_seed
+        self._frontier.add_seeds(start_seed)
         try:
-            while url_pool and depth <= self._max_depth:
-                for response in self.imap(url_pool):
+            async with HttpClient(config=self._config, headers=self._headers) as client:
+                self._client = client
+                workers = [asyncio.create_task(self._worker()) for _ in range(self._max_requests)]
+                try:
+                    await asyncio.gather(*workers)
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+
+            self._client = None
+            self._data_structure.journal = None
+            log.info(f"Finished crawling from {start_seed}. Max depth was {self._max_depth}. "
+                     f"Request stats: {self._retry_policy.stats}")
+            return self._data_structure
+
+        except Exception as e:
+            log.error(f"Error while crawling the web: {e}")
+            raise e
+
+    async def _worker(self) -> None:
+        """
+        Take urls from the frontier until the frontier is done. The frontier can be filled by other crawlers, so an
+        empty frontier is polled until no url is left to crawl by anyone
+        :return:
+        """
+        while not self._stopped:
+            item = self._frontier.pop()
+            if item is None:
+                if self._frontier.is_done():
+                    return
+                await asyncio.sleep(FRONTIER_POLL_INTERVAL)
+                continue
+
+            url, depth = item
+            try:
+                await self._crawl_url(url, depth)
+            except Exception as e:
+                self._errors += 1
+                log.error(f"Error while crawling {url}: {e}")
+            finally:
+                self._frontier.task_done(url)
 
-                    if self._max_requests > self._max_threads:
-                        log.warning(
-                            f"Max requests is bigger than the number of threads. Setting max requests to {self._max_threads}")
-                        self._max_requests = self._max_threads
+    async def _crawl_url(self, url: str, depth: int) -> None:
+        """
+        Fetch a single url, parse it and push the urls found in it to the frontier
+        :param url: Url to crawl
+        :param depth: The depth of the url from the seed
+        :return:
+        """
+        if self._filter.robots is not None and not await self._obey_robots(url, depth):
+            return
+        response = await self._fetch(url)
+        if response.status_code not in (200, 301, 302):
+            self._errors += 1
+            log.warning(f"Got {response.status_code} response from {response.url}. Skipping")
+            return
+        self._fetched_urls.append(url)
 
-                    elif response.status_code != 200 and response.status_code != 301 and response.status_code != 302:
-                        log.warning(f"Got {response.status_code} response from {response.url}. Skipping")
-                        self._exception_count += 1
-                        continue
+        # The html is parsed once in a separate thread or process so the event loop can keep sending requests meanwhile
+        if self._parser_pool:
+            page = await self._parser_pool.parse(str(response.url), response.content)
+        else:
+            page = await asyncio.to_thread(extract_page, str(response.url), response.content)
+        urls = self.parse_for_url(page=page)
+        await self.callbacks(page=page)
 
-                    url_pool = self.parse_for_url(response=response)
-                    await self.callbacks(response=response)
+        if depth < self._max_depth:
+            self._frontier.push(urls, depth=depth + 1)
 
-                if not self._stop_scaling_up:
-                    self._max_requests = self._max_requests + 5
-                    log.info(f"Scaling up the number of send requests to {self._max_requests}")
+    async def _obey_robots(self, url: str, depth: int) -> bool:
+        """
+        Check the url against the robots.txt rules of its host. The rules of a new host are fetched with the request
+        slot that was reserved for the url. When the url is a seed, the sitemaps of its host are pushed to the frontier
+        once per crawl, whether its rules were fetched or cached. The Crawl-delay of the host is passed to the
+        scheduler
+        :param url: Url taken from the frontier
+        :param depth: The depth of the url from the seed
+        :return: bool. True if the url can be fetched. Its request slot is reserved then, and released otherwise or when
+            the check raises
+        """
+        robots = self._filter.robots
+        parsed = parse_url(url)
+        site = f"{parsed.scheme}://{parsed.netloc}"
+        scheduler = self._frontier.scheduler
+        # Whether the url holds its request slot, which is cancelled if the check fails before the url is fetched
+        held = True
+        try:
+            rules = robots.get(site)
+            if rules is None:
+                if robots.claim(site):
+                    # The robots.txt request uses the slot of the url and releases it
+                    held = False
+                    rules = await self._fetch_robots(site)
+                while rules is None:
+                    # Another worker is fetching the rules of the host
+                    await asyncio.sleep(FRONTIER_POLL_INTERVAL)
+                    rules = robots.get(site)
+            if self._sitemaps and depth == 0 and robots.claim_sitemaps(site):
+                # The sitemap requests take slots of the host, so the url gives its slot back until they are done
+                if held and scheduler:
+                    scheduler.cancel(parsed.netloc)
+                held = False
+                await self._seed_sitemaps(site, rules)
+            if not held:
+                await self._reserve(parsed.netloc)
+                held = True
 
-                if self._exception_count > self._max_retries:
-                    log.warning(f"Got {self._exception_count} exceptions. Waiting for 5 seconds")
-                    await asyncio.sleep(5)
-                    log.warning("Trying to scaling down the requests")
-                    self._max_requests = self._max_requests // 2
-                    if self._max_requests == 0:
-                        log.error("Max requests is 0. No more requests can be sent. Returning the current graph")
-                        return self._data_structure
+            if scheduler:
+                scheduler.set_crawl_delay(parsed.netloc, rules.crawl_delay("*"))
+            if rules.can_fetch("*", url):
+                return True
+        except BaseException:
+            # BaseException also covers the cancellation of the job
+            if held and scheduler:
+                scheduler.cancel(parsed.netloc)
+            raise
 
-                    elif self._max_requests < self._max_requests:
-                        log.warning("There is indication that the max requests is too low. Stopping scaling up")
-                        self._stop_scaling_up = True
+        log.debug(f"drop {ROBOTS_DROP} {url}")
+        self._filter.count_drop(ROBOTS_DROP)
+        if scheduler:
+            scheduler.cancel(parsed.netloc)
+        return False
 
-                    self._exception_count = 0
+    async def _fetch_robots(self, site: str):
+        """
+        Fetch the robots.txt file of a host, following its redirects, and cache its rules. A missing file allows
+        everything, and so does a file that could not be fetched, but only the rules of a file that was fetched or is
+        missing (404, 410) are kept for the next builds. Nothing is written when the fetch raises
+        :param site: string. The scheme and host, like https://www.example.com
+        :return: RobotFileParser of the rules
+        """
+        content, persist = "", False
+        try:
+            url = site + ROBOTS_PATH
+            response = await self._fetch(url)
+            for _ in range(MAX_ROBOTS_REDIRECTS):
+                if not response.is_redirect:
+                    break
+                url = str(response.url.join(response.headers["location"]))
+                await self._reserve(urlsplit(url).netloc)
+                response = await self._fetch(url)
+            if response.status_code == 200:
+                content, persist = response.text, True
+            elif response.status_code in ROBOTS_MISSING_STATUS_CODES:
+                persist = True
+        except BaseException:
+            # The other workers wait for the rules of the host, they allow everything for this crawl
+            self._filter.robots.put(site, "", persist=False)
+            raise
+        return self._filter.robots.put(site, content, persist=persist)
 
-                depth += 1
+    async def _seed_sitemaps(self, site: str, rules) -> None:
+        """
+        Push the pages of the sitemaps of a seed host to the frontier, as if the seed linked to them, so deep pages are
+        reached without following the links of every level. The sitemaps listed in robots.txt are read, or
+        /sitemap.xml if none is listed
+        :param site: string. The scheme and host, like https://www.example.com
+        :param rules: RobotFileParser of the host
+        :return:
+        """
+        queue = list(rules.site_maps() or [site + SITEMAP_PATH])
+        urls, fetched = [], 0
+        while queue and len(urls) < self._max_sitemap_urls and fetched < MAX_SITEMAP_FILES:
+            sitemap = queue.pop(0)
+            fetched += 1
+            await self._reserve(parse_url(sitemap).netloc)
+            response = await self._fetch(sitemap)
+            if response.status_code != 200:
+                continue
+            pages, sitemaps = await asyncio.to_thread(parse_sitemap, response.content)
+            urls.extend(pages)
+            queue.extend(sitemaps)
 
-            if depth > self._max_depth:
-                log.warning(f"Reached max depth of {self._max_depth}. Stop crawling")
+        urls = self._filter.filter_allowed(urls[:self._max_sitemap_urls])
+        log.info(f"Found {len(urls)} urls in {fetched} sitemaps of {site}")
+        if urls and self._max_depth > 0:
+            self._frontier.push(urls, depth=1)
 
-            return self._data_structure
+    async def _fetch(self, url: str) -> httpx.Response:
+        """
+        Send the request of a url that was taken from the frontier. Every response is reported to the scheduler, which
+        adapts the rate of the host to it, and transient failures are sent again for as long as the retry policy allows
+        :param url: Url to fetch
+        :return: httpx.Response. A 500 response if the request failed without a response
+        """
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            response, error = None, None
+            try:
+                response = await self.send_request(url)
+            except Exception as e:
+                error = e
+            finally:
+                status_code = response.status_code if response is not None else consts.RESP_SERVER_ERROR_VAL
+                retry_after = parse_retry_after(response.headers.get("retry-after")) if response is not None else 0
+                if self._frontier.scheduler:
+                    self._frontier.scheduler.release(host, status_code, time.monotonic() - start, retry_after)
 
-        except Exception as e:
-            log.error(f"Error while crawling the web: {e}")
-            raise e
+            if error is None and status_code < 400:
+                if attempt:
+                    self._retry_policy.record(RECOVERED_COUNTER)
+                return response
 
-    def imap(self, url_pool) -> Generator:
-        tasks = [
-            (self.send_request, {"url": url})
-            for url in url_pool
-        ]
-        res = joblib.Parallel(n_jobs=self._max_requests, backend="threading")(
-            joblib.delayed(task[0])(**task[1]) for task in tasks)
+            if not self._retry_policy.is_retryable("GET", status_code=status_code, error=error):
+                self._retry_policy.record(PERMANENT_FAILURES_COUNTER)
+                break
+            self._retry_policy.record(RETRYABLE_FAILURES_COUNTER)
+            delay = self._retry_policy.get_delay(attempt, retry_after)
+            if delay is None:
+                # The host asked for a longer wait than a worker is parked for, it is paused by the scheduler instead
+                log.warning(f"Giving up {url}: {host} asked to wait {retry_after:.1f} seconds")
+                self._retry_policy.record(GAVE_UP_COUNTER)
+                break
+            if not self._retry_policy.acquire(host, attempt):
+                self._retry_policy.record(GAVE_UP_COUNTER)
+                break
 
-        for r in res:
-            yield r
+            log.info(f"Retrying {url} in {delay:.2f} seconds after {error or status_code}")
+            await asyncio.sleep(delay)
+            await self._reserve(host)
+            attempt += 1
 
-    def send_request(self, url):
-        try:
-            response = httpx.request(method="GET", url=url, headers=self._headers, timeout=self._timeout, verify=False)
-            return response
-        except Exception as e:
-            log.error(f"Error while sending request to {url}: {e}")
-            return httpx.Response(status_code=500, request=httpx.Request("GET", url), content=b"")
+        if error is not None:
+            log.error(f"Error while sending request to {url}: {error!r}")
+            return httpx.Response(status_code=consts.RESP_SERVER_ERROR_VAL, request=httpx.Request("GET", url),
+                                  content=b"")
+        return response
+
+    async def _reserve(self, host: str) -> None:
+        """
+        Wait until the scheduler allows another request to the host
+        :param host: string. The host of the url
+        :return:
+        """
+        scheduler = self._frontier.scheduler
+        while scheduler and not scheduler.reserve(host):
+            await asyncio.sleep(FRONTIER_POLL_INTERVAL)
+
+    async def send_request(self, url) -> httpx.Response:
+        return await self._client.get(url)
@@ -1,16 +1,103 @@
-from typing import List
-import posixpath
-from urllib.parse import urlparse
+import re
+from collections import Counter
+from typing import Callable, Iterable, List, Optional
+import threading
 
-from tldextract import tldextract
 import logging as log
 import src.utils.constants as consts
-from src.utils.tools import extract_base_url
+from src.crawler.robots import RobotsCache
+from src.crawler.visited import create_visited_set
+from src.utils.tools import extract_base_url, parse_url, TLD_EXTRACTOR
+
+VALID_SCHEMES = ("http", "https")
+
+# The reasons a url is dropped by the filter
+SCHEME_DROP = "scheme"
+DOMAIN_DROP = "domain"
+EXTENSION_DROP = "extension"
+PATH_DROP = "path"
+ROBOTS_DROP = "robots"
+DUPLICATE_DROP = "duplicate"
+
+
+def split_rules(rules) -> List[str]:
+    """
+    :param rules: string of comma separated rules, as in the config, or a list of rules
+    :return: List of the rules that are not empty, lowercase
+    """
+    if not rules:
+        return []
+    if isinstance(rules, str):
+        rules = rules.split(',')
+    return [rule.strip().lower() for rule in rules if rule.strip()]
+
+
+def compile_patterns(patterns) -> Optional[re.Pattern]:
+    """
+    Combine the path patterns into one regex that matches a path if any of them matches its start
+    :param patterns: string of patterns, one per line as in the config, or a list of patterns or compiled regexes
+    :return: The compiled regex, None if there are no patterns
+    """
+    if not patterns:
+        return None
+    if isinstance(patterns, str):
+        patterns = patterns.splitlines()
+    patterns = [pattern.pattern if isinstance(pattern, re.Pattern) else pattern.strip() for pattern in patterns]
+    patterns = [pattern for pattern in patterns if pattern]
+    if not patterns:
+        return None
+    try:
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+    except re.error as e:
+        log.error(f"Invalid pattern rules {patterns}: {e}")
+        raise e
+
+
+class DomainRules:
+    """
+    The domain rules of the filter, compiled once. The blocked domains are kept in a set of registered domains, and a
+    host is matched by looking up each of its dot separated suffixes in the set, so a rule matches whole labels only
+    ("oo.com" does not match "youtube.com") and a decision costs a few set lookups
+    """
+
+    def __init__(self, domains, subdomains):
+        """
+        :param domains: The blocked registered domains, like youtube.com
+        :param subdomains: The blocked subdomains of these domains, like www. All the subdomains when empty
+        """
+        self.domains = set()
+        for rule in split_rules(domains):
+            # Keep the registered domain of the rule, so "www.youtube.com" blocks youtube.com
+            registered_domain = TLD_EXTRACTOR(rule).registered_domain
+            if not registered_domain:
+                log.warning(f"Domain filter rule {rule} is not a registered domain")
+            self.domains.add(registered_domain or rule)
+        self.subdomains = set(split_rules(subdomains))
+
+    def __bool__(self) -> bool:
+        return bool(self.domains or self.subdomains)
+
+    def is_blocked(self, url: str) -> bool:
+        """
+        :param url: string. The url to check
+        :return: bool. True if the host of the url is a blocked subdomain of a blocked domain
+        """
+        if not self.domains:
+            return parse_url(url).subdomain in self.subdomains
+
+        host = parse_url(url).host
+        start = 0
+        while True:
+            if host[start:] in self.domains:
+                return not self.subdomains or host[:max(start - 1, 0)] in self.subdomains
+            start = host.find('.', start) + 1
+            if start == 0:
+                return False
 
 
 class UrlFilter:
 
-    def __init__(self, config: dict) -> None:
+    def __init__(self, config: dict, robots: RobotsCache = None) -> None:
         domain = config.get(consts.DOMAIN_FILTER)
         subdomain = config.get(consts.SUBDOMAIN_FILTER)
         follow = config.get(consts.PATTERN_RULES)
@@ -18,72 +105,118 @@ class UrlFilter:
         self.domain = domain
         # restrict filtering to sepcific subdomain
         self.subdomain = subdomain
-        self.follow = follow or []
+        # All the rules are compiled once: the domain rules, the ignored extensions and schemes and one regex that
+        # matches any of the path patterns
+        self.domain_rules = DomainRules(domain, subdomain)
+        self.extensions = frozenset(f".{extension}" for extension in consts.IGNORED_EXTENSIONS)
+        self.schemes = frozenset(VALID_SCHEMES)
+        self.follow = compile_patterns(follow)
+        # The robots.txt rules of the hosts, when they are obeyed
+        self.robots = robots
         log.info(f"filter created for domains {self.subdomain}.{self.domain} with follow rules {follow}")
-        self.seen = set()
+        # The visited urls in their canonical form
+        self.seen = create_visited_set(config)
+        self.lock = threading.Lock()
+        # The number of urls dropped for each reason
+        self._drops = Counter()
+
+    @property
+    def stats(self) -> dict:
+        """
+        The number of urls dropped for each reason
+        """
+        with self.lock:
+            return dict(self._drops)
 
     def is_valid_ext(self, url):
         """ignore non-crawlable documents"""
-        return posixpath.splitext(urlparse(url).path)[1].lower() not in consts.IGNORED_EXTENSIONS
+        return parse_url(url).extension not in self.extensions
 
     def is_valid_scheme(self, url):
         """ignore non http/s links"""
-        return urlparse(url).scheme in ['https', 'http']
+        return parse_url(url).scheme in self.schemes
 
     def is_valid_domain(self, url):
-        """ignore offsite urls"""
-        if not self.domain and not self.subdomain:
-            return True
-        parsed = tldextract.extract(url)
-        if parsed.registered_domain in self.domain and parsed.subdomain in self.subdomain:
-            return False
-        return True
+        """ignore urls of blocked domains"""
+        return not self.domain_rules or not self.domain_rules.is_blocked(url)
 
     def is_valid_path(self, url):
         """ignore urls of undesired paths"""
-        if not self.follow:
-            return True
-        path = urlparse(url).path
-        for pattern in self.follow:
-            if pattern.match(path):
-                return True
-        return False
+        return self.follow is None or self.follow.match(parse_url(url).path) is not None
 
     def is_new(self, url):
         """ignore visited urls (in canonical form)"""
         return extract_base_url(url) not in self.seen
 
-    def filter(self, urls: List[str]) -> List[str]:
-        """filter list of urls"""
+    def get_drop_reason(self, url) -> Optional[str]:
+        """check the url against all the rules in one pass over its parsed parts. None if the url is allowed"""
+        parsed = parse_url(url)
+        if parsed.scheme not in self.schemes:
+            return SCHEME_DROP
+        if self.domain_rules and self.domain_rules.is_blocked(url):
+            return DOMAIN_DROP
+        if parsed.extension in self.extensions:
+            return EXTENSION_DROP
+        if self.follow is not None and self.follow.match(parsed.path) is None:
+            return PATH_DROP
+        # The hosts whose rules are not known yet are checked by the crawler before their urls are fetched
+        if self.robots is not None and self.robots.is_allowed(url) is False:
+            return ROBOTS_DROP
+        return None
+
+    def is_allowed(self, url):
+        """check the url against the rules, regardless of whether it was visited"""
+        return bool(self.filter_allowed([url]))
+
+    def filter_allowed(self, items: Iterable, key: Callable = None) -> list:
+        """
+        keep the items whose url passes the rules, regardless of whether it was visited. The drops of the batch are
+        counted once
+        :param items: The urls, or objects that hold a url, like the links of a page
+        :param key: function that returns the url of an item. The item is the url when None
+        :return: list of the allowed items
+        """
+        allowed = []
+        drops = Counter()
+        for item in items:
+            url = item if key is None else key(item)
+            reason = self.get_drop_reason(url)
+            if reason is None:
+                allowed.append(item)
+            else:
+                log.debug(f"drop {reason} {url}")
+                drops[reason] += 1
+        if drops:
+            with self.lock:
+                self._drops.update(drops)
+        return allowed
+
+    def count_drop(self, reason: str) -> None:
+        """count a url that was dropped outside of the filter, like a url disallowed by robots.txt"""
+        with self.lock:
+            self._drops[reason] += 1
+
+    def filter_new(self, urls: List[str]) -> List[str]:
+        """keep the urls that were not visited and mark them as visited. The filter can be shared between threads"""
         found = []
-        for url in urls:
-            if not self.is_valid_scheme(url):
-                log.debug(f"drop ignored scheme {url}")
-                continue
-            if not self.is_valid_domain(url):
-                log.debug(f"drop domain missmatch {url}")
-                continue
-            if not self.is_valid_ext(url):
-                log.debug(f"drop ignored extension {url}")
-                continue
-            if not self.is_valid_path(url):
-                log.debug(f"drop ignored path {url}")
-                continue
-            if not self.is_new(url):
-                log.debug(f"drop duplicate {url}")
-                continue
-            self.seen.add(extract_base_url(url))
-            found.append(url)
+        with self.lock:
+            for url in urls:
+                base_url = extract_base_url(url)
+                if base_url in self.seen:
+                    log.debug(f"drop duplicate {url}")
+                    self._drops[DUPLICATE_DROP] += 1
+                    continue
+                self.seen.add(base_url)
+                found.append(url)
         return found
 
+    def filter(self, urls: List[str]) -> List[str]:
+        """filter list of urls"""
+        return self.filter_new(self.filter_allowed(urls))
+
     def is_valid(self, scraped_res):
         url = scraped_res.data
-        answer = all((
-            self.is_valid_scheme(url),
-            self.is_valid_domain(url),
-            self.is_valid_ext(url),
-            self.is_valid_path(url),
-            self.is_new(url)),
-        )
-        self.seen.add(extract_base_url(url))
+        answer = self.get_drop_reason(url) is None and self.is_new(url)
+        with self.lock:
+            self.seen.add(extract_base_url(url))
         return answer
@@ -0,0 +1,125 @@
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from src.crawler.checkpoint import CrawlCheckpoint
+from src.crawler.filter import UrlFilter
+from src.crawler.scheduler import HostScheduler
+from src.utils.tools import extract_base_url
+
+
+class Frontier:
+    """
+    Queue of the urls that are waiting to be crawled. One frontier is shared by all the crawlers of a build, each
+    running in its own thread, so a url that is reachable from several seeds is fetched only once. The urls are
+    deduplicated in their canonical form by the filter. When a checkpoint is given, the changes of the frontier are
+    recorded in it.
+    The urls are queued per host and the hosts are served in turns. When a scheduler is given, a url is taken only
+    when its host is ready for another request, so urls of a throttled host wait without blocking the other hosts.
+    """
+
+    def __init__(self, url_filter: UrlFilter, checkpoint: CrawlCheckpoint = None, scheduler: HostScheduler = None):
+        self._filter = url_filter
+        self._checkpoint = checkpoint
+        self._scheduler = scheduler
+        self._queues = {}  # host -> deque of (url, depth) tuples
+        self._hosts = deque()  # The hosts that have urls waiting, in the order they are served
+        self._size = 0
+        self._in_progress = 0
+        self._lock = threading.Lock()
+
+    @property
+    def scheduler(self) -> HostScheduler:
+        return self._scheduler
+
+    def add_seeds(self, seeds: List[str]) -> None:
+        """
+        Add the seeds to the frontier. Seeds that were already visited are ignored
+        :param seeds: List of urls to start crawling from
+        :return:
+        """
+        self.push(seeds, depth=0)
+
+    def push(self, urls: List[str], depth: int) -> None:
+        """
+        Add the urls that were not visited yet to the frontier and mark them as visited
+        :param urls: List of urls
+        :param depth: The depth of the urls from their seed
+        :return:
+        """
+        new_urls = self._filter.filter_new(urls)
+        if self._checkpoint and new_urls:
+            self._checkpoint.push(new_urls, [extract_base_url(url) for url in new_urls], depth)
+        self._enqueue((url, depth) for url in new_urls)
+
+    def restore(self, queue: List[Tuple[str, int]], seen: List[str]) -> None:
+        """
+        Restore the frontier from a checkpoint
+        :param queue: The (url, depth) tuples that were waiting to be crawled
+        :param seen: The visited urls in their canonical form
+        :return:
+        """
+        with self._filter.lock:
+            for url in seen:
+                self._filter.seen.add(url)
+        self._enqueue(queue)
+
+    def _enqueue(self, items) -> None:
+        with self._lock:
+            for url, depth in items:
+                host = urlsplit(url).netloc
+                if host not in self._queues:
+                    self._queues[host] = deque()
+                    self._hosts.append(host)
+                self._queues[host].append((url, depth))
+                self._size += 1
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        """
+        Take the next url to crawl from the next host that is ready for a request. Every url that was taken has to be
+        marked with task_done when it is finished, and its request slot has to be released in the scheduler
+        :return: (url, depth) tuple or None if no url can be crawled now
+        """
+        with self._lock:
+            for _ in range(len(self._hosts)):
+                host = self._hosts[0]
+                self._hosts.rotate(-1)
+                if self._scheduler and not self._scheduler.reserve(host):
+                    continue
+
+                queue = self._queues[host]
+                item = queue.popleft()
+                if not queue:
+                    # The host was rotated to the end of the turns
+                    del self._queues[host]
+                    self._hosts.pop()
+                self._size -= 1
+                self._in_progress += 1
+                return item
+
+            return None
+
+    def task_done(self, url: str) -> None:
+        """
+        Mark a url that was taken from the frontier as finished
+        :param url: The url that was crawled
+        :return:
+        """
+        with self._lock:
+            self._in_progress -= 1
+        if self._checkpoint:
+            self._checkpoint.done(url)
+
+    def is_done(self) -> bool:
+        """
+        The crawl is done when no url is waiting and no url is being crawled, since a url that is being crawled can
+        still add more urls to the frontier
+        :return: bool
+        """
+        with self._lock:
+            return not self._size and self._in_progress == 0
+
+    def __len__(self):
+        with self._lock:
+            return self._size
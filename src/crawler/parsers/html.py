@@ -0,0 +1,82 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+import logging as log
+
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Tags that are not visible to the user and should not be searched for text
+INVISIBLE_TAGS = ['script', 'style', 'noscript', 'template']
+
+
+@dataclass
+class ParsedPage:
+    """
+    The result of parsing a single html document. The document is parsed once and all the parsers and callbacks
+    work on the extracted links and visible text.
+    """
+    url: str
+    links: List[str] = field(default_factory=list)  # The href attribute of every <a> tag in the document
+    text: str = ""  # The visible text of the document
+    emails: Optional[List[str]] = None  # The emails found in the text, when they were already searched for
+
+
+def _extract_with_selectolax(content: bytes):
+    tree = LexborHTMLParser(content)
+    links = [node.attributes.get('href') for node in tree.css('a')]
+    tree.strip_tags(INVISIBLE_TAGS)
+    text = tree.root.text(separator=' ') if tree.root is not None else ""
+    return links, text
+
+
+def _extract_with_lxml(content: bytes):
+    document = lxml.html.fromstring(content)
+    links = document.xpath('//a/@href')
+    for element in document.xpath('|'.join(f'//{tag}' for tag in INVISIBLE_TAGS)):
+        element.drop_tree()
+    return links, " ".join(document.itertext())
+
+
+def _extract_with_bs4(content: bytes):
+    soup = BeautifulSoup(content, 'html.parser')
+    links = [link.get('href') for link in soup.find_all('a')]
+    for element in soup(INVISIBLE_TAGS):
+        element.decompose()
+    return links, soup.get_text(separator=' ')
+
+
+if LexborHTMLParser is not None:
+    HTML_BACKEND, _extract = "selectolax", _extract_with_selectolax
+elif lxml is not None:
+    HTML_BACKEND, _extract = "lxml", _extract_with_lxml
+else:
+    HTML_BACKEND, _extract = "html.parser", _extract_with_bs4
+
+
+def extract_page(url: str, content: bytes) -> ParsedPage:
+    """
+    Parse the html document once and extract the links and the visible text from it. The fastest installed parser
+    is used: selectolax, lxml and the built-in html.parser, in this order.
+    :param url: string. The url of the document
+    :param content: bytes. The raw html document
+    :return: ParsedPage
+    """
+    if not content or not content.strip():
+        return ParsedPage(url=url)
+
+    try:
+        links, text = _extract(content)
+    except Exception as e:
+        log.warning(f"Could not parse {url} with {HTML_BACKEND}: {e}")
+        return ParsedPage(url=url)
+
+    return ParsedPage(url=url, links=[link for link in links if link is not None], text=text)
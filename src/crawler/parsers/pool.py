@@ -0,0 +1,50 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import logging as log
+
+from src.crawler.parsers.html import ParsedPage, extract_page
+from src.crawler.parsers.url import URLsParser
+from src.data_structure.graph.callbacks.email import EmailParser
+
+
+def parse_page(url: str, content: bytes) -> ParsedPage:
+    """
+    Parse a raw html document inside a worker process. Only the links that can be followed and the emails found in
+    the text are sent back, so the result that crosses the process boundary stays small.
+    :param url: string. The url of the document
+    :param content: bytes. The raw html document
+    :return: ParsedPage without the text of the document
+    """
+    page = extract_page(url, content)
+    return ParsedPage(url=url,
+                      links=[href for href in page.links if URLsParser.is_followable(href)],
+                      emails=EmailParser.find_emails(page.text))
+
+
+class ParserPool:
+    """
+    Pool of worker processes that parse the html documents. Parsing is the main CPU cost of a crawl and running it in
+    separate processes lets it scale over all the cores instead of being capped by the GIL.
+    """
+
+    def __init__(self, workers: int):
+        # Spawn the workers instead of forking so they don't inherit the locks of the server threads
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        log.info(f"Parser pool started with {workers} workers")
+
+    async def parse(self, url: str, content: bytes) -> ParsedPage:
+        """
+        Parse the document in one of the workers without blocking the event loop
+        :param url: string. The url of the document
+        :param content: bytes. The raw html document
+        :return: ParsedPage
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, parse_page, url, content)
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers once the documents they are parsing are done
+        :return:
+        """
+        self._executor.shutdown(wait=True)
@@ -2,32 +2,35 @@ from typing import List
 
 from src.utils.tools import extract_domain, extract_base_url, is_valid_url, clean_url
 from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.crawler.parsers.html import ParsedPage
 import src.utils.constants as consts
-from bs4 import BeautifulSoup
-from requests import Response
 
 
 class URLsParser:
 
-    def parse(self, response: Response) -> List[CallbackResult]:
+    def parse(self, page: ParsedPage) -> List[CallbackResult]:
         """
-        Scrape the response and look for links in the html to other urls
-        :param response: request.Response object. Response from the url
+        Look for links in the parsed page to other urls
+        :param page: ParsedPage object. The links and text extracted from the url
         :return: list of links to other urls (including duplicates)
         """
-        soup = BeautifulSoup(response.content, 'html.parser')
         result = []
-        for link in soup.find_all('a'):
-            href = link.get('href')  # Get the href attribute of the link which points to the url
-            if href is not None and href.startswith('http') and is_valid_url(href):
-                clean_link = clean_url(href)
-                url = str(response.url)
-                result.append(
-                    CallbackResult(extract_domain(url), extract_base_url(url),
-                                   clean_link, self.get_id())
-                )
+        # The domain and base url of the page are the same for all its links
+        domain, base_url = extract_domain(page.url), extract_base_url(page.url)
+        for href in page.links:  # The href attribute of each link which points to the url
+            if self.is_followable(href):
+                result.append(CallbackResult(domain, base_url, clean_url(href), self.get_id()))
 
         return result
 
+    @staticmethod
+    def is_followable(href: str) -> bool:
+        """
+        Check if the href is an absolute link to a web page
+        :param href: string. The href attribute of the link
+        :return: bool. True if the link should be followed
+        """
+        return href.startswith('http') and is_valid_url(href)
+
     def get_id(self) -> str:
         return consts.URL_TYPE_TOKEN
@@ -0,0 +1,119 @@
+import random
+import threading
+from collections import Counter
+from typing import Optional
+import logging as log
+
+import httpx
+
+import src.utils.constants as consts
+from src.utils.config import Config
+
+# Only requests that can be sent twice without side effects are retried
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+# Responses that may succeed when the same request is sent again later
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Errors of the connection, not of the request. Invalid urls, unsupported protocols and redirect loops are permanent
+RETRYABLE_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+# Counters of the retry policy
+RETRIES_COUNTER = "retries"
+RECOVERED_COUNTER = "recovered"
+RETRYABLE_FAILURES_COUNTER = "retryable_failures"
+PERMANENT_FAILURES_COUNTER = "permanent_failures"
+GAVE_UP_COUNTER = "gave_up"
+
+
+class RetryPolicy:
+    """
+    Decide whether a failed request is sent again and how long to wait before that. Only idempotent requests that
+    failed with a transient error (timeout, connection error, 5xx or 429) are retried, up to `max_retries` times with a
+    capped exponential backoff and full jitter, so the retries of many workers don't hit a recovering host together.
+    Every retry takes one unit of the budget of its host and one of the whole crawl, so a host that is down can't keep
+    the workers busy with retries. The policy can be shared between the crawlers of a build.
+    """
+
+    def __init__(self, config: Config):
+        self._max_retries = config.get(consts.CRAWLER_SECTION, consts.MAX_RETIRES_CONFIG_TOKEN,
+                                       default_value=3, return_as_string=False)
+        self._backoff = config.get(consts.CRAWLER_SECTION, consts.RETRY_BACKOFF_CONFIG_TOKEN,
+                                   default_value=0.5, return_as_string=False)
+        self._max_backoff = config.get(consts.CRAWLER_SECTION, consts.RETRY_MAX_BACKOFF_CONFIG_TOKEN,
+                                       default_value=30, return_as_string=False)
+        self._host_budget = config.get(consts.CRAWLER_SECTION, consts.HOST_RETRY_BUDGET_CONFIG_TOKEN,
+                                       default_value=50, return_as_string=False)
+        self._crawl_budget = config.get(consts.CRAWLER_SECTION, consts.CRAWL_RETRY_BUDGET_CONFIG_TOKEN,
+                                        default_value=500, return_as_string=False)
+        self._host_retries = Counter()
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_retryable(method: str, status_code: Optional[int] = None, error: Optional[Exception] = None) -> bool:
+        """
+        Check if a failed request may succeed when it is sent again
+        :param method: string. The http method of the request
+        :param status_code: int. The status code of the response, None if no response arrived
+        :param error: Exception. The error raised while sending the request, if any
+        :return: bool
+        """
+        if method.upper() not in IDEMPOTENT_METHODS:
+            return False
+        if error is not None:
+            return isinstance(error, RETRYABLE_ERRORS)
+        return status_code in RETRYABLE_STATUS_CODES
+
+    def get_backoff(self, attempt: int) -> float:
+        """
+        Full jitter backoff: a random time between 0 and the exponential backoff of the attempt
+        :param attempt: int. The number of retries that were already sent for the request
+        :return: float. The number of seconds to wait before the next retry
+        """
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+
+    def get_delay(self, attempt: int, retry_after: float = 0) -> Optional[float]:
+        """
+        The time to wait before the next retry: the backoff of the attempt, or the Retry-After of the host when it is
+        longer. The workers don't wait longer than `retry_max_backoff` inside a request
+        :param attempt: int. The number of retries that were already sent for the request
+        :param retry_after: float. The number of seconds the host asked to wait
+        :return: float. The number of seconds to wait. None if the host asked to wait longer than `retry_max_backoff`,
+         the request is not retried then
+        """
+        if retry_after > self._max_backoff:
+            return None
+        return max(self.get_backoff(attempt), retry_after)
+
+    def acquire(self, host: str, attempt: int) -> bool:
+        """
+        Take one retry out of the budgets of the host and of the crawl
+        :param host: string. The host of the url
+        :param attempt: int. The number of retries that were already sent for the request
+        :return: bool. True if the request can be retried
+        """
+        with self._lock:
+            if attempt >= self._max_retries:
+                return False
+            if self._host_retries[host] >= self._host_budget or self._counters[RETRIES_COUNTER] >= self._crawl_budget:
+                log.warning(f"Retry budget of {host} is exhausted")
+                return False
+
+            self._host_retries[host] += 1
+            self._counters[RETRIES_COUNTER] += 1
+            return True
+
+    def record(self, counter: str) -> None:
+        """
+        Count the outcome of a request
+        :param counter: string. One of the counters of the retry policy
+        :return:
+        """
+        with self._lock:
+            self._counters[counter] += 1
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
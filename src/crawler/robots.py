@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+import zlib
+from typing import List, Optional, Tuple
+from urllib.robotparser import RobotFileParser
+import logging as log
+
+import src.utils.constants as consts
+from src.utils.config import Config
+from src.utils.tools import parse_url
+
+ROBOTS_PATH = "/robots.txt"
+SITEMAP_PATH = "/sitemap.xml"
+MAX_ROBOTS_REDIRECTS = 5  # The number of redirects followed to fetch a robots.txt file
+# The responses whose empty rule set is kept for the next builds: the host has no robots.txt file
+ROBOTS_MISSING_STATUS_CODES = (404, 410)
+MAX_SITEMAP_SIZE = 50 * 2 ** 20  # The size limit of an uncompressed sitemap of the sitemaps protocol
+
+
+def parse_robots(content: str) -> RobotFileParser:
+    """
+    :param content: string. The text of a robots.txt file, empty when the host has none
+    :return: RobotFileParser of the rules
+    """
+    rules = RobotFileParser()
+    rules.parse(content.splitlines())
+    return rules
+
+
+def parse_sitemap(content: bytes) -> Tuple[List[str], List[str]]:
+    """
+    Parse a sitemap or a sitemap index. Gzipped sitemaps are decompressed up to MAX_SITEMAP_SIZE bytes, a larger one
+    is dropped
+    :param content: bytes. The sitemap file
+    :return: The page urls of a sitemap and the sitemap urls of a sitemap index
+    """
+    if content[:2] == b"\x1f\x8b":
+        try:
+            # A small file from any site can expand to gigabytes, only one byte past the limit is decompressed
+            content = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(content, MAX_SITEMAP_SIZE + 1)
+        except zlib.error as e:
+            log.warning(f"Could not decompress sitemap: {e}")
+            return [], []
+        if len(content) > MAX_SITEMAP_SIZE:
+            log.warning(f"Dropped a sitemap larger than {MAX_SITEMAP_SIZE} bytes")
+            return [], []
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError as e:
+        log.warning(f"Could not parse sitemap: {e}")
+        return [], []
+
+    # The tags are namespaced, like {http://www.sitemaps.org/schemas/sitemap/0.9}loc
+    locations = [element.text.strip() for element in root.iter() if element.tag.endswith("loc") and element.text]
+    if root.tag.endswith("sitemapindex"):
+        return [], locations
+    return locations, []
+
+
+class RobotsCache:
+    """
+    The robots.txt rules of each host. The file of a host is fetched once and kept in memory and in an sqlite file for
+    `robots_ttl` seconds, so the crawls of the next builds do not fetch it again. A host without a robots.txt file, or
+    whose file could not be fetched, allows everything. The cache can be shared between threads.
+    """
+
+    def __init__(self, config: Config, path: str = consts.ROBOTS_CACHE_FILE_PATH):
+        self._ttl = config.get(consts.CRAWLER_SECTION, consts.ROBOTS_TTL_CONFIG_TOKEN,
+                               default_value=86400, return_as_string=False)
+        self._rules = {}  # host -> (RobotFileParser, expiry time)
+        self._pending = set()  # The hosts whose robots.txt file is being fetched
+        self._sitemap_hosts = set()  # The hosts whose sitemaps were read by the crawl
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS robots "
+                                     "(host TEXT PRIMARY KEY, content TEXT, expires REAL)")
+            self._connection.execute("DELETE FROM robots WHERE expires <= ?", (time.time(),))
+        # The files that did not expire are parsed once, so the checks never wait for the disk
+        for host, content, expires in self._connection.execute("SELECT host, content, expires FROM robots"):
+            self._rules[host] = (parse_robots(content), expires)
+        log.info(f"Loaded the robots.txt rules of {len(self._rules)} hosts from {path}")
+
+    def get(self, host: str) -> Optional[RobotFileParser]:
+        """
+        :param host: string. The host, with its scheme, like https://www.example.com
+        :return: The rules of the host, None if they are not cached or expired
+        """
+        with self._lock:
+            if host not in self._rules:
+                return None
+            rules, expires = self._rules[host]
+            if expires <= time.time():
+                del self._rules[host]
+                return None
+            return rules
+
+    def claim(self, host: str) -> bool:
+        """
+        Take the fetch of the robots.txt file of a host, so it is fetched once when several crawlers need it
+        :param host: string. The host, with its scheme
+        :return: bool. False if another crawler is fetching it already
+        """
+        with self._lock:
+            if host in self._pending:
+                return False
+            self._pending.add(host)
+            return True
+
+    def claim_sitemaps(self, host: str) -> bool:
+        """
+        Take the reading of the sitemaps of a seed host, so they are read once by the crawl that uses the cache, whether
+        the rules of the host were fetched or cached
+        :param host: string. The host, with its scheme
+        :return: bool. False if the sitemaps of the host were read already
+        """
+        with self._lock:
+            if host in self._sitemap_hosts:
+                return False
+            self._sitemap_hosts.add(host)
+            return True
+
+    def put(self, host: str, content: str, persist: bool = True) -> RobotFileParser:
+        """
+        Cache the robots.txt file of a host and end its claim
+        :param host: string. The host, with its scheme
+        :param content: string. The text of the file, empty when the host has none
+        :param persist: bool. Write the file to the disk as well. False when the file could not be fetched, so the
+         next build tries again
+        :return: The rules of the host
+        """
+        rules = parse_robots(content)
+        expires = time.time() + self._ttl
+        with self._lock:
+            self._rules[host] = (rules, expires)
+            self._pending.discard(host)
+            if persist:
+                with self._connection:
+                    self._connection.execute("INSERT OR REPLACE INTO robots VALUES (?, ?, ?)",
+                                             (host, content, expires))
+        return rules
+
+    def is_allowed(self, url: str, user_agent: str = "*") -> Optional[bool]:
+        """
+        Check the url against the cached rules of its host
+        :param url: string. The url to check
+        :param user_agent: string. The user agent of the crawler
+        :return: bool, or None if the rules of the host are not cached yet
+        """
+        parsed = parse_url(url)
+        rules = self.get(f"{parsed.scheme}://{parsed.netloc}")
+        if rules is None:
+            return None
+        return rules.can_fetch(user_agent, url)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,171 @@
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import logging as log
+
+import src.utils.constants as consts
+from src.utils.config import Config
+
+# Responses that mean the host is overloaded or is throttling the crawler
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """
+    Parse the Retry-After header. It is either a number of seconds or an http date
+    :param value: string. The value of the header
+    :return: float. The number of seconds to wait, 0 if the header is missing or not valid
+    """
+    if not value:
+        return 0
+    try:
+        seconds = float(value)
+        # inf and nan are not a number of seconds
+        return max(0.0, seconds) if math.isfinite(seconds) else 0
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0
+
+
+class HostState:
+    """
+    The politeness state of a single host: a token bucket for the request rate and an AIMD concurrency limit
+    """
+
+    def __init__(self, rate: float, burst: float, limit: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.limit = limit
+        self.in_flight = 0
+        self.paused_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+
+class HostScheduler:
+    """
+    Decide when a request can be sent to a host. Each host has a token bucket that limits its request rate and a
+    concurrency limit that grows by one request per window of successful requests and is halved when the host answers
+    slowly or with 429/503 (AIMD). A Retry-After header pauses the host for the given time. The number of requests
+    sent at the same time to all the hosts is capped as well.
+    A throttled host only slows down its own requests. The scheduler can be shared between threads.
+    """
+
+    def __init__(self, config: Config):
+        self._rate = config.get(consts.CRAWLER_SECTION, consts.HOST_RATE_CONFIG_TOKEN,
+                                default_value=10, return_as_string=False)
+        self._burst = config.get(consts.CRAWLER_SECTION, consts.HOST_BURST_CONFIG_TOKEN,
+                                 default_value=5, return_as_string=False)
+        self._target_latency = config.get(consts.CRAWLER_SECTION, consts.TARGET_LATENCY_CONFIG_TOKEN,
+                                          default_value=2.0, return_as_string=False)
+        self._max_host_limit = config.get(consts.CRAWLER_SECTION, consts.MAX_HOST_CONNECTIONS_CONFIG_TOKEN,
+                                          default_value=10, return_as_string=False)
+        self._global_limit = config.get(consts.CRAWLER_SECTION, consts.MAX_CONNECTIONS_CONFIG_TOKEN,
+                                        default_value=100, return_as_string=False)
+        self._max_retry_after = config.get(consts.CRAWLER_SECTION, consts.MAX_RETRY_AFTER_CONFIG_TOKEN,
+                                           default_value=120, return_as_string=False)
+        self._hosts = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _get_host(self, host: str) -> HostState:
+        if host not in self._hosts:
+            self._hosts[host] = HostState(rate=self._rate, burst=self._burst, limit=min(2, self._max_host_limit))
+        return self._hosts[host]
+
+    def reserve(self, host: str) -> bool:
+        """
+        Try to take a request slot of the host without waiting. A reserved slot has to be released when the response
+        arrives
+        :param host: string. The host of the url
+        :return: bool. True if a request can be sent to the host now
+        """
+        with self._lock:
+            state = self._get_host(host)
+            now = time.monotonic()
+            if self._in_flight >= self._global_limit or now < state.paused_until or state.in_flight >= int(state.limit):
+                return False
+
+            if state.rate > 0:
+                # A rate of 0 means the host is only limited by its concurrency
+                state.refill(now)
+                if state.tokens < 1:
+                    return False
+                state.tokens -= 1
+
+            state.in_flight += 1
+            self._in_flight += 1
+            return True
+
+    def release(self, host: str, status_code: int, latency: float, retry_after: float = 0) -> None:
+        """
+        Release the request slot of the host and adapt its limits to the response
+        :param host: string. The host of the url
+        :param status_code: int. The status code of the response
+        :param latency: float. The number of seconds it took to get the response
+        :param retry_after: float. The number of seconds the host asked to wait before sending more requests, capped by
+         max_retry_after
+        :return:
+        """
+        with self._lock:
+            state = self._get_host(host)
+            state.in_flight -= 1
+            self._in_flight -= 1
+
+            if status_code in OVERLOAD_STATUS_CODES or latency > self._target_latency:
+                # Multiplicative decrease
+                state.limit = max(1.0, state.limit / 2)
+                log.debug(f"Host {host} answered {status_code} in {latency:.2f}s. Limit is {state.limit:.1f}")
+            else:
+                # Additive increase of one request per window of successful requests
+                state.limit = min(self._max_host_limit, state.limit + 1 / state.limit)
+
+            if retry_after:
+                # A host can not pause itself for longer than max_retry_after
+                retry_after = min(retry_after, self._max_retry_after)
+                state.paused_until = max(state.paused_until, time.monotonic() + retry_after)
+                log.warning(f"Host {host} asked to wait {retry_after:.1f} seconds")
+
+    def cancel(self, host: str) -> None:
+        """
+        Release a request slot of the host that was reserved but not used, without adapting the limits of the host
+        :param host: string. The host of the url
+        :return:
+        """
+        with self._lock:
+            state = self._get_host(host)
+            state.in_flight -= 1
+            self._in_flight -= 1
+            if state.rate > 0:
+                state.tokens = min(state.burst, state.tokens + 1)
+
+    def set_crawl_delay(self, host: str, delay: float) -> None:
+        """
+        Send at most one request every `delay` seconds to the host, as its robots.txt file asks
+        :param host: string. The host of the url
+        :param delay: float. The Crawl-delay of the host in seconds
+        :return:
+        """
+        if not delay or delay <= 0:
+            return
+        with self._lock:
+            state = self._get_host(host)
+            rate = 1 / delay
+            if state.rate <= 0 or rate < state.rate:
+                log.info(f"Host {host} asked for a crawl delay of {delay} seconds")
+                state.rate = rate
+                state.burst = 1
+                state.tokens = min(state.tokens, 1)
+
+    def get_host_limit(self, host: str) -> float:
+        with self._lock:
+            return self._get_host(host).limit
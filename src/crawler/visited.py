@@ -0,0 +1,174 @@
+import hashlib
+import math
+import sys
+from abc import ABC, abstractmethod
+from array import array
+import logging as log
+
+import src.utils.constants as consts
+
+
+def fingerprint(url: str) -> int:
+    """
+    64 bit fingerprint of the url. 0 is never returned so it can mark an empty slot
+    :param url: string. The url in its canonical form
+    :return: int
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), 'little') or 1
+
+
+class VisitedSet(ABC):
+    """
+    Abstract class for the set of visited urls. The urls are given in their canonical form. Crawls of millions of urls
+    can't keep all the urls as strings, so the backends trade exactness for memory in different ways.
+    """
+
+    @abstractmethod
+    def add(self, url: str) -> None:
+        pass
+
+    @abstractmethod
+    def __contains__(self, url: str) -> bool:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def memory_usage(self) -> int:
+        """
+        :return: int. The number of bytes used to store the visited urls
+        """
+        pass
+
+
+class ExactVisitedSet(VisitedSet):
+    """Keep the urls as strings in a set. Exact but the most memory hungry backend"""
+
+    def __init__(self):
+        self._urls = set()
+
+    def add(self, url: str) -> None:
+        self._urls.add(url)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._urls
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def __iter__(self):
+        return iter(self._urls)
+
+    def memory_usage(self) -> int:
+        return sys.getsizeof(self._urls) + sum(sys.getsizeof(url) for url in self._urls)
+
+
+class FingerprintVisitedSet(VisitedSet):
+    """
+    Keep a 64 bit fingerprint of each url in an open addressing hash table backed by an array. Uses 8 bytes per slot
+    and the table is kept at most half full. Two urls share a fingerprint with a probability of about n^2 / 2^65.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        size = 1 << max(3, math.ceil(math.log2(capacity * 2)))
+        self._table = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._size = 0
+
+    def _slot(self, key: int) -> int:
+        # Linear probing. The slot of the key or the empty slot where it should be inserted
+        table, mask = self._table, self._mask
+        index = key & mask
+        while table[index] and table[index] != key:
+            index = (index + 1) & mask
+        return index
+
+    def add(self, url: str) -> None:
+        key = fingerprint(url)
+        index = self._slot(key)
+        if not self._table[index]:
+            self._table[index] = key
+            self._size += 1
+            if self._size * 2 > len(self._table):
+                self._grow()
+
+    def __contains__(self, url: str) -> bool:
+        return bool(self._table[self._slot(fingerprint(url))])
+
+    def __len__(self) -> int:
+        return self._size
+
+    def memory_usage(self) -> int:
+        return self._table.itemsize * len(self._table)
+
+    def _grow(self) -> None:
+        old_table = self._table
+        self._table = array('Q', bytes(16 * len(old_table)))
+        self._mask = len(self._table) - 1
+        for key in old_table:
+            if key:
+                self._table[self._slot(key)] = key
+
+
+class BloomVisitedSet(VisitedSet):
+    """
+    Bloom filter of the urls. Uses a fixed amount of memory for the expected number of urls, at the cost of reporting
+    a new url as visited with the configured false positive rate. New urls are never crawled twice, but a small
+    fraction of them is never crawled at all.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self._bits_count = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes_count = max(1, round(self._bits_count / capacity * math.log(2)))
+        self._bits = bytearray((self._bits_count + 7) // 8)
+        self._size = 0
+
+    def _positions(self, url: str):
+        # Double hashing: k positions out of two 64 bit hashes
+        digest = hashlib.blake2b(url.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self._bits_count for i in range(self._hashes_count)]
+
+    def add(self, url: str) -> None:
+        added = False
+        for position in self._positions(url):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self._bits[byte] & bit:
+                self._bits[byte] |= bit
+                added = True
+        if added:
+            self._size += 1
+
+    def __contains__(self, url: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(url))
+
+    def __len__(self) -> int:
+        # The number of urls that were new to the filter when they were added
+        return self._size
+
+    def memory_usage(self) -> int:
+        return len(self._bits)
+
+
+def create_visited_set(config: dict) -> VisitedSet:
+    """
+    Create the visited set backend from the filters configuration
+    :param config: The filters section of the configuration
+    :return: VisitedSet
+    """
+    config = config or {}
+    backend = config.get(consts.VISITED_BACKEND_FILTER) or consts.EXACT_VISITED_SET_TOKEN
+    capacity = int(config.get(consts.VISITED_CAPACITY_FILTER) or 1_000_000)
+    error_rate = float(config.get(consts.VISITED_ERROR_RATE_FILTER) or 0.001)
+    log.info(f"Visited urls are kept in a {backend} set")
+
+    if backend == consts.FINGERPRINT_VISITED_SET_TOKEN:
+        return FingerprintVisitedSet(capacity=capacity)
+    if backend == consts.BLOOM_VISITED_SET_TOKEN:
+        return BloomVisitedSet(capacity=capacity, error_rate=error_rate)
+    if backend == consts.EXACT_VISITED_SET_TOKEN:
+        return ExactVisitedSet()
+
+    raise ValueError(f"Unknown visited set backend: {backend}")
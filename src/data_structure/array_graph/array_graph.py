@@ -0,0 +1,426 @@
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+import src.utils.constants as consts
+from src.data_structure.graph.callbacks.callback import CallbackResult, NormalizedResult
+from src.data_structure.graph.ranking import GraphSnapshot, pagerank
+from src.data_structure.graph.utils import NodeDataNormalizer, EmailCorpus, GraphTables, LruCache, \
+    email_name_normalizer, email_domain_extractor
+from src.utils.config import Config
+
+NODE_ID_BITS = 32  # An edge is kept as one int64 key made of the ids of its two nodes
+NODE_ID_MASK = (1 << NODE_ID_BITS) - 1
+
+
+def edge_keys(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    The keys of undirected edges, the same for (u, v) and (v, u)
+    :param u: array of node ids
+    :param v: array of node ids
+    :return: array of int64 keys
+    """
+    return (np.minimum(u, v) << NODE_ID_BITS) | np.maximum(u, v)
+
+
+class Codes:
+    """Intern strings to small integer codes"""
+
+    def __init__(self):
+        self.names = []
+        self._codes = {}
+
+    def get_code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def find(self, name: str) -> int:
+        """:return: int. The code of the name, -1 if it was never interned"""
+        return self._codes.get(name, -1)
+
+
+class ArrayGraph:
+    """
+    Web graph that keeps its data in arrays instead of the dicts of networkx. Every node string is interned once to an
+    integer id, its type and domain are kept as small integer codes in arrays, and an edge is a single int64 key of
+    its two node ids. New edges are appended to a buffer and compacted into a sorted array of unique keys when the
+    graph is ranked, and the ranking runs on a CSR matrix built from that array.
+    It has the same add / merge_graph / get_top_n_for_each_domain / get_ranking API as WebGraph and uses a fraction of
+    its memory, but it can only be changed through that API.
+    """
+
+    def __init__(self, callbacks=None, config=None):
+        config = config or Config()
+        self._alpha = config.get(consts.GRAPH_SECTION, consts.ALPHA_CONFIG_TOKEN, return_as_string=False)
+        self._ranking_tolerance = config.get(consts.GRAPH_SECTION, consts.RANKING_TOLERANCE_CONFIG_TOKEN,
+                                             default_value=1.0e-6, return_as_string=False)
+        self._callbacks = callbacks or []
+        self._journal = None
+        self._node_ids = {}
+        self._node_names = []
+        self._types, self._domains = Codes(), Codes()
+        self._node_types, self._node_domains = array('b'), array('i')
+        self._new_edges = array('q')  # Edges that were added since the last compaction, may hold duplicates
+        self._edges = np.zeros(0, dtype=np.int64)  # Sorted unique edge keys
+        # The email names and domains of each url, updated as email edges are compacted into the graph
+        self._corpus = EmailCorpus()
+        self._version = 0
+        self._ranking_version = None
+        self._snapshot, self._ranks, self._ranking = None, None, None
+        self._domain_order = None  # The url nodes of the ranking sorted by domain and rank, built on first use
+        self._top_n, self._top_n_version = LruCache(), None
+
+    @property
+    def version(self):
+        """
+        The number of changes made to the graph with add and merge_graph
+        """
+        return self._version
+
+    @property
+    def journal(self):
+        """
+        Object with append and extend methods that get every CallbackResult that is added to the graph, like a crawl
+        checkpoint. None when the additions are not recorded
+        """
+        return self._journal
+
+    @journal.setter
+    def journal(self, value):
+        self._journal = value
+
+    @property
+    def cache(self) -> Dict[str, set]:
+        """
+        The nodes of each type
+        """
+        cache = {}
+        for node, type_code in zip(self._node_names, self._node_types):
+            cache.setdefault(self._types.names[type_code], set()).add(node)
+        return cache
+
+    @property
+    def nodes(self) -> List[str]:
+        return self._node_names
+
+    @property
+    def edges(self) -> List[tuple]:
+        self._compact()
+        return [(self._node_names[key >> NODE_ID_BITS], self._node_names[key & NODE_ID_MASK])
+                for key in self._edges.tolist()]
+
+    def __len__(self) -> int:
+        return len(self._node_names)
+
+    def number_of_nodes(self) -> int:
+        return len(self._node_names)
+
+    def number_of_edges(self) -> int:
+        self._compact()
+        return len(self._edges)
+
+    @NodeDataNormalizer()
+    def add(self, new_data: CallbackResult):
+        """
+        Add the scraped data to the graph. The graph will know how to handle the data.
+        :param new_data: CallbackResult. The scraped data to add
+        :return:
+        """
+        self._add_record(new_data)
+        self._version += 1
+        if self._journal is not None:
+            self._journal.append(new_data)
+
+    def add_many(self, results: Iterable[CallbackResult]):
+        """
+        Add a batch of scraped data to the graph, like all the links of a page, as one change of the graph
+        :param results: iterable of CallbackResult
+        :return:
+        """
+        records = list(NodeDataNormalizer.normalize_many(results))
+        for record in records:
+            self._add_record(record)
+        if records:
+            self._version += 1
+            if self._journal is not None:
+                self._journal.extend(records)
+
+    def _add_record(self, record: NormalizedResult):
+        v = self._set_node(record.url, record.domain, consts.URL_TYPE_TOKEN)
+        u = self._set_node(record.data, record.domain, record.type)
+        self._new_edges.append((min(u, v) << NODE_ID_BITS) | max(u, v))
+
+    def merge_graph(self, graph):
+        """
+        Merge the graph with the current graph
+        :param graph: ArrayGraph. The graph to merge with
+        :return:
+        """
+        graph._compact()
+        node_ids = np.fromiter((self._set_node(node, graph._domains.names[domain_code], graph._types.names[type_code])
+                                for node, domain_code, type_code in
+                                zip(graph._node_names, graph._node_domains, graph._node_types)),
+                               dtype=np.int64, count=len(graph))
+        keys = edge_keys(node_ids[graph._edges >> NODE_ID_BITS], node_ids[graph._edges & NODE_ID_MASK])
+        self._new_edges.frombytes(keys.tobytes())
+        self._version += 1
+
+    def to_tables(self) -> GraphTables:
+        """
+        :return: GraphTables of the nodes, their attributes, the edges and the cache of the graph
+        """
+        self._compact()
+        node_types = np.frombuffer(self._node_types, dtype=np.int8).copy()
+        edges = np.column_stack((self._edges >> NODE_ID_BITS, self._edges & NODE_ID_MASK)).astype(np.uint32)
+        cache = {name: np.flatnonzero(node_types == code).astype(np.uint32) for code, name in
+                 enumerate(self._types.names)}
+        return GraphTables(list(self._node_names), list(self._domains.names), list(self._types.names),
+                           np.frombuffer(self._node_domains, dtype=np.int32).copy(), node_types, edges, cache)
+
+    @classmethod
+    def from_tables(cls, tables: GraphTables, callbacks=None, config=None):
+        """
+        Create the graph of the tables. The cache of the tables is not needed, it follows from the types of the nodes
+        :param tables: GraphTables
+        :param callbacks: The callbacks of the graph
+        :param config: Config
+        :return: ArrayGraph
+        """
+        graph = cls(callbacks=callbacks, config=config)
+        graph._node_names = list(tables.nodes)
+        graph._node_ids = {node: i for i, node in enumerate(graph._node_names)}
+        graph._node_domains.frombytes(cls._intern_codes(graph._domains, tables.domains, tables.node_domains, np.int32))
+        graph._node_types.frombytes(cls._intern_codes(graph._types, tables.types, tables.node_types, np.int8))
+        edges = tables.edges.astype(np.int64)
+        graph._new_edges.frombytes(edge_keys(edges[:, 0], edges[:, 1]).tobytes())
+        graph._version += 1
+        return graph
+
+    def get_ranking(self, top_k: int = None) -> dict:
+        """
+        Generate the ranking scores for each node in the graph. The score is the pagerank score of the weighted graph.
+        The ranking is cached until the graph changes, and then the power iteration starts from the previous ranking
+        :param top_k: int. Return only the scores of the top k url nodes of each domain
+        :return: dict: {node: rank}
+        """
+        self._rank()
+        if top_k is None:
+            if self._ranking is None:
+                self._ranking = self._snapshot.to_dict(self._ranks)
+            return self._ranking
+
+        top_nodes = self._snapshot.top_k_per_domain(self._ranks, top_k, order=self._get_domain_order())
+        return {node: self._ranks[self._node_ids[node]].item() for nodes in top_nodes.values() for node in nodes}
+
+    def get_ranked_snapshot(self) -> Tuple[GraphSnapshot, np.ndarray]:
+        """
+        :return: The CSR snapshot of the weighted graph and the rank of each of its node ids
+        """
+        self._rank()
+        return self._snapshot, self._ranks
+
+    def get_top_n_for_each_domain(self, n=5, domains: List[str] = None):
+        """
+        Get the top n most important nodes in each domain. The results of the last queries are cached until the graph
+        changes
+        :param n: int. The number of nodes to return
+        :param domains: List of domains to return. All the domains if None
+        :return: list of dict: {domain: List of nodes and their rank in the domain}
+        """
+        key = (n, tuple(domains) if domains is not None else None)
+        if self._top_n_version == self._version:
+            top_n = self._top_n.lookup(key)
+            if top_n is not None:
+                return top_n
+
+        self._rank()
+        if domains is None:
+            top_n = [{domain: nodes} for domain, nodes in
+                     self._snapshot.top_k_per_domain(self._ranks, n, order=self._get_domain_order()).items()]
+        else:
+            top_n = [{domain: self._get_top_nodes(domain, n)} for domain in domains]
+
+        if self._top_n_version != self._version:
+            self._top_n, self._top_n_version = LruCache(), self._version
+        self._top_n.store(key, top_n)
+        return top_n
+
+    def subgraph(self, nodes) -> nx.Graph:
+        """
+        Copy the subgraph of the nodes to networkx, for exports and rendering
+        :param nodes: The nodes to copy
+        :return: nx.Graph with the domain and type of the nodes and the weight of the edges
+        """
+        self._compact()
+        node_ids = np.fromiter((self._node_ids[node] for node in nodes), dtype=np.int64)
+        u, v = self._edges >> NODE_ID_BITS, self._edges & NODE_ID_MASK
+        selected = np.isin(u, node_ids) & np.isin(v, node_ids)
+        weights = self._get_weights()[selected]
+
+        graph = nx.Graph()
+        graph.add_nodes_from((self._node_names[node_id], {'domain': self._domains.names[self._node_domains[node_id]],
+                                                          'type': self._types.names[self._node_types[node_id]]})
+                             for node_id in node_ids.tolist())
+        graph.add_weighted_edges_from(zip((self._node_names[node_id] for node_id in u[selected].tolist()),
+                                          (self._node_names[node_id] for node_id in v[selected].tolist()),
+                                          weights.tolist()))
+        return graph
+
+    def to_networkx(self) -> nx.Graph:
+        return self.subgraph(self._node_names)
+
+    def _set_node(self, node: str, domain: str, node_type: str) -> int:
+        """
+        Intern the node and set its domain and type
+        :return: int. The id of the node
+        """
+        domain_code, type_code = self._domains.get_code(domain), self._types.get_code(node_type)
+        node_id = self._node_ids.get(node)
+        if node_id is None:
+            node_id = self._node_ids[node] = len(self._node_names)
+            self._node_names.append(node)
+            self._node_domains.append(domain_code)
+            self._node_types.append(type_code)
+        else:
+            self._node_domains[node_id] = domain_code
+            self._node_types[node_id] = type_code
+        return node_id
+
+    @staticmethod
+    def _intern_codes(codes: Codes, names: List[str], values: np.ndarray, dtype) -> bytes:
+        """
+        Intern the names of the codes of a table in their order, so the codes of the table stay the same
+        :return: The bytes of the codes. The nodes without the attribute (-1) get the code of None
+        """
+        for name in names:
+            codes.get_code(name)
+        if (values < 0).any():
+            values = np.where(values < 0, codes.get_code(None), values)
+        return values.astype(dtype).tobytes()
+
+    def _compact(self):
+        """
+        Merge the new edges into the sorted array of unique edges and add the new email edges to the corpus
+        :return:
+        """
+        if not len(self._new_edges):
+            return
+
+        keys = np.unique(np.frombuffer(self._new_edges, dtype=np.int64))
+        self._new_edges = array('q')
+        position = np.searchsorted(self._edges, keys)
+        is_new = position == len(self._edges)
+        is_new[~is_new] = self._edges[position[~is_new]] != keys[~is_new]
+        keys = keys[is_new]
+        self._edges = np.insert(self._edges, position[is_new], keys)
+
+        url_code = self._types.find(consts.URL_TYPE_TOKEN)
+        types = np.frombuffer(self._node_types, dtype=np.int8)
+        u, v = keys >> NODE_ID_BITS, keys & NODE_ID_MASK
+        for url_id, email_id in zip(np.where(types[u] == url_code, u, v).tolist(),
+                                    np.where(types[u] == url_code, v, u).tolist()):
+            if types[url_id] == url_code and types[email_id] != url_code:
+                self._corpus.add(url=self._node_names[url_id], email=self._node_names[email_id])
+
+    def _get_weights(self) -> np.ndarray:
+        """
+        The weight of every edge. An edge between an url and an email weighs
+        `TF-IDF(email_name) * alpha + (1-alpha) * Probability(email_domain)`, unless the url is the domain itself, and
+        every other edge weighs 0
+        :return: array of the weight of each edge key
+        """
+        weights = np.zeros(len(self._edges))
+        if not len(self._corpus):
+            return weights
+
+        tfidf_matrix, vocabulary, urls_tf_idf_index = self._corpus.get_tfidf()
+        domain_proba = self._corpus.get_domain_proba()
+        rows = np.full(len(self), -1, dtype=np.int64)
+        for url, row in urls_tf_idf_index.items():
+            url_id = self._node_ids[url]
+            # If the url is the domain itself, skip it. We only want to rank real urls
+            if url != self._domains.names[self._node_domains[url_id]]:
+                rows[url_id] = row
+
+        url_code = self._types.find(consts.URL_TYPE_TOKEN)
+        types = np.frombuffer(self._node_types, dtype=np.int8)
+        u, v = self._edges >> NODE_ID_BITS, self._edges & NODE_ID_MASK
+        url_ids, email_ids = np.where(types[u] == url_code, u, v), np.where(types[u] == url_code, v, u)
+        is_email_edge = (types[url_ids] == url_code) & (types[email_ids] != url_code) & (rows[url_ids] >= 0)
+
+        # Emails whose normalized name or domain is not in the vocabulary are left unweighted
+        emails = np.unique(email_ids[is_email_edge])
+        columns = np.full(len(self), -1, dtype=np.int64)
+        proba_scores = np.zeros(len(self))
+        for email_id in emails.tolist():
+            email = self._node_names[email_id]
+            proba_score = domain_proba.get(email_domain_extractor(email))
+            if proba_score is not None:
+                columns[email_id] = vocabulary.get(email_name_normalizer(email), -1)
+                proba_scores[email_id] = proba_score
+        is_email_edge &= columns[email_ids] >= 0
+
+        edges = np.flatnonzero(is_email_edge)
+        if not len(edges):
+            return weights
+        tfidf_scores = np.asarray(tfidf_matrix[rows[url_ids[edges]], columns[email_ids[edges]]]).ravel()
+        weights[edges] = tfidf_scores * self._alpha + proba_scores[email_ids[edges]] * (1 - self._alpha)
+        return weights
+
+    def _rank(self):
+        """
+        Rank the graph if it has changed since its last ranking
+        :return:
+        """
+        if self._ranking_version == self._version:
+            return
+
+        self._compact()
+        n = len(self)
+        u, v = self._edges >> NODE_ID_BITS, self._edges & NODE_ID_MASK
+        weights = self._get_weights()
+        # The matrix holds every edge in both directions and a self loop once
+        loops = u == v
+        matrix = sparse.csr_matrix((np.concatenate([weights, weights[~loops]]),
+                                    (np.concatenate([u, v[~loops]]), np.concatenate([v, u[~loops]]))), shape=(n, n))
+        types = np.frombuffer(self._node_types, dtype=np.int8)
+        # The snapshot copies the arrays, a growing array can't be resized while numpy looks at its buffer
+        snapshot = GraphSnapshot(list(self._node_names), matrix, np.array(self._node_domains, dtype=np.int32),
+                                 list(self._domains.names), types == self._types.find(consts.URL_TYPE_TOKEN))
+
+        nstart = None
+        if self._ranks is not None:
+            # The node ids never change, new nodes start from the uniform rank
+            nstart = np.concatenate([self._ranks, np.full(n - len(self._ranks), 1 / n)])
+        self._snapshot, self._ranks = snapshot, pagerank(snapshot, tol=self._ranking_tolerance, nstart=nstart)
+        self._ranking, self._domain_order = None, None
+        self._ranking_version = self._version
+
+    def _get_domain_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: The url nodes sorted by domain and rank and the offset of each domain in them, kept until the next
+         ranking
+        """
+        if self._domain_order is None:
+            self._domain_order = self._snapshot.order_by_domain(self._ranks)
+        return self._domain_order
+
+    def _get_top_nodes(self, domain: str, n: int) -> List[str]:
+        """
+        Select the n url nodes of the domain with the highest rank from the nodes sorted by domain and rank
+        :param domain: string. The domain
+        :param n: int. The number of nodes to return
+        :return: list of nodes sorted by descending rank
+        """
+        domain_code = self._domains.find(domain)
+        order, offsets = self._get_domain_order()
+        if not 0 <= domain_code < len(offsets) - 1:
+            return []
+        start = offsets[domain_code]
+        return [self._node_names[node_id] for node_id in order[start:min(start + n, offsets[domain_code + 1])].tolist()]
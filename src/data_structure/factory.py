@@ -0,0 +1,47 @@
+import logging as log
+
+import src.utils.constants as consts
+from src.data_structure.array_graph.array_graph import ArrayGraph
+from src.data_structure.graph.graph import WebGraph
+from src.utils.config import Config
+
+GRAPH_BACKENDS = {
+    consts.NETWORKX_GRAPH_BACKEND_TOKEN: WebGraph,
+    consts.ARRAY_GRAPH_BACKEND_TOKEN: ArrayGraph,
+}
+
+
+def create_graph(config: Config = None, callbacks=None):
+    """
+    Create the data structure that keeps the crawled data, as set by the backend of the graph section
+    :param config: Config
+    :param callbacks: The callbacks of the graph
+    :return: WebGraph or ArrayGraph
+    """
+    config = config or Config()
+    backend = config.get(consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN,
+                         default_value=consts.NETWORKX_GRAPH_BACKEND_TOKEN)
+    if backend not in GRAPH_BACKENDS:
+        raise ValueError(f"Unknown graph backend: {backend}")
+
+    log.debug(f"Creating a {backend} graph")
+    return GRAPH_BACKENDS[backend](callbacks=callbacks, config=config)
+
+
+def combine_graphs(graphs: list, config: Config = None):
+    """
+    Combine the graphs of the crawlers into one graph of the backend of the config
+    :param graphs: list of graphs. None for a crawler that has no graph
+    :param config: Config of the combined graph
+    :return: WebGraph or ArrayGraph: combined graph
+    """
+    combined_graph = create_graph(config=config)
+    for graph in graphs:
+        if graph is None:
+            continue
+        if type(graph) is not type(combined_graph):
+            # A graph of another backend is copied through its tables
+            graph = type(combined_graph).from_tables(graph.to_tables(), config=config)
+        combined_graph.merge_graph(graph)
+
+    return combined_graph
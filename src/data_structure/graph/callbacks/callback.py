@@ -2,13 +2,31 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(frozen=True)
 class CallbackResult:
+    # The slots are written by hand, dataclass(slots=True) needs python 3.10
+    __slots__ = ("domain", "url", "data", "type")
     domain: str
     url: str
     data: str
     type: str
 
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in CallbackResult.__slots__)
+
+    def __setstate__(self, state):
+        # A frozen instance can not be set with setattr, which pickle uses for the slots by default
+        for name, value in zip(CallbackResult.__slots__, state):
+            object.__setattr__(self, name, value)
+
+
+@dataclass(frozen=True)
+class NormalizedResult(CallbackResult):
+    """
+    CallbackResult whose url, and data of url type, are already base urls. The graphs add it as is
+    """
+    __slots__ = ()
+
 class GraphCallback(ABC):
     """
     Abstract class for callbacks. Callbacks are used to process the data in a way that does not relate to the
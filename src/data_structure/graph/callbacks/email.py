@@ -1,20 +1,35 @@
-from src.data_structure.graph.callbacks.callback import CallbackResult, GraphCallback
+from src.data_structure.graph.callbacks.callback import GraphCallback, NormalizedResult
 import src.utils.constants as consts
 import re
-from bs4 import BeautifulSoup
+from typing import List
 
 from src.utils.tools import extract_domain, extract_base_url, EMAIL_REGEX
 
 
 class EmailParser:
 
-    def process(self, data):
-        soup = BeautifulSoup(data.content, 'html.parser')
-        url = str(data.url)
-        for match in re.finditer(EMAIL_REGEX, soup.get_text()):
-            res = CallbackResult(extract_domain(url), extract_base_url(url),
-                                 match.group(), consts.EMAIL_TYPE_TOKEN)
-            yield res
+    def process(self, page):
+        """
+        Look for emails in the visible text of the parsed page
+        :param page: ParsedPage object. The links and text extracted from the url
+        :return: generator of CallbackResult
+        """
+        # The emails might have been found already by a parsing worker
+        emails = page.emails if page.emails is not None else self.find_emails(page.text)
+        if not emails:
+            return
+        domain, base_url = extract_domain(page.url), extract_base_url(page.url)
+        for email in emails:
+            yield NormalizedResult(domain, base_url, email, consts.EMAIL_TYPE_TOKEN)
+
+    @staticmethod
+    def find_emails(text: str) -> List[str]:
+        """
+        Find all the strings in the text that look like an email
+        :param text: string. The text to search in
+        :return: List of emails (including duplicates)
+        """
+        return [match.group() for match in re.finditer(EMAIL_REGEX, text)]
 
 
 class AddToGraph(GraphCallback):
@@ -23,8 +38,7 @@ class AddToGraph(GraphCallback):
         self.parser = EmailParser()
 
     def process(self, graph, data):
-        for email in self.parser.process(data):
-            graph.add(email)
+        graph.add_many(self.parser.process(data))
 
     @staticmethod
     def get_id() -> str:
@@ -1,17 +1,19 @@
+import heapq
+import os
+from typing import Iterable, Iterator, List, Tuple
+
 import networkx as nx
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-import pandas as pd
-from src.data_structure.graph.callbacks.callback import CallbackResult
+import numpy as np
+from src.data_structure.graph.callbacks.callback import CallbackResult, NormalizedResult
 from src.utils.config import Config
-from src.utils.tools import EMAIL_NAME
 import logging as log
 import jsonpickle
 from jinja2 import Template
 import src.utils.constants as consts
-from src.utils.tools import extract_base_url
 from networkx.readwrite.json_graph import node_link_data
-from src.data_structure.graph.utils import NodeDataNormalizer,EmailNameTFIDFTransformer, EmailDomainDistributioner,\
-    email_name_normalizer, email_domain_extractor
+from src.data_structure.graph.ranking import GraphSnapshot, pagerank
+from src.data_structure.graph.utils import NodeDataNormalizer, EmailCorpus, GraphTables, LruCache, \
+    email_name_normalizer, email_domain_extractor, intern_codes
 
 from src.utils.tools import save_pickle, load_pickle
 
@@ -21,18 +23,54 @@ class WebGraph(nx.Graph):
 
     def __init__(self, callbacks = None, config = None):
         super().__init__()
-        self._email_name_corpus, self._email_domain_corpus = [], []
+        # The email names and domains of each url, updated as email edges are added to the graph
+        self._corpus = EmailCorpus()
         self._cache = {}
-        self._urls_tf_idf_index = {}
+        # The url nodes of each domain, and the domain each url node is indexed under
+        self._domains, self._url_domains = {}, {}
         self._callbacks = callbacks or []
         self._proba = None
         config = config or Config()
         self._alpha = config.get(consts.GRAPH_SECTION, consts.ALPHA_CONFIG_TOKEN, return_as_string=False)
+        self._ranking_engine = config.get(consts.GRAPH_SECTION, consts.RANKING_ENGINE_CONFIG_TOKEN,
+                                          default_value=consts.SCIPY_RANKING_ENGINE_TOKEN)
+        if self._ranking_engine not in (consts.SCIPY_RANKING_ENGINE_TOKEN, consts.NETWORKX_RANKING_ENGINE_TOKEN):
+            raise ValueError(f"Unknown ranking engine: {self._ranking_engine}")
+        self._ranking_tolerance = config.get(consts.GRAPH_SECTION, consts.RANKING_TOLERANCE_CONFIG_TOKEN,
+                                             default_value=1.0e-6, return_as_string=False)
+        self._journal = None
+        # Every change of the graph bumps its version. The weights, ranking and top n results are kept with the version
+        # they were computed for and are computed again only when the graph has changed since
+        self._version = 0
+        self._weights_version = None
+        self._ranking, self._ranking_version = None, None
+        # The CSR snapshot and rank vector of the last ranking of the scipy engine
+        self._snapshot, self._ranks = None, None
+        self._top_n, self._top_n_version = LruCache(), None
 
     @property
     def cache(self):
         return self._cache
 
+    @property
+    def version(self):
+        """
+        The number of changes made to the graph with add and merge_graph
+        """
+        return self._version
+
+    @property
+    def journal(self):
+        """
+        Object with append and extend methods that get every CallbackResult that is added to the graph, like a crawl
+        checkpoint. None when the additions are not recorded
+        """
+        return self._journal
+
+    @journal.setter
+    def journal(self, value):
+        self._journal = value
+
     @cache.setter
     def cache(self, value):
         self._cache = value
@@ -44,14 +82,36 @@ class WebGraph(nx.Graph):
         :param scraped_res: ScraperResult. The scraped data to add
         :return:
         """
-        data = new_data.data
-        url = str(new_data.url)
-        v = extract_base_url(url)
-        u = data
-        self.add_node(v, domain=new_data.domain, type=consts.URL_TYPE_TOKEN)
-        self.add_node(u, domain=new_data.domain, type=new_data.type)
-        self._cache.setdefault(new_data.type, set()).add(u)
+        self._add_record(new_data)
+        self._version += 1
+        if self._journal is not None:
+            self._journal.append(new_data)
+
+    def add_many(self, results: Iterable[CallbackResult]):
+        """
+        Add a batch of scraped data to the graph, like all the links of a page, as one change of the graph
+        :param results: iterable of CallbackResult
+        :return:
+        """
+        records = list(NodeDataNormalizer.normalize_many(results))
+        for record in records:
+            self._add_record(record)
+        if records:
+            self._version += 1
+            if self._journal is not None:
+                self._journal.extend(records)
+
+    def _add_record(self, record: NormalizedResult):
+        v, u = record.url, record.data
+        self.add_node(v, domain=record.domain, type=consts.URL_TYPE_TOKEN)
+        self.add_node(u, domain=record.domain, type=record.type)
+        self._index_node(v)
+        self._index_node(u)
+        self._cache.setdefault(record.type, set()).add(u)
+        is_new_edge = not self.has_edge(u, v)
         self.add_edge(u, v, weight=0)
+        if is_new_edge:
+            self._add_to_corpus(u, v)
 
     def add_domain_attr_to_node(self, node: str, domain: str):
         """
@@ -61,6 +121,8 @@ class WebGraph(nx.Graph):
         :return:
         """
         nx.set_node_attributes(self, {node: domain}, 'domain')
+        self._index_node(node)
+        self._version += 1
 
     def add_type_attr_to_node(self, node: str, type: str):
         """
@@ -70,119 +132,264 @@ class WebGraph(nx.Graph):
         :return:
         """
         nx.set_node_attributes(self, {node: type}, 'type')
+        self._index_node(node)
+        self._version += 1
 
-    def get_top_n_for_each_domain(self, n=5):
+    def get_top_n_for_each_domain(self, n=5, domains: List[str] = None):
         """
-        Get the top n most important nodes in each domain
+        Get the top n most important nodes in each domain. The results of the last queries are cached until the graph
+        changes
         :param n: int. The number of nodes to return
+        :param domains: List of domains to return. All the domains if None
         :return: list of dict: {domain: List of nodes and their rank in the domain}
         """
-        if not self._email_name_corpus or not self._email_domain_corpus:
-            self._build_corpus()
-
-        self._add_weights_scores()
-        ranking = self.get_ranking()
-        clusters = self._get_domains_cluster()
+        key = (n, tuple(domains) if domains is not None else None)
+        if self._top_n_version == self._version:
+            top_n = self._top_n.lookup(key)
+            if top_n is not None:
+                return top_n
+
+        if self._weights_version != self._version:
+            self._add_weights_scores()
+            self._weights_version = self._version
+        self.get_ranking()
         top_n = []
-        for domain in clusters:
-            top_n.append({domain: sorted(clusters[domain], key=lambda x: ranking[x], reverse=True)[:n]})
+        for domain in self._domains if domains is None else domains:
+            top_n.append({domain: self._get_top_nodes(self._domains.get(domain, ()), n)})
 
+        if self._top_n_version != self._version:
+            self._top_n, self._top_n_version = LruCache(), self._version
+        self._top_n.store(key, top_n)
         return top_n
 
     def merge_graph(self, graph):
         """
-        Merge the graph with the current graph. The cache will be merged as well
+        Merge the graph with the current graph. The cache and the corpus will be merged as well
         :param graph: WebGraph. The graph to merge with
         :return:
         """
+        new_edges = [(u, v) for u, v in graph.edges if not self.has_edge(u, v)]
         self.add_nodes_from(graph.nodes(data=True))
         self.add_edges_from(graph.edges(data=True))
+        for node in graph.nodes:
+            self._index_node(node)
+        for u, v in new_edges:
+            self._add_to_corpus(u, v)
         self._cache.setdefault(consts.URL_TYPE_TOKEN, set()).update(graph.cache.setdefault(consts.URL_TYPE_TOKEN, set()))
         self._cache.setdefault(consts.EMAIL_TYPE_TOKEN, set()).update(graph.cache.setdefault(consts.EMAIL_TYPE_TOKEN, set()))
+        self._version += 1
 
-    def get_ranking(self) -> dict:
+    def to_tables(self) -> GraphTables:
+        """
+        :return: GraphTables of the nodes, their attributes, the edges and the cache of the graph
+        """
+        nodes = list(self.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        node_domains, domains = intern_codes((self.nodes[node].get('domain') for node in nodes), np.int32)
+        node_types, types = intern_codes((self.nodes[node].get('type') for node in nodes), np.int8)
+        edges = np.fromiter((index[node] for edge in self.edges for node in edge), dtype=np.uint32,
+                            count=2 * self.number_of_edges()).reshape(-1, 2)
+        cache = {node_type: np.fromiter((index[node] for node in cached if node in index), dtype=np.uint32)
+                 for node_type, cached in self._cache.items()}
+        return GraphTables(nodes, domains, types, node_domains, node_types, edges, cache)
+
+    @classmethod
+    def from_tables(cls, tables: GraphTables, callbacks=None, config=None):
+        """
+        Create the graph of the tables
+        :param tables: GraphTables
+        :param callbacks: The callbacks of the graph
+        :param config: Config
+        :return: WebGraph
         """
-        Generate the ranking scores for each node in the graph. The score is the pagerank score
+        graph = cls(callbacks=callbacks, config=config)
+        graph.add_nodes_from(tables.node_attributes())
+        edges = list(tables.edge_names)
+        graph.add_edges_from(edges, weight=0)
+        for node in tables.nodes:
+            graph._index_node(node)
+        for u, v in edges:
+            graph._add_to_corpus(u, v)
+        graph._cache = {node_type: {tables.nodes[i] for i in ids.tolist()} for node_type, ids in tables.cache.items()}
+        graph._version += 1
+        return graph
+
+    def get_ranking(self, top_k: int = None) -> dict:
+        """
+        Generate the ranking scores for each node in the graph. The score is the pagerank score. The ranking is cached
+        until the graph or its weights change, and then the power iteration starts from the previous ranking, which is
+        close to the new one when only a part of the graph has changed
+        :param top_k: int. Return only the scores of the top k url nodes of each domain
         :return: dict: {node: rank}
         """
-        return nx.pagerank(self, weight='weight')
+        ranking_version = (self._version, self._weights_version)
+        if self._ranking_version != ranking_version:
+            self._ranking = self._compute_ranking()
+            self._ranking_version = ranking_version
+
+        if top_k is None:
+            return self._ranking
+        if self._snapshot is not None:
+            top_nodes = self._snapshot.top_k_per_domain(self._ranks, top_k)
+        else:
+            top_nodes = {domain: self._get_top_nodes(nodes, top_k) for domain, nodes in self._domains.items()}
+        return {node: self._ranking[node] for nodes in top_nodes.values() for node in nodes}
+
+    def get_ranked_snapshot(self) -> Tuple[GraphSnapshot, np.ndarray]:
+        """
+        :return: The CSR snapshot of the weighted graph and the rank of each of its node ids
+        """
+        self.get_top_n_for_each_domain()
+        if self._snapshot is not None:
+            return self._snapshot, self._ranks
+        # The networkx engine ranks without a snapshot
+        snapshot = GraphSnapshot.from_graph(self)
+        return snapshot, np.fromiter((self._ranking[node] for node in snapshot.nodes), dtype=np.float64,
+                                     count=len(snapshot))
+
+    def _compute_ranking(self) -> dict:
+        """
+        Run pagerank with the configured engine, starting from the previous ranking if there is one. New nodes start
+        from the uniform rank
+        :return: dict: {node: rank}
+        """
+        previous = self._ranking
+        if self._ranking_engine == consts.NETWORKX_RANKING_ENGINE_TOKEN:
+            self._snapshot, self._ranks = None, None
+            nstart = {node: previous.get(node, 1 / len(self)) for node in self} if previous else None
+            return nx.pagerank(self, weight='weight', tol=self._ranking_tolerance, nstart=nstart)
+
+        snapshot = GraphSnapshot.from_graph(self)
+        nstart = None
+        if previous:
+            nstart = np.fromiter((previous.get(node, 1 / len(snapshot)) for node in snapshot.nodes),
+                                 dtype=np.float64, count=len(snapshot))
+        self._snapshot, self._ranks = snapshot, pagerank(snapshot, tol=self._ranking_tolerance, nstart=nstart)
+        return snapshot.to_dict(self._ranks)
 
     def _add_weights_scores(self):
         """
         Add the weights to the edges. The score is the tf-idf score of the email address in the url
         :return:
         """
-        tfidf_df = EmailNameTFIDFTransformer().fit_transform(self._email_name_corpus)
-        domain_proba = EmailDomainDistributioner().fit_transform(self._email_domain_corpus)
-        # add tf-idf scores to the edge weights between emails and urls
-        for url, idx in self._urls_tf_idf_index.items():
+        if not len(self._corpus):
+            # No email was found in the graph, there is nothing to weight
+            return
+
+        tfidf_matrix, vocabulary, urls_tf_idf_index = self._corpus.get_tfidf()
+        domain_proba = self._corpus.get_domain_proba()
+        # Collect the (document, email name) cell and the domain probability of every email edge, so the scores are
+        # computed in one pass over the sparse matrix
+        email_edges, rows, columns, proba_scores = [], [], [], []
+        for url, idx in urls_tf_idf_index.items():
 
             # If the url is the domain itself, skip it. We only want to rank real urls
             if url == self.nodes[url]['domain']:
                 continue
 
             for neighbor in self.neighbors(url):
-                try:
-                    node_type = self.nodes[neighbor]['type']
-                    if node_type != consts.URL_TYPE_TOKEN:
-                        # The neighbor is an email. Get the probability score of the email's domain name based on the
-                        # training data
-                        email_domain = email_domain_extractor(neighbor)
-                        proba_score = domain_proba[email_domain]
-                        # Need to normalize the neighbor name to only be the email name for the tf-idf score
-                        email_name = email_name_normalizer(neighbor)
-                        total_score = tfidf_df.loc[idx, email_name].item() * self._alpha + proba_score * (1 - self._alpha)
-                    else:
-                        # For URL the score is 0 because there is no information about the email in the url
-                        total_score = 0
-
-                    self.edges[url, neighbor]['weight'] = total_score
-                except KeyError:
-                    # The neighbor is an url and not an email
-                    pass
-
-    def _build_corpus(self):
-        urls = self._cache[consts.URL_TYPE_TOKEN]
-        idx = 0  # The index of the url in the corpus
-        for url in urls:
-            # Get all the neighbors for that url that are not of type URL
-            neighbors = [n for n in self.neighbors(url) if self.nodes[n]['type'] != consts.URL_TYPE_TOKEN]
-            if neighbors:
-                # Some urls are connected to only other urls meaning that no emails were found in the url
-                self._email_name_corpus.append(" ".join([email_name_normalizer(n) for n in neighbors]))  # Add the name of the email to the corpus
-                self._email_domain_corpus.append(" ".join([n.split("@")[1] for n in neighbors]))  # Add the type of the email to the corpus
-                # Save the index of the url in the corpus
-                self._urls_tf_idf_index[url] = idx
-                idx += 1  # Increment the index only for email urls
-
-    def _get_domains_cluster(self) -> dict:
-        """
-        Get the domain cluster
-        :return: dict of dict: {node: List of nodes in the cluster}
-        """
-        clusters = {}
-        for node in self.nodes:
-            if "domain" in self.nodes[node] and self.nodes[node]['type'] == consts.URL_TYPE_TOKEN:
-                clusters.setdefault(self.nodes[node]['domain'], set()).add(node)
-
-        return clusters
-
-
-def combine_graphs(graphs: list) -> WebGraph:
+                node_type = self.nodes[neighbor].get('type')
+                if node_type is None:
+                    continue
+                if node_type == consts.URL_TYPE_TOKEN:
+                    # For URL the score is 0 because there is no information about the email in the url
+                    self.edges[url, neighbor]['weight'] = 0
+                    continue
+
+                # The neighbor is an email. Emails whose normalized name or domain is not in the vocabulary are
+                # left unweighted
+                column = vocabulary.get(email_name_normalizer(neighbor))
+                proba_score = domain_proba.get(email_domain_extractor(neighbor))
+                if column is None or proba_score is None:
+                    continue
+                email_edges.append((url, neighbor))
+                rows.append(idx)
+                columns.append(column)
+                proba_scores.append(proba_score)
+
+        if not email_edges:
+            return
+
+        tfidf_scores = np.asarray(tfidf_matrix[rows, columns]).ravel()
+        total_scores = tfidf_scores * self._alpha + np.asarray(proba_scores) * (1 - self._alpha)
+        for (url, neighbor), total_score in zip(email_edges, total_scores.tolist()):
+            self.edges[url, neighbor]['weight'] = total_score
+
+    def _add_to_corpus(self, u: str, v: str):
+        """
+        Add a new edge to the corpus if it links an email to an url
+        :param u: string. A node of the edge
+        :param v: string. The other node of the edge
+        :return:
+        """
+        u_type, v_type = self.nodes[u].get('type'), self.nodes[v].get('type')
+        if u_type == consts.URL_TYPE_TOKEN and v_type not in (None, consts.URL_TYPE_TOKEN):
+            self._corpus.add(url=u, email=v)
+        elif v_type == consts.URL_TYPE_TOKEN and u_type not in (None, consts.URL_TYPE_TOKEN):
+            self._corpus.add(url=v, email=u)
+
+    def _index_node(self, node: str):
+        """
+        Keep the node in the cluster of its domain if it is an url, after its attributes were set
+        :param node: string. The node that was added or changed
+        :return:
+        """
+        attributes = self.nodes[node]
+        domain = attributes.get('domain') if attributes.get('type') == consts.URL_TYPE_TOKEN else None
+        previous_domain = self._url_domains.get(node)
+        if domain == previous_domain:
+            return
+
+        if previous_domain is not None:
+            self._domains[previous_domain].discard(node)
+            if not self._domains[previous_domain]:
+                del self._domains[previous_domain]
+        if domain is not None:
+            self._domains.setdefault(domain, set()).add(node)
+            self._url_domains[node] = domain
+        else:
+            self._url_domains.pop(node, None)
+
+    def _get_top_nodes(self, nodes, n: int) -> list:
+        """
+        Select the n nodes with the highest rank without sorting all of them. The rank vector of the scipy engine is
+        partitioned, otherwise a heap keeps the n best nodes
+        :param nodes: The nodes to select from
+        :param n: int. The number of nodes to return
+        :return: list of nodes sorted by descending rank
+        """
+        if self._snapshot is None:
+            return heapq.nlargest(n, nodes, key=self._ranking.get)
+
+        node_ids = np.fromiter((self._snapshot.index[node] for node in nodes), dtype=np.int64, count=len(nodes))
+        ranks = self._ranks[node_ids]
+        if len(node_ids) > n:
+            best = np.argpartition(-ranks, n)[:n]
+            node_ids, ranks = node_ids[best], ranks[best]
+        return [self._snapshot.nodes[node_id] for node_id in node_ids[np.argsort(-ranks, kind='stable')].tolist()]
+
+
+def to_networkx(graph) -> nx.Graph:
     """
-    Combine the graphs from the different processes into one graph. The cache will be the union of all the caches
-    :param graphs: list of graphs
-    :return: WebGraph: combined graph
+    The graph as a networkx graph, for the exports. Other data structures are copied
+    :param graph: Graph object
+    :return: nx.Graph
     """
-    combined_graph = WebGraph()
-    for graph in graphs:
-        combined_graph.merge_graph(graph)
-
-    return combined_graph
+    return graph if isinstance(graph, nx.Graph) else graph.to_networkx()
 
 
 def serialize_graph(graph):
-    return node_link_data(graph)
+    return node_link_data(to_networkx(graph))
+
+
+def generate_gml(graph) -> Iterator[str]:
+    """
+    The lines of the GML export of the graph, generated as they are read
+    :param graph: Graph object
+    :return: generator of lines
+    """
+    for line in nx.generate_gml(to_networkx(graph)):
+        yield line + "\n"
 
 
 def load_graph(path: str) -> WebGraph:
@@ -194,23 +401,42 @@ def load_graph(path: str) -> WebGraph:
     return load_pickle(path)
 
 
-def save_graph(path: str, graph: WebGraph):
+def save_graph(path: str, graph: WebGraph, html_path: str = consts.GRAPH_TEMPLATE_PATH):
     """
-    Save the graph to the path and create a html file for the graph
+    Save the graph to the path and create a html file for the graph. Every file is replaced at once
     :param path: string. The path to save the graph to
     :param graph: Graph object
+    :param html_path: string. The path to save the html of the graph to
     :return:
     """
-    nx.write_gml(graph, path.replace(".pkl", ".gml"))
+    gml_path = path.replace(".pkl", ".gml")
+    nx.write_gml(to_networkx(graph), f"{gml_path}.tmp")
+    os.replace(f"{gml_path}.tmp", gml_path)
     save_pickle(path, graph)
-    create_html_for_graph(graph, consts.TEMPLATE_PATH)
+    create_html_for_graph(graph, consts.TEMPLATE_PATH, html_path=html_path)
 
 
-def create_html_for_graph(graph: WebGraph, template_str: str):
+def create_html_for_graph(graph: WebGraph, template_str: str, html_path: str = consts.GRAPH_TEMPLATE_PATH):
     """
     Create the html for the graph
     :param graph: Graph object
     :param template_str: string. The html template
+    :param html_path: string. The path to save the html to
+    :return: string. The html for the graph
+    """
+    html_str = render_graph_html(graph, template_str)
+    log.info(f"Saving graph to {html_path}")
+    with open(f"{html_path}.tmp", 'w') as f:
+        f.write(html_str)
+    os.replace(f"{html_path}.tmp", html_path)
+    return html_str
+
+
+def render_graph_html(graph: WebGraph, template_str: str) -> str:
+    """
+    Render the html of the top nodes of the graph
+    :param graph: Graph object
+    :param template_str: string. The path of the html template
     :return: string. The html for the graph
     """
     # If the graph is too big it will take too long to render it. We will only render the top 20 nodes
@@ -219,7 +445,7 @@ def create_html_for_graph(graph: WebGraph, template_str: str):
         top_20 = sorted(ranking, key=ranking.get, reverse=True)[:10]
         graph = graph.subgraph(top_20)
 
-    data = nx.readwrite.json_graph.node_link_data(graph)
+    data = nx.readwrite.json_graph.node_link_data(to_networkx(graph))
 
     # serialize the JSON data
     json_str = jsonpickle.encode(data)
@@ -231,8 +457,4 @@ def create_html_for_graph(graph: WebGraph, template_str: str):
     template = Template(template_str)
 
     # render the template with the JSON data
-    html_str = template.render(json_str=json_str)
-
-    log.info(f"Saving graph to {consts.GRAPH_TEMPLATE_PATH}")
-    with open(consts.GRAPH_TEMPLATE_PATH, 'w') as f:
-        f.write(html_str)
+    return template.render(json_str=json_str)
@@ -0,0 +1,140 @@
+from typing import Dict, List, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+import src.utils.constants as consts
+
+
+class GraphSnapshot:
+    """
+    Immutable integer indexed copy of a graph for the ranking. The nodes get the ids 0..n-1, the weighted adjacency is
+    kept in a CSR matrix and the domain and type of every node are kept in arrays, so the ranking runs on NumPy arrays
+    instead of the dict of dicts of networkx.
+    """
+
+    def __init__(self, nodes: List[str], matrix: sparse.csr_matrix, domain_ids: np.ndarray, domains: List[str],
+                 is_url: np.ndarray):
+        """
+        :param nodes: The node of each id
+        :param matrix: The symmetric weighted adjacency matrix of the node ids
+        :param domain_ids: The index in `domains` of the domain of each node id
+        :param domains: The domain names
+        :param is_url: True for the node ids that are urls
+        """
+        self.nodes = nodes
+        self._index = None
+        self.matrix = matrix
+        self.domain_ids = domain_ids
+        self.domains = domains
+        self.is_url = is_url
+
+    @classmethod
+    def from_graph(cls, graph: nx.Graph, weight: str = 'weight'):
+        """
+        Copy a networkx graph
+        :param graph: nx.Graph whose nodes have domain and type attributes
+        :param weight: string. The edge attribute that holds the weight, 1 when it is missing
+        :return: GraphSnapshot
+        """
+        nodes = list(graph)
+        index = {node: node_id for node_id, node in enumerate(nodes)}
+        n = len(nodes)
+
+        # The rows of the CSR matrix are the adjacency of the nodes. The adjacency of an undirected graph holds every
+        # edge in both directions and a self loop once
+        adjacency = graph.adj
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(adjacency[node]) for node in nodes), dtype=np.int64, count=n), out=indptr[1:])
+        indices = np.fromiter((index[neighbor] for node in nodes for neighbor in adjacency[node]),
+                              dtype=np.int64, count=indptr[-1])
+        weights = np.fromiter((attributes.get(weight, 1) for node in nodes
+                               for attributes in adjacency[node].values()), dtype=np.float64, count=indptr[-1])
+        matrix = sparse.csr_matrix((weights, indices, indptr), shape=(n, n))
+
+        domains = {}
+        domain_ids = np.fromiter((domains.setdefault(graph.nodes[node].get('domain'), len(domains)) for node in nodes),
+                                 dtype=np.int64, count=n)
+        is_url = np.fromiter((graph.nodes[node].get('type') == consts.URL_TYPE_TOKEN for node in nodes),
+                             dtype=bool, count=n)
+        return cls(nodes, matrix, domain_ids, list(domains), is_url)
+
+    @property
+    def index(self) -> Dict[str, int]:
+        """
+        The id of each node. Built on first use
+        """
+        if self._index is None:
+            self._index = {node: node_id for node_id, node in enumerate(self.nodes)}
+        return self._index
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def to_dict(self, ranks: np.ndarray) -> Dict[str, float]:
+        """
+        :param ranks: array of the rank of each node id
+        :return: dict: {node: rank}
+        """
+        return dict(zip(self.nodes, ranks.tolist()))
+
+    def order_by_domain(self, ranks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The url nodes sorted by domain and by descending rank inside each domain
+        :param ranks: array of the rank of each node id
+        :return: The sorted node ids and the offset of each domain id in them: the urls of the domain id d are
+         order[offsets[d]:offsets[d + 1]]
+        """
+        urls = np.flatnonzero(self.is_url)
+        order = urls[np.lexsort((-ranks[urls], self.domain_ids[urls]))]
+        offsets = np.searchsorted(self.domain_ids[order], np.arange(len(self.domains) + 1))
+        return order, offsets
+
+    def top_k_per_domain(self, ranks: np.ndarray, k: int, order: Tuple[np.ndarray, np.ndarray] = None) \
+            -> Dict[str, List[str]]:
+        """
+        The k url nodes with the highest rank in each domain
+        :param ranks: array of the rank of each node id
+        :param k: int. The number of nodes to return for each domain
+        :param order: The result of order_by_domain for the ranks, computed if None
+        :return: dict: {domain: List of nodes sorted by rank}
+        """
+        order, offsets = order if order is not None else self.order_by_domain(ranks)
+        top_k = {}
+        for domain_id in np.flatnonzero(np.diff(offsets)).tolist():
+            top_k[self.domains[domain_id]] = [self.nodes[node_id]
+                                              for node_id in order[offsets[domain_id]:offsets[domain_id] + k].tolist()]
+        return top_k
+
+
+def pagerank(snapshot: GraphSnapshot, alpha: float = 0.85, tol: float = 1.0e-6, max_iter: int = 100,
+             nstart: np.ndarray = None) -> np.ndarray:
+    """
+    PageRank by power iteration over the CSR matrix of the snapshot. Computes the same ranks as nx.pagerank: the rank
+    of dangling nodes is spread uniformly and the iteration stops when the l1 change is below n * tol
+    :param snapshot: GraphSnapshot
+    :param alpha: float. The damping factor
+    :param tol: float. The error tolerance of each node
+    :param max_iter: int. The maximum number of iterations
+    :param nstart: array. The starting rank of each node id, uniform if None
+    :return: array of the rank of each node id
+    """
+    n = len(snapshot)
+    if n == 0:
+        return np.zeros(0)
+
+    out_weights = np.asarray(snapshot.matrix.sum(axis=1)).ravel()
+    is_dangling = out_weights == 0
+    inverse = np.divide(1.0, out_weights, out=np.zeros(n), where=~is_dangling)
+    # Transpose once so each iteration is a single sparse matrix-vector product
+    transition = (sparse.diags(inverse) @ snapshot.matrix).T.tocsr()
+
+    x = np.full(n, 1.0 / n) if nstart is None else nstart / nstart.sum()
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (transition @ x + x[is_dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(x - x_last).sum() < n * tol:
+            return x
+
+    raise nx.PowerIterationFailedConvergence(max_iter)
@@ -1,9 +1,14 @@
-import copy
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 
-from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.data_structure.graph.callbacks.callback import CallbackResult, NormalizedResult
 import src.utils.constants as consts
 from src.utils.tools import extract_base_url
 from sklearn.base import BaseEstimator, TransformerMixin
@@ -12,6 +17,7 @@ email_name_normalizer = lambda email: "".join(email.split('@')[0].split('.')).lo
 email_domain_extractor = lambda email: email.split('@')[1].lower()
 
 EMAIL_NAME_REGEX = "[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
+EMAIL_NAME_TOKEN_REGEX = re.compile(r"(?u)\b\w\w+\b")  # The tokens of the email names, as TfidfVectorizer splits them
 
 
 class EmailDomainDistributioner(BaseEstimator, TransformerMixin):
@@ -22,36 +28,248 @@ class EmailDomainDistributioner(BaseEstimator, TransformerMixin):
     def fit_transform(self, X, y=None, **fit_params):
         vectorizer = CountVectorizer(token_pattern=self._token_pattern)
         count_matrix = vectorizer.fit_transform(X)
-        count_df = pd.DataFrame(count_matrix.toarray(), columns=vectorizer.get_feature_names_out())
+        # Sum the sparse counts of each domain instead of densifying the documents x domains matrix
+        counts = np.asarray(count_matrix.sum(axis=0)).ravel()
 
-        return count_df.sum() / count_df.sum().sum()
+        return pd.Series(counts / counts.sum(), index=vectorizer.get_feature_names_out())
 
 class EmailNameTFIDFTransformer(BaseEstimator, TransformerMixin):
+        """
+        TF-IDF of the email names of each document. The matrix is returned in sparse CSR form, the column of each
+        email name is kept in `vocabulary_`
+        """
 
         def __init__(self):
             self._token_pattern = EMAIL_NAME_REGEX
+            self.vocabulary_ = {}
 
         def fit_transform(self, X, y=None, **fit_params):
             vectorizer = TfidfVectorizer(use_idf=True, lowercase=False,
                                          smooth_idf=True)  # No lowercase to preserve the emails
             tfidf_matrix = vectorizer.fit_transform(X)
-            return pd.DataFrame(tfidf_matrix.toarray(), columns=vectorizer.get_feature_names_out())
+            self.vocabulary_ = vectorizer.vocabulary_
+            return tfidf_matrix.tocsr()
+
+class EmailCorpus:
+    """
+    The email names and domains found in each url, kept as term and document frequency counts that are updated when an
+    email edge is added to the graph. The TF-IDF matrix and the domain distribution are computed from the counts, the
+    same as EmailNameTFIDFTransformer and EmailDomainDistributioner compute them from a corpus of all the urls, without
+    walking the graph again. Only the urls that changed since the last computation are counted again.
+    """
+
+    def __init__(self):
+        self._documents = {}  # url -> Counter of the email name terms. The order of the urls is the order of the rows
+        self._rows = {}  # url -> the columns and counts of its row, for the urls that did not change
+        self._vocabulary = {}  # term -> column
+        self._document_frequency = Counter()
+        self._domain_counts = Counter()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, url: str, email: str) -> None:
+        """
+        Add an email that was found in a url
+        :param url: string. The url node
+        :param email: string. The email node
+        :return:
+        """
+        terms = Counter(EMAIL_NAME_TOKEN_REGEX.findall(email_name_normalizer(email)))
+        document = self._documents.setdefault(url, Counter())
+        for term in terms:
+            if term not in document:
+                self._document_frequency[term] += 1
+            if term not in self._vocabulary:
+                self._vocabulary[term] = len(self._vocabulary)
+        document.update(terms)
+        self._rows.pop(url, None)
+        self._domain_counts.update(re.findall(EMAIL_NAME_REGEX, email_domain_extractor(email)))
+
+    def get_tfidf(self) -> Tuple[sparse.csr_matrix, Dict[str, int], Dict[str, int]]:
+        """
+        TF-IDF of the email names of each url with a smoothed idf and l2 normalized rows, like TfidfVectorizer
+        :return: The sparse urls x terms matrix, the column of each term and the row of each url
+        """
+        for url, document in self._documents.items():
+            if url not in self._rows:
+                self._rows[url] = (np.fromiter((self._vocabulary[term] for term in document), dtype=np.int64,
+                                               count=len(document)),
+                                   np.fromiter(document.values(), dtype=np.float64, count=len(document)))
+
+        rows = [self._rows[url] for url in self._documents]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(columns) for columns, _ in rows], out=indptr[1:])
+        indices = np.concatenate([columns for columns, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate([counts for _, counts in rows]) if rows else np.zeros(0)
+
+        document_frequency = np.zeros(len(self._vocabulary))
+        document_frequency[list(self._vocabulary.values())] = [self._document_frequency[term]
+                                                               for term in self._vocabulary]
+        idf = np.log((1 + len(rows)) / (1 + document_frequency)) + 1
+        matrix = sparse.csr_matrix((counts * idf[indices], indices, indptr), shape=(len(rows), len(self._vocabulary)))
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        matrix = sparse.diags(1 / norms) @ matrix
+        return matrix.tocsr(), self._vocabulary, {url: row for row, url in enumerate(self._documents)}
+
+    def get_domain_proba(self) -> Dict[str, float]:
+        """
+        The probability of each email domain among all the emails of the urls
+        :return: dict: {domain: probability}
+        """
+        total = sum(self._domain_counts.values())
+        return {domain: count / total for domain, count in self._domain_counts.items()}
+
 
 class NodeDataNormalizer:
+    """
+    Decorator of the add method of the graphs. Hands the method a NormalizedResult, so the url of the page and the urls
+    it links to are normalized once, when the record is created, instead of copying the record and normalizing it again
+    on every add
+    """
 
     def __call__(self, func):
         def wrapper(*args, **kwargs):
             graph, data = args[0], args[1]
-            callback_res_copy = copy.deepcopy(data)  # make sure we don't change the original data
+            return func(graph, self.normalize(data), *args[2:], **kwargs)
 
-            if isinstance(data, CallbackResult):
-                if data.type == consts.URL_TYPE_TOKEN:
-                    # for URL type, we need to normalize the url
-                    callback_res_copy.data = extract_base_url(data.data)
-                    args = (graph, callback_res_copy)
+        return wrapper
 
-                return func(*args, **kwargs)
-            else:
-                raise TypeError("Data type not supported")
+    @staticmethod
+    def normalize(data: CallbackResult, base_url: str = None) -> NormalizedResult:
+        """
+        :param data: CallbackResult. Returned as is when it is already normalized
+        :param base_url: string. The base url of data.url when it is known already
+        :return: NormalizedResult
+        """
+        if isinstance(data, NormalizedResult):
+            return data
+        if not isinstance(data, CallbackResult):
+            raise TypeError("Data type not supported")
 
-        return wrapper
+        # for URL type, we need to normalize the linked url as well
+        linked = extract_base_url(data.data) if data.type == consts.URL_TYPE_TOKEN else data.data
+        return NormalizedResult(data.domain, base_url or extract_base_url(data.url), linked, data.type)
+
+    @classmethod
+    def normalize_many(cls, results: Iterable[CallbackResult]) -> Iterator[NormalizedResult]:
+        """
+        Normalize a batch of results, like the links of a page. The base url of the page is computed once for all the
+        results of the same page
+        :param results: iterable of CallbackResult
+        :return: generator of NormalizedResult
+        """
+        url, base_url = None, None
+        for data in results:
+            if isinstance(data, CallbackResult) and not isinstance(data, NormalizedResult) and data.url != url:
+                url, base_url = data.url, extract_base_url(data.url)
+            yield cls.normalize(data, base_url=base_url)
+
+
+def encode_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param strings: List of strings
+    :return: The utf-8 bytes of all the strings one after the other, and the offset of each string in them
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """
+    :param data: The bytes of encode_strings
+    :param offsets: The offsets of encode_strings
+    :return: List of strings
+    """
+    data, offsets = data.tobytes(), offsets.tolist()
+    return [data[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+def intern_codes(values: Iterable[Optional[str]], dtype) -> Tuple[np.ndarray, List[str]]:
+    """
+    Replace every value with a small integer code
+    :param values: iterable of strings. None gets the code -1
+    :param dtype: The numpy dtype of the codes
+    :return: The array of codes and the value of each code
+    """
+    codes = {}
+    array = np.fromiter((-1 if value is None else codes.setdefault(value, len(codes)) for value in values), dtype=dtype)
+    return array, list(codes)
+
+
+class LruCache(OrderedDict):
+    """
+    Dict that keeps the results of its last used keys only, so the keys that come from requests do not grow it. The
+    readers of a published graph share it without a lock, so a key that another reader dropped is a miss, not an error
+    """
+
+    def __init__(self, size: int = consts.TOP_N_CACHE_SIZE):
+        """
+        :param size: int. The number of keys to keep
+        """
+        super().__init__()
+        self.size = size
+
+    def lookup(self, key):
+        """
+        :param key: The key
+        :return: The value of the key, None if it is not kept
+        """
+        value = self.get(key)
+        if value is not None:
+            try:
+                self.move_to_end(key)
+            except KeyError:
+                pass
+        return value
+
+    def store(self, key, value) -> None:
+        """
+        Keep the value of the key and drop the least recently used keys over the size
+        :param key: The key
+        :param value: The value
+        :return:
+        """
+        self[key] = value
+        while len(self) > self.size:
+            try:
+                self.popitem(last=False)
+            except KeyError:
+                break
+
+
+@dataclass(frozen=True)
+class GraphTables:
+    """
+    The data of a graph as flat tables, the same for every graph data structure. A node is an index of `nodes`, its
+    domain and type are indexes of `domains` and `types` (-1 when it has none), and every edge is a row of two node
+    indexes. The graphs are saved and exported from these tables, and can be created from them again
+    """
+    nodes: List[str]
+    domains: List[str]
+    types: List[str]
+    node_domains: np.ndarray  # int32 code of each node
+    node_types: np.ndarray  # int8 code of each node
+    edges: np.ndarray  # (edges, 2) uint32 node indexes
+    cache: Dict[str, np.ndarray]  # type -> uint32 indexes of the nodes in the cache of the type
+
+    @property
+    def edge_names(self) -> Iterator[Tuple[str, str]]:
+        nodes = self.nodes
+        return ((nodes[u], nodes[v]) for u, v in self.edges.tolist())
+
+    def node_attributes(self) -> Iterator[Tuple[str, dict]]:
+        """
+        :return: generator of (node, {domain, type}) without the attributes the node does not have
+        """
+        for node, domain_code, type_code in zip(self.nodes, self.node_domains.tolist(), self.node_types.tolist()):
+            attributes = {}
+            if domain_code >= 0:
+                attributes['domain'] = self.domains[domain_code]
+            if type_code >= 0:
+                attributes['type'] = self.types[type_code]
+            yield node, attributes
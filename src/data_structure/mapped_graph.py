@@ -0,0 +1,197 @@
+import json
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional
+import logging as log
+
+import numpy as np
+
+from src.data_structure.graph.utils import decode_strings, encode_strings
+
+INDEX_MAGIC = b"GRAPHIDX"
+INDEX_FORMAT_VERSION = 2
+INDEX_HEADER = struct.Struct("<8sIQ")  # magic, format version, length of the json table of contents
+INDEX_ALIGNMENT = 64  # The arrays start at aligned offsets, so they are read in place
+
+
+def save_index(path: str, graph, generation: float = None) -> int:
+    """
+    Save the read only index of a ranked graph: the node and domain names, the CSR adjacency with the edge weights, the
+    domain and url flag of every node, the rank of every node, the url nodes of every domain sorted by rank, the
+    domains in the order of the top n results of WebGraph and the node ids sorted by name. The arrays are stored uncompressed at aligned offsets, so MappedGraph maps them from the
+    file instead of reading them. The file is replaced at once
+    :param path: string. The path of the index
+    :param graph: WebGraph or ArrayGraph
+    :param generation: float. Identifies the snapshot that was saved with the index
+    :return: int. The size of the file
+    """
+    snapshot, ranks = graph.get_ranked_snapshot()
+    matrix = snapshot.matrix
+    domain_ids = np.asarray(snapshot.domain_ids, dtype=np.int32)
+    # The url nodes sorted by domain and by descending rank inside each domain, the order of the top n queries
+    urls = np.flatnonzero(snapshot.is_url)
+    domain_nodes = urls[np.lexsort((-ranks[urls], domain_ids[urls]))]
+    domain_offsets = np.zeros(len(snapshot.domains) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(domain_ids[domain_nodes], minlength=len(snapshot.domains)), out=domain_offsets[1:])
+    # WebGraph returns the domains in the order of their first url node, and has no entry for the nodes without a
+    # domain
+    first_urls = np.full(len(snapshot.domains), len(snapshot), dtype=np.int64)
+    np.minimum.at(first_urls, domain_ids[urls], urls)
+    domain_order = np.array([domain_id for domain_id in np.argsort(first_urls, kind='stable').tolist()
+                             if first_urls[domain_id] < len(snapshot) and snapshot.domains[domain_id] is not None],
+                            dtype=np.int32)
+
+    arrays = {"indptr": matrix.indptr.astype(np.int64), "indices": matrix.indices.astype(np.uint32),
+              "weights": matrix.data.astype(np.float64), "domain_ids": domain_ids,
+              "is_url": np.asarray(snapshot.is_url, dtype=np.bool_), "ranks": np.asarray(ranks, dtype=np.float64),
+              "domain_nodes": domain_nodes.astype(np.uint32), "domain_offsets": domain_offsets,
+              "domain_order": domain_order,
+              "name_order": np.array(sorted(range(len(snapshot)), key=snapshot.nodes.__getitem__), dtype=np.uint32)}
+    # A node without a domain has the domain None, which is kept as an empty name
+    arrays["nodes"], arrays["node_offsets"] = encode_strings(snapshot.nodes)
+    arrays["domains"], arrays["domain_name_offsets"] = encode_strings([domain or "" for domain in snapshot.domains])
+
+    contents, offset = {}, 0
+    for name, array in arrays.items():
+        contents[name] = {"dtype": array.dtype.str, "length": len(array), "offset": offset}
+        offset += -(-array.nbytes // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+    table = json.dumps({"generation": generation, "edges": graph.number_of_edges(), "arrays": contents}).encode()
+    start = -(-(INDEX_HEADER.size + len(table)) // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, len(table)))
+        f.write(table)
+        for name, array in arrays.items():
+            f.seek(start + contents[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+    os.replace(f"{path}.tmp", path)
+    return os.path.getsize(path)
+
+
+class MappedGraph:
+    """
+    Read only graph of an index file that is mapped to memory. Opening it reads the header and the domain names only,
+    the pages of the arrays are read by the OS when they are first used, so it answers the top n and ranking queries
+    right away, whatever the size of the graph, and does not copy the graph to the memory of the process.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: string. The path of an index of save_index
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, table_length = INDEX_HEADER.unpack_from(self._map)
+        if magic != INDEX_MAGIC or version != INDEX_FORMAT_VERSION:
+            log.error(f"Unknown format of the graph index {path}")
+            raise ValueError(f"Unknown format of the graph index {path}")
+
+        table = json.loads(self._map[INDEX_HEADER.size:INDEX_HEADER.size + table_length])
+        start = -(-(INDEX_HEADER.size + table_length) // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+        self.generation: Optional[float] = table["generation"]
+        self._edges = table["edges"]
+        self._arrays = {name: np.frombuffer(self._map, dtype=np.dtype(array["dtype"]), count=array["length"],
+                                            offset=start + array["offset"])
+                        for name, array in table["arrays"].items()}
+        # The names are decoded from the map when they are needed, not all at once
+        self._nodes_start = start + table["arrays"]["nodes"]["offset"]
+        self._node_offsets = self._arrays["node_offsets"]
+        self.domains = decode_strings(self._arrays["domains"], self._arrays["domain_name_offsets"])
+        # The domains that have url nodes, the nodes without a domain are not in it
+        self._domain_order = self._arrays["domain_order"].tolist()
+        self._domain_ids = {self.domains[domain_id]: domain_id for domain_id in self._domain_order}
+
+    def __len__(self) -> int:
+        return len(self._arrays["ranks"])
+
+    def number_of_nodes(self) -> int:
+        return len(self)
+
+    def number_of_edges(self) -> int:
+        return self._edges
+
+    def node(self, node_id: int) -> str:
+        """
+        :param node_id: int. The id of the node in the index
+        :return: string. The node
+        """
+        start = self._nodes_start
+        return self._map[start + int(self._node_offsets[node_id]):start + int(self._node_offsets[node_id + 1])].decode()
+
+    def find(self, node: str) -> Optional[int]:
+        """
+        Binary search of the node in the node ids sorted by name
+        :param node: string. The node
+        :return: int. The id of the node, None if it is not in the graph
+        """
+        name_order = self._arrays["name_order"]
+        low, high = 0, len(name_order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.node(int(name_order[middle])) < node:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(name_order) and self.node(int(name_order[low])) == node:
+            return int(name_order[low])
+        return None
+
+    def neighbors(self, node: str) -> List[str]:
+        """
+        :param node: string. The node
+        :return: List of the neighbors of the node
+        """
+        node_id = self.find(node)
+        if node_id is None:
+            raise KeyError(node)
+        indptr = self._arrays["indptr"]
+        neighbors = self._arrays["indices"][indptr[node_id]:indptr[node_id + 1]]
+        return [self.node(neighbor) for neighbor in neighbors.tolist()]
+
+    def get_rank(self, node: str) -> float:
+        node_id = self.find(node)
+        if node_id is None:
+            raise KeyError(node)
+        return self._arrays["ranks"][node_id].item()
+
+    def get_top_n_for_each_domain(self, n=5, domains: List[str] = None) -> List[Dict[str, List[str]]]:
+        """
+        Get the top n most important nodes in each domain, read from the url nodes of the domains sorted by rank. The
+        domains are in the same order as the ones of WebGraph
+        :param n: int. The number of nodes to return
+        :param domains: List of domains to return. All the domains if None
+        :return: list of dict: {domain: List of nodes sorted by rank}
+        """
+        offsets = self._arrays["domain_offsets"]
+        if domains is None:
+            domain_ids = self._domain_order
+        else:
+            domain_ids = [self._domain_ids.get(domain) for domain in domains]
+
+        top_n = []
+        for i, domain_id in enumerate(domain_ids):
+            if domain_id is None:
+                top_n.append({domains[i]: []})
+                continue
+            start = int(offsets[domain_id])
+            node_ids = self._arrays["domain_nodes"][start:min(start + n, int(offsets[domain_id + 1]))]
+            top_n.append({self.domains[domain_id]: [self.node(node_id) for node_id in node_ids.tolist()]})
+        return top_n
+
+    def get_ranking(self, top_k: int = None) -> dict:
+        """
+        :param top_k: int. Return only the scores of the top k url nodes of each domain
+        :return: dict: {node: rank}
+        """
+        ranks = self._arrays["ranks"]
+        if top_k is None:
+            return {self.node(node_id): rank for node_id, rank in enumerate(ranks.tolist())}
+
+        offsets, domain_nodes = self._arrays["domain_offsets"].tolist(), self._arrays["domain_nodes"]
+        node_ids = [node_id for domain_id in self._domain_order
+                    for node_id in domain_nodes[offsets[domain_id]:min(offsets[domain_id] + top_k,
+                                                                        offsets[domain_id + 1])].tolist()]
+        return {self.node(node_id): ranks[node_id].item() for node_id in node_ids}
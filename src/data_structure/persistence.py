@@ -0,0 +1,425 @@
+import io
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import logging as log
+
+import numpy as np
+
+import src.utils.constants as consts
+from src.data_structure.factory import GRAPH_BACKENDS
+from src.data_structure.graph.utils import GraphTables, decode_strings, encode_strings
+from src.data_structure.mapped_graph import save_index
+from src.utils.config import Config
+
+SNAPSHOT_FORMAT_VERSION = 1
+LOG_MAGIC = b"GRAPHLOG"
+LOG_FORMAT_VERSION = 1
+LOG_HEADER = struct.Struct("<8sIQ")  # magic, format version, sequence of the last record folded into the snapshot
+LOG_RECORD_HEADER = struct.Struct("<QQI")  # sequence, length of the arrays, crc32 of the arrays
+
+
+def encode_tables(tables: GraphTables) -> Dict[str, np.ndarray]:
+    """
+    :param tables: GraphTables
+    :return: dict of the numpy arrays of the tables: the node, domain and type names as utf-8 tables, the domain and
+     type codes of the nodes, the edges as pairs of node indexes and the cache as node indexes
+    """
+    arrays = {"format": np.array([SNAPSHOT_FORMAT_VERSION]), "node_domains": tables.node_domains,
+              "node_types": tables.node_types, "edges": tables.edges}
+    for name, strings in (("nodes", tables.nodes), ("domains", tables.domains), ("types", tables.types),
+                          ("cache_types", list(tables.cache))):
+        arrays[name], arrays[f"{name}_offsets"] = encode_strings(strings)
+    cache = list(tables.cache.values())
+    arrays["cache_offsets"] = np.cumsum([0] + [len(ids) for ids in cache], dtype=np.int64)
+    arrays["cache_nodes"] = np.concatenate(cache) if cache else np.zeros(0, dtype=np.uint32)
+    return arrays
+
+
+def decode_tables(arrays, path: str) -> GraphTables:
+    """
+    :param arrays: The arrays of encode_tables, like an open npz file
+    :param path: string. The file of the arrays, for the errors
+    :return: GraphTables
+    """
+    if int(arrays["format"][0]) != SNAPSHOT_FORMAT_VERSION:
+        log.error(f"Unknown format of the graph tables of {path}: {int(arrays['format'][0])}")
+        raise ValueError(f"Unknown format of the graph tables of {path}")
+
+    nodes, domains, types, cache_types = (decode_strings(arrays[name], arrays[f"{name}_offsets"])
+                                          for name in ("nodes", "domains", "types", "cache_types"))
+    offsets, cache_nodes = arrays["cache_offsets"].tolist(), arrays["cache_nodes"]
+    cache = {node_type: cache_nodes[start:end] for node_type, start, end in zip(cache_types, offsets, offsets[1:])}
+    return GraphTables(nodes, domains, types, arrays["node_domains"], arrays["node_types"], arrays["edges"], cache)
+
+
+def save_snapshot(path: str, graph, compress: bool = True, generation: float = None, log_sequence: int = 0) -> int:
+    """
+    Save the graph as a snapshot of numpy arrays, see encode_tables. The file is replaced at once, so a reader never
+    sees half of it
+    :param path: string. The path of the snapshot
+    :param graph: WebGraph or ArrayGraph
+    :param compress: bool. Compress the arrays with zip
+    :param generation: float. Identifies the snapshot, like the time it was saved. The index of the graph that is saved
+     with the snapshot has the same generation
+    :param log_sequence: int. The sequence of the last record of the graph log that the graph holds
+    :return: int. The size of the file
+    """
+    arrays = encode_tables(graph.to_tables())
+    arrays["generation"] = np.array([np.nan if generation is None else generation])
+    arrays["log_sequence"] = np.array([log_sequence], dtype=np.uint64)
+
+    # numpy adds the .npz suffix to file names, not to open files
+    with open(f"{path}.tmp", 'wb') as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+    os.replace(f"{path}.tmp", path)
+    return os.path.getsize(path)
+
+
+def load_tables(path: str) -> GraphTables:
+    """
+    :param path: string. The path of a snapshot
+    :return: GraphTables of the snapshot
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        return decode_tables(arrays, path)
+
+
+def read_generation(path: str) -> Optional[float]:
+    """
+    :param path: string. The path of a snapshot
+    :return: float. The generation of the snapshot, None if it has none or there is no snapshot
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as arrays:
+        if "generation" not in arrays.files or np.isnan(arrays["generation"][0]):
+            return None
+        return float(arrays["generation"][0])
+
+
+def read_log_sequence(path: str) -> int:
+    """
+    :param path: string. The path of a snapshot
+    :return: int. The sequence of the last record of the graph log that the snapshot holds, 0 if there is no snapshot
+    """
+    if not os.path.exists(path):
+        return 0
+    with np.load(path, allow_pickle=False) as arrays:
+        return int(arrays["log_sequence"][0]) if "log_sequence" in arrays.files else 0
+
+
+def graph_from_tables(tables: GraphTables, config: Config = None):
+    """
+    :param tables: GraphTables
+    :param config: Config
+    :return: The graph of the tables in the graph data structure of the graph section of the config
+    """
+    config = config or Config()
+    backend = config.get(consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN,
+                         default_value=consts.NETWORKX_GRAPH_BACKEND_TOKEN)
+    if backend not in GRAPH_BACKENDS:
+        raise ValueError(f"Unknown graph backend: {backend}")
+    return GRAPH_BACKENDS[backend].from_tables(tables, config=config)
+
+
+def load_snapshot(path: str, config: Config = None):
+    """
+    Load a snapshot into the graph data structure of the graph section of the config, whichever saved it
+    :param path: string. The path of the snapshot
+    :param config: Config
+    :return: WebGraph or ArrayGraph, None if there is no snapshot
+    """
+    if not os.path.exists(path):
+        return None
+    start = time.perf_counter()
+    graph = graph_from_tables(load_tables(path), config=config)
+    log.info(f"Loaded the graph snapshot {path} in {time.perf_counter() - start:.2f}s")
+    return graph
+
+
+class GraphLog:
+    """
+    Append only log of the graphs of the builds of a workspace. A build appends the graph it crawled as one record
+    instead of rewriting the whole graph, the records are replayed on top of the snapshot on startup, and they are
+    dropped once a snapshot that holds them was saved. A reset record holds a graph that replaces the graph of the
+    workspace, so the records and the snapshot before it are not replayed. Every record has a sequence number and a checksum, so a record
+    that was cut short by a crash is found and dropped when the log is opened. The log can be shared between threads.
+    """
+
+    def __init__(self, path: str, compress: bool = True):
+        """
+        :param path: string. The path of the log. It is created if it does not exist
+        :param compress: bool. Compress the records
+        """
+        self.path = path
+        self._compress = compress
+        self._lock = threading.Lock()
+        if not os.path.exists(path) or os.path.getsize(path) < LOG_HEADER.size:
+            self._rewrite(0, [])
+        self._base, self._last_sequence, end = self._scan()
+        if end < os.path.getsize(path):
+            log.warning(f"Dropped the unfinished record at the end of the graph log {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        self._file = open(path, 'ab')
+
+    @property
+    def last_sequence(self) -> int:
+        """The sequence of the last record, or of the last record that was dropped if the log is empty"""
+        return self._last_sequence
+
+    @property
+    def size(self) -> int:
+        """The size of the records in bytes"""
+        with self._lock:
+            return self._file.tell() - LOG_HEADER.size
+
+    def append(self, graph, reset: bool = False) -> int:
+        """
+        Append the graph as a record and wait until it is on the disk
+        :param graph: WebGraph or ArrayGraph
+        :param reset: bool. The graph replaces the graph of the records before it, instead of being merged into it
+        :return: int. The sequence of the record
+        """
+        arrays = encode_tables(graph.to_tables())
+        arrays["reset"] = np.array([reset])
+        buffer = io.BytesIO()
+        (np.savez_compressed if self._compress else np.savez)(buffer, **arrays)
+        data = buffer.getvalue()
+        with self._lock:
+            sequence = self._last_sequence + 1
+            self._file.write(LOG_RECORD_HEADER.pack(sequence, len(data), zlib.crc32(data)) + data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_sequence = sequence
+        return sequence
+
+    def read(self, after: int = 0) -> Iterator[Tuple[int, GraphTables, bool]]:
+        """
+        :param after: int. Skip the records up to this sequence, like the ones a snapshot holds
+        :return: generator of the sequence, the GraphTables and the reset flag of the records, in the order they were
+         appended
+        """
+        # The records appended while the log is read are not read
+        with self._lock:
+            self._file.flush()
+            end = self._file.tell()
+        for sequence, data in self._records(after, end):
+            with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+                yield sequence, decode_tables(arrays, self.path), bool(arrays["reset"][0])
+
+    def replay(self, graph, after: int = 0, config: Config = None):
+        """
+        Merge the records into the graph. A reset record replaces the graph
+        :param graph: WebGraph or ArrayGraph to merge into. A new graph is created if None and there are records
+        :param after: int. Skip the records up to this sequence
+        :param config: Config
+        :return: The graph, None if there was no graph and no record
+        """
+        count, start = 0, time.perf_counter()
+        for _, tables, reset in self.read(after):
+            record = graph_from_tables(tables, config=config)
+            if graph is None or reset:
+                graph = record
+            else:
+                graph.merge_graph(record)
+            count += 1
+        if count:
+            log.info(f"Replayed {count} records of the graph log {self.path} in {time.perf_counter() - start:.2f}s")
+        return graph
+
+    def compact(self, through: int) -> None:
+        """
+        Drop the records up to a sequence, once a snapshot that holds them was saved. The records that were appended
+        after them are kept
+        :param through: int. The sequence of the last record to drop
+        :return:
+        """
+        with self._lock:
+            self._file.flush()
+            records = list(self._records(through, self._file.tell()))
+            self._file.close()
+            self._rewrite(max(through, self._base), records)
+            self._base = max(through, self._base)
+            self._file = open(self.path, 'ab')
+        log.info(f"Compacted the graph log {self.path} through record {through}, {len(records)} records are left")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def _records(self, after: int, end: int) -> Iterator[Tuple[int, bytes]]:
+        """
+        :param after: int. Skip the records up to this sequence
+        :param end: int. The position to stop at
+        :return: generator of the sequence and the data of the valid records
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(LOG_HEADER.size)
+            while f.tell() < end:
+                header = f.read(LOG_RECORD_HEADER.size)
+                if len(header) < LOG_RECORD_HEADER.size:
+                    return
+                sequence, length, checksum = LOG_RECORD_HEADER.unpack(header)
+                if sequence <= after:
+                    f.seek(length, os.SEEK_CUR)
+                    continue
+                data = f.read(length)
+                if len(data) < length or zlib.crc32(data) != checksum:
+                    log.error(f"Corrupted record {sequence} of the graph log {self.path}, the rest of the log is "
+                              f"skipped")
+                    return
+                yield sequence, data
+
+    def _scan(self) -> Tuple[int, int, int]:
+        """
+        :return: The sequence of the header, the sequence of the last whole record and the end of that record
+        """
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            magic, version, base = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+            if magic != LOG_MAGIC or version != LOG_FORMAT_VERSION:
+                log.error(f"Unknown format of the graph log {self.path}")
+                raise ValueError(f"Unknown format of the graph log {self.path}")
+            last, end = base, f.tell()
+            while True:
+                header = f.read(LOG_RECORD_HEADER.size)
+                if len(header) < LOG_RECORD_HEADER.size:
+                    break
+                sequence, length, _ = LOG_RECORD_HEADER.unpack(header)
+                if end + LOG_RECORD_HEADER.size + length > size:
+                    break
+                f.seek(length, os.SEEK_CUR)
+                last, end = sequence, f.tell()
+        return base, last, end
+
+    def _rewrite(self, base: int, records: list) -> None:
+        """
+        Replace the log at once with the given records
+        :param base: int. The sequence the records start after
+        :param records: List of the sequence and the data of the records
+        :return:
+        """
+        with open(f"{self.path}.tmp", 'wb') as f:
+            f.write(LOG_HEADER.pack(LOG_MAGIC, LOG_FORMAT_VERSION, base))
+            for sequence, data in records:
+                f.write(LOG_RECORD_HEADER.pack(sequence, len(data), zlib.crc32(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class SnapshotWriter:
+    """
+    Save the snapshots of the graphs in a background thread, so a build does not wait for the disk. When a graph is
+    submitted for a path that has a snapshot waiting to be written, only the newer graph is written. The read only index
+    of the graph can be saved with its snapshot. The writer can be shared between threads.
+    """
+
+    def __init__(self, compress: bool = True):
+        """
+        :param compress: bool. Compress the snapshots
+        """
+        self._compress = compress
+        self._pending = OrderedDict()  # path -> (graph, index path, log sequence, callbacks to run once it was written)
+        self._writing = None  # The path of the snapshot being written
+        self._writing_graph = None  # The graph being written
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: str, graph, on_written: Callable[[], None] = None, index_path: str = None,
+               log_sequence: int = 0) -> None:
+        """
+        Queue the snapshot of a graph. The graph must not be changed until it was written
+        :param path: string. The path of the snapshot
+        :param graph: WebGraph or ArrayGraph
+        :param on_written: function called after the snapshot, or a newer snapshot of the same path, was written. It is
+         not called when the write failed
+        :param index_path: string. The path to save the index of the graph to, after its snapshot. No index if None
+        :param log_sequence: int. The sequence of the last record of the graph log that the graph holds
+        :return:
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The snapshot writer is closed")
+            *_, callbacks = self._pending.pop(path, (None, None, 0, []))
+            self._pending[path] = (graph, index_path, log_sequence, callbacks + ([on_written] if on_written else []))
+            self._condition.notify_all()
+
+    def flush(self, timeout: float = None, path: str = None) -> bool:
+        """
+        Wait until the queued snapshots were written
+        :param timeout: float. The maximum number of seconds to wait, forever if None
+        :param path: string. Wait for the snapshot of this path only
+        :return: bool. True if nothing is left to write
+        """
+        def is_written():
+            if path is None:
+                return not self._pending and self._writing is None
+            return path not in self._pending and self._writing != path
+
+        with self._condition:
+            return self._condition.wait_for(is_written, timeout)
+
+    def wait(self, graph, timeout: float = None) -> bool:
+        """
+        Wait until the graph is neither queued nor being written, so it can be changed
+        :param graph: WebGraph or ArrayGraph
+        :param timeout: float. The maximum number of seconds to wait, forever if None
+        :return: bool. True if the writer does not use the graph anymore
+        """
+        def is_released():
+            return self._writing_graph is not graph and all(entry[0] is not graph for entry in self._pending.values())
+
+        with self._condition:
+            return self._condition.wait_for(is_released, timeout)
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Write the queued snapshots and stop the thread
+        :param timeout: float. The maximum number of seconds to wait for the writes
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                path, (graph, index_path, log_sequence, callbacks) = self._pending.popitem(last=False)
+                self._writing, self._writing_graph = path, graph
+            try:
+                start, generation = time.perf_counter(), time.time()
+                size = save_snapshot(path, graph, compress=self._compress, generation=generation,
+                                     log_sequence=log_sequence)
+                log.info(f"Saved the graph snapshot {path} ({size / 2 ** 20:.1f} MB) in "
+                         f"{time.perf_counter() - start:.2f}s")
+                if index_path:
+                    start = time.perf_counter()
+                    size = save_index(index_path, graph, generation=generation)
+                    log.info(f"Saved the graph index {index_path} ({size / 2 ** 20:.1f} MB) in "
+                             f"{time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                log.error(f"Could not save the graph snapshot {path}: {e}")
+                callbacks = []
+            try:
+                for callback in callbacks:
+                    callback()
+            except Exception as e:
+                log.error(f"A callback of the graph snapshot {path} failed: {e}")
+            finally:
+                with self._condition:
+                    self._writing, self._writing_graph = None, None
+                    self._condition.notify_all()
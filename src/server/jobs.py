@@ -0,0 +1,220 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+import logging as log
+
+import src.utils.constants as consts
+
+QUEUED_STATUS = "queued"
+RUNNING_STATUS = "running"
+DONE_STATUS = "done"
+FAILED_STATUS = "failed"
+CANCELLED_STATUS = "cancelled"
+FINISHED_STATUSES = (DONE_STATUS, FAILED_STATUS, CANCELLED_STATUS)
+
+MAX_FINISHED_JOBS = 100  # The number of finished jobs whose status and result are kept
+
+
+class BuildJob:
+    """
+    A graph build that runs in the background. The build reports its crawlers and frontier to the job, which reads its
+    progress from them while it runs
+    """
+
+    def __init__(self, content: dict, workspace: str = consts.DEFAULT_WORKSPACE):
+        """
+        :param content: The build request, like {seeds: [seed1, seed2, ...], nodes: [email]}
+        :param workspace: string. The workspace the graph of the build is published to
+        """
+        self.id = uuid.uuid4().hex
+        self.content = content
+        self.workspace = workspace
+        self.status = QUEUED_STATUS
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self._crawlers = []
+        self._frontier = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def attach(self, crawlers: list, frontier) -> None:
+        """
+        Follow the progress of the crawlers of the build. A job that was cancelled already stops them right away
+        :param crawlers: List of WebSpider
+        :param frontier: The Frontier shared by the crawlers
+        :return:
+        """
+        with self._lock:
+            self._crawlers, self._frontier = list(crawlers), frontier
+        if self.cancelled:
+            self._stop_crawlers()
+
+    def cancel(self) -> bool:
+        """
+        Cancel the job. A queued job never starts and a running job stops its crawlers, which finish the pages they are
+        fetching. The graph of a cancelled build is not saved, but its checkpoint is kept, so it can be resumed
+        :return: bool. False if the job has finished already
+        """
+        with self._lock:
+            if self.is_finished:
+                return False
+            self._cancelled.set()
+            if self.status == QUEUED_STATUS:
+                self._finish(CANCELLED_STATUS)
+        self._stop_crawlers()
+        return True
+
+    def get_progress(self) -> dict:
+        """
+        :return: dict with the number of pages that were fetched, the number of urls waiting in the frontier and the
+         number of urls that failed
+        """
+        with self._lock:
+            crawlers, frontier = self._crawlers, self._frontier
+        return {"pages": sum(len(crawler.fetched_urls) for crawler in crawlers),
+                "queue": len(frontier) if frontier is not None else 0,
+                "errors": sum(crawler.errors for crawler in crawlers)}
+
+    def get_fetched_urls(self, offsets: List[int]) -> List[str]:
+        """
+        The urls that the crawlers fetched since the given offsets. The offsets are moved to the end
+        :param offsets: The number of urls of each crawler that were read already. Extended when it is shorter than
+         the number of crawlers
+        :return: List of urls
+        """
+        with self._lock:
+            crawlers = self._crawlers
+        offsets.extend([0] * (len(crawlers) - len(offsets)))
+        urls = []
+        for i, crawler in enumerate(crawlers):
+            fetched = crawler.fetched_urls
+            end = len(fetched)
+            urls.extend(fetched[offsets[i]:end])
+            offsets[i] = end
+        return urls
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until the job is finished
+        :param timeout: float. The maximum number of seconds to wait, forever if None
+        :return: bool. True if the job is finished
+        """
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {"job_id": self.id, "workspace": self.workspace, "status": self.status, "created": self.created,
+                "started": self.started, "finished": self.finished, "progress": self.get_progress(), "error": self.error}
+
+    def _run(self, build: Callable) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.status, self.started = RUNNING_STATUS, time.time()
+
+        log.info(f"Build job {self.id} started")
+        try:
+            result = build(self)
+            with self._lock:
+                self.result = result
+                self._finish(CANCELLED_STATUS if self.cancelled else DONE_STATUS)
+        except Exception as e:
+            log.error(f"Build job {self.id} failed: {e}")
+            with self._lock:
+                self.error = f"{e}"
+                self._finish(FAILED_STATUS)
+        log.info(f"Build job {self.id} finished with status {self.status}")
+
+    def _finish(self, status: str) -> None:
+        self.status, self.finished = status, time.time()
+        self._done.set()
+
+    def _stop_crawlers(self) -> None:
+        with self._lock:
+            crawlers = self._crawlers
+        for crawler in crawlers:
+            crawler.stop()
+
+
+class BuildJobManager:
+    """
+    Run the graph builds in background threads, up to `max_builds` at a time. The builds of one workspace run one after
+    the other, so each of them starts from the graph its previous build published. The jobs are kept by their id until
+    MAX_FINISHED_JOBS newer jobs have finished. The manager can be shared between threads.
+    """
+
+    def __init__(self, max_builds: int = 1):
+        """
+        :param max_builds: int. The number of builds of different workspaces that run at the same time
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_builds), thread_name_prefix="build")
+        self._jobs = OrderedDict()  # job id -> BuildJob, in the order they were submitted
+        self._waiting = {}  # workspace -> deque of (BuildJob, build) waiting for the running build of the workspace
+        # Reentrant, since a build that is over before its callback is added starts the next one in _start
+        self._lock = threading.RLock()
+
+    def submit(self, content: dict, build: Callable, workspace: str = consts.DEFAULT_WORKSPACE) -> BuildJob:
+        """
+        Queue a build
+        :param content: The build request
+        :param build: function that gets the BuildJob, runs the build and returns its result
+        :param workspace: string. The workspace of the build
+        :return: BuildJob
+        """
+        job = BuildJob(content, workspace=workspace)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+            if workspace in self._waiting:
+                # Another build of the workspace is running, this one starts when it is over
+                self._waiting[workspace].append((job, build))
+            else:
+                self._waiting[workspace] = deque()
+                self._start(job, build)
+        log.info(f"Build job {job.id} of workspace {workspace} queued")
+        return job
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[BuildJob]:
+        """
+        :param job_id: string. The id of the job to cancel
+        :return: The BuildJob, None if there is no such job
+        """
+        job = self.get(job_id)
+        if job is not None and job.cancel():
+            log.info(f"Build job {job_id} cancelled")
+        return job
+
+    def _start(self, job: BuildJob, build: Callable) -> None:
+        future = self._executor.submit(job._run, build)
+        future.add_done_callback(lambda _: self._start_next(job.workspace))
+
+    def _start_next(self, workspace: str) -> None:
+        with self._lock:
+            waiting = self._waiting[workspace]
+            if waiting:
+                self._start(*waiting.popleft())
+            else:
+                del self._waiting[workspace]
+
+    def _forget_finished_jobs(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
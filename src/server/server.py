@@ -1,5 +1,7 @@
 import asyncio
-from typing import List, Dict
+import atexit
+import os
+from typing import ContextManager, Iterator, List, Dict, Optional
 from joblib import Parallel, delayed
 
 from src.data_structure.graph.callbacks.callback import GraphCallback
@@ -8,29 +10,93 @@ from src.data_structure.graph.callbacks import CALLBACKS
 from src.utils.config import Config
 from src.utils.singleton import singleton
 from src.crawler.crawler import WebSpider
+from src.crawler.frontier import Frontier
+from src.crawler.retry import RetryPolicy
+from src.crawler.robots import RobotsCache
+from src.crawler.scheduler import HostScheduler
+from src.crawler.parsers.pool import ParserPool
 import src.utils.constants as consts
-from src.data_structure.graph.graph import combine_graphs, load_graph, save_graph, serialize_graph
+from src.crawler.checkpoint import CrawlCheckpoint
+from src.data_structure.factory import combine_graphs, create_graph
+from src.data_structure.graph.graph import generate_gml, render_graph_html
+from src.server.jobs import BuildJob, BuildJobManager
+from src.server.workspaces import Workspace, WorkspaceRegistry, validate_workspace_name
+from src.utils.tools import get_url_cache_stats
 import logging as log
 
 
 @singleton
 class ServerInterface(object):
+    """
+    The builds do not share any state through the server: every build crawls into its own graph and publishes it to
+    its workspace when it is over. The requests read the published graphs without locks
+    """
+
     def __init__(self, **kwargs):
         self._config: Config = kwargs.get('config', Config())
-        self.crawlers = None
+        parse_workers = self._config.get(consts.SYSTEM_SECTION, consts.NUMBER_OF_PARSE_WORKERS_CONFIG_TOKEN,
+                                         default_value=0, return_as_string=False)
+        # Parse the html in worker processes only when it is configured. Otherwise the crawlers parse in threads
+        self._parser_pool = ParserPool(workers=parse_workers) if parse_workers else None
+        if self._parser_pool:
+            # The server lives until the process exits, so the workers are stopped with it
+            atexit.register(self._parser_pool.shutdown)
+        self._workspaces = WorkspaceRegistry()
         try:
-            self.graph = load_graph(consts.GRAPH_OUTPUT_FILE_PATH)
-        except Exception:
-            self.graph = None
+            self._workspaces.load()
+        except Exception as e:
+            log.error(f"Could not load the saved workspaces: {e}")
         self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        max_builds = self._config.get(consts.SYSTEM_SECTION, consts.MAX_BUILDS_CONFIG_TOKEN, default_value=1,
+                                      return_as_string=False)
+        self._jobs = BuildJobManager(max_builds=max_builds)
 
-    async def build_graph(self, content: dict) -> dict:
+    def read_workspace(self, name: str = consts.DEFAULT_WORKSPACE) -> ContextManager[Optional[Workspace]]:
         """
-        The method starts the crawling process and returns the graph
-        Build a graph from the given seeds and scrapers
-        :param content: request in the format of {seeds: [seed1, seed2, ...], scrapers: [scraper1, scraper2, ...]}
-        :return: graph like structure
+        Read the published graph of a workspace. The builds do not change the graph until the reader leaves, so it is
+        only read inside the with block
+        :param name: string. The name of the workspace
+        :return: context manager of the Workspace, None if nothing was published to it
         """
+        return self._workspaces.read(name)
+
+    def list_workspaces(self) -> List[dict]:
+        workspaces = []
+        for name in [workspace.name for workspace in self._workspaces.list()]:
+            with self._workspaces.read(name) as published:
+                workspaces.append(published.to_dict())
+        return workspaces
+
+    def start_build(self, content: dict) -> BuildJob:
+        """
+        Build a graph in the background
+        :param content: request in the format of {seeds: [seed1, seed2, ...], scrapers: [scraper1, scraper2, ...],
+         workspace: name, replace: bool}
+        :return: BuildJob. Its id is used to follow, stream and cancel the build
+        """
+        workspace = validate_workspace_name(content.get(consts.WORKSPACE_TOKEN, consts.DEFAULT_WORKSPACE))
+        return self._jobs.submit(content, build=lambda job: asyncio.run(self.build_graph(content, job=job)),
+                                 workspace=workspace)
+
+    def get_build(self, job_id: str) -> Optional[BuildJob]:
+        return self._jobs.get(job_id)
+
+    def cancel_build(self, job_id: str) -> Optional[BuildJob]:
+        return self._jobs.cancel(job_id)
+
+    async def build_graph(self, content: dict, job: BuildJob = None) -> dict:
+        """
+        The method starts the crawling process and returns a summary of the build
+        Build a graph from the given seeds and scrapers and merge it into the graph of the workspace of the request, or
+        replace that graph
+        :param content: request in the format of {seeds: [seed1, seed2, ...], scrapers: [scraper1, scraper2, ...],
+         workspace: name, replace: bool}
+        :param job: BuildJob that follows the progress of the build and can cancel it
+        :return: dict with the workspace, the version that was published, the size of its graph and the stats of the
+         crawl. None if the build was cancelled
+        """
+        workspace = validate_workspace_name(content.get(consts.WORKSPACE_TOKEN, consts.DEFAULT_WORKSPACE))
+        paths = self._workspaces.paths(workspace)
         seeds = content.get(consts.SEEDS_CONFIG_TOKEN, None)
         if not seeds:
             # If the user didn't specify any seeds, use the config default to start the crawling
@@ -39,28 +105,122 @@ class ServerInterface(object):
         nodes_types = content.get(consts.REQUEST_NODES_TOKEN, None)
         callbacks = self._get_callbacks(nodes_types=nodes_types)
 
-        self.crawlers = [
-            WebSpider(callbacks=callbacks,
-                      url_filter=UrlFilter(self._config.get_section(consts.FILTERS_SECTION)),
-                      start_seed=seed, config=self._config)
+        # All the crawlers share one filter and frontier so a url reachable from several seeds is fetched once
+        obey_robots = self._config.get(consts.CRAWLER_SECTION, consts.OBEY_ROBOTS_CONFIG_TOKEN, default_value=True,
+                                       return_as_string=False)
+        robots = RobotsCache(self._config) if obey_robots else None
+        url_filter = UrlFilter(self._config.get_section(consts.FILTERS_SECTION), robots=robots)
+        checkpoint = self._create_checkpoint(paths.checkpoint)
+        frontier = Frontier(url_filter, checkpoint=checkpoint, scheduler=HostScheduler(self._config))
+        resumed_graph = create_graph(config=self._config)
+        if checkpoint and content.get(consts.RESUME_TOKEN, False):
+            # Continue the last crawl from its checkpoint instead of fetching its pages again
+            queue, seen, records = checkpoint.load()
+            frontier.restore(queue, seen)
+            resumed_graph.add_many(records)
+        elif checkpoint:
+            checkpoint.clear()
+
+        frontier.add_seeds(seeds)
+        retry_policy = RetryPolicy(self._config)
+        crawlers = [
+            WebSpider(callbacks=callbacks, url_filter=url_filter, start_seed=seed, config=self._config,
+                      parser_pool=self._parser_pool, frontier=frontier, checkpoint=checkpoint,
+                      retry_policy=retry_policy)
             for seed in seeds]
+        if job is not None:
+            job.attach(crawlers, frontier)
 
         # Start a separate thread for each crawler to start crawling from a different seed
         n_jobs = self._config.get(consts.SYSTEM_SECTION, consts.NUMBER_OF_JOBS_CONFIG_TOKEN, return_as_string=False)
         res = Parallel(n_jobs=n_jobs, backend="threading")(
-            delayed(self._async_crawling)(self.loop, crawler=crawler) for crawler in self.crawlers
+            delayed(self._async_crawling)(self.loop, crawler=crawler) for crawler in crawlers
         )
 
-        self.graph = combine_graphs(res)
-        save_graph(consts.GRAPH_OUTPUT_FILE_PATH, self.graph)
-        return serialize_graph(self.graph)
+        log.info(f"Requests of the build: {retry_policy.stats}. Dropped urls: {url_filter.stats}. "
+                 f"Parsed urls cache: {get_url_cache_stats()}")
+        if robots:
+            robots.close()
+        if job is not None and job.cancelled:
+            # The published graph of the workspace is kept. The checkpoint is kept as well, to resume the crawl
+            if checkpoint:
+                checkpoint.close()
+            log.info(f"The build of workspace {workspace} was cancelled")
+            return None
+        # The readers switch to the new graph at once, and keep reading the previous one until then. The graph of the
+        # build is in the log of the workspace once it was merged or replaced, so there is nothing left to resume
+        graph = combine_graphs(res + [resumed_graph], config=self._config)
+        if content.get(consts.REPLACE_TOKEN, False):
+            published = self._workspaces.replace(workspace, graph)
+        else:
+            published = self._workspaces.merge(workspace, graph)
+        self._clear_checkpoint(checkpoint)()
+        # The job keeps a summary only, the graph of the workspace is read from its endpoints
+        return {"workspace": workspace, "version": published.version,
+                "nodes": published.graph.number_of_nodes(), "edges": published.graph.number_of_edges(),
+                "pages": sum(len(crawler.fetched_urls) for crawler in crawlers), "requests": retry_policy.stats,
+                "dropped": url_filter.stats}
 
-    def get_top_urls(self, n=5) -> list:
+    def get_top_urls(self, n=5, domains: List[str] = None, workspace: str = consts.DEFAULT_WORKSPACE) -> list:
         """
         Get the top urls from the crawlers for each domain
-        :return: list of dict {domain: List of urls}
+        :param n: int. The number of urls to return for each domain
+        :param domains: List of domains to return. All the domains if None
+        :param workspace: string. The workspace whose graph is read
+        :return: list of dict {domain: List of urls}. None if nothing was published to the workspace
+        """
+        with self._workspaces.read(workspace) as published:
+            if published is None:
+                return None
+            return published.ranked.get_top_n_for_each_domain(n, domains=domains)
+
+    def export_gml(self, workspace: str = consts.DEFAULT_WORKSPACE) -> Optional[Iterator[str]]:
+        """
+        Export the graph of the workspace when it is asked for, instead of writing it after every build
+        :param workspace: string. The workspace whose graph is exported
+        :return: generator of the GML lines. None if nothing was published to the workspace
+        """
+        if self._workspaces.get(workspace) is None:
+            return None
+
+        def lines():
+            # The graph is read while the response is streamed
+            with self._workspaces.read(workspace) as published:
+                yield from generate_gml(published.graph)
+        return lines()
+
+    def render_html(self, workspace: str = consts.DEFAULT_WORKSPACE) -> Optional[str]:
+        """
+        :param workspace: string. The workspace whose graph is rendered
+        :return: string. The html of the top nodes of the graph. None if nothing was published to the workspace
+        """
+        with self._workspaces.read(workspace) as published:
+            return render_graph_html(published.graph, consts.TEMPLATE_PATH) if published is not None else None
+
+    @staticmethod
+    def _clear_checkpoint(checkpoint: Optional[CrawlCheckpoint]):
+        """
+        :param checkpoint: CrawlCheckpoint of a finished build, None if checkpoints are disabled
+        :return: function that clears and closes the checkpoint
+        """
+        def clear():
+            if checkpoint:
+                checkpoint.clear()
+                checkpoint.close()
+        return clear
+
+    def _create_checkpoint(self, path: str = consts.CHECKPOINT_FILE_PATH) -> CrawlCheckpoint:
+        """
+        Create the checkpoint of the crawl state
+        :param path: string. The checkpoint file of the workspace of the build
+        :return: CrawlCheckpoint or None if checkpoints are disabled
         """
-        return self.graph.get_top_n_for_each_domain(n)
+        interval = self._config.get(consts.CRAWLER_SECTION, consts.CHECKPOINT_INTERVAL_CONFIG_TOKEN,
+                                    default_value=0, return_as_string=False)
+        if not interval:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return CrawlCheckpoint(path, interval=interval)
 
     def _get_callbacks(self, nodes_types: List[str]) -> List[GraphCallback]:
         """
@@ -69,7 +229,7 @@ class ServerInterface(object):
        """
         # If the user didn't specify any scrapers, use the config default
         if not nodes_types:
-            nodes_types = self._config.get_callbacks()
+            nodes_types = self._config.get_nodes_types()
 
         return [CALLBACKS[n_type] for n_type in nodes_types if n_type in CALLBACKS]
 
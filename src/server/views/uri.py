@@ -2,5 +2,9 @@
 #   Backend Endpoints
 # --------------------
 BUILD_GRAPH = '/build'
+BUILD_JOB = '/build/<job_id>'
+BUILD_JOB_RESULTS = '/build/<job_id>/results'
 VISUALIZE_GRAPH = '/visualize'
+EXPORT_GML = '/export/gml'
 GET_TOP_URLS = '/top_urls'
+WORKSPACES = '/workspaces'
@@ -1,10 +1,11 @@
 
-import asyncio
+import json
 
 from flasgger import swag_from
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify
 from flask_cors import CORS
 import logging as log
+from src.server.jobs import BuildJob, DONE_STATUS
 from src.server.server import ServerInterface
 import src.utils.constants as consts
 import src.server.views.uri as uri
@@ -18,9 +19,33 @@ CORS(view)
 def get_graph():
     try:
         content = request.json
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        ret = loop.run_until_complete(ServerInterface().build_graph(content))
+        # The crawl runs in the background. The job id is used to follow its progress, stream it and cancel it
+        job = ServerInterface().start_build(content)
+        resp = jsonify(job.to_dict())
+        resp.status_code = consts.HTTP_ACCEPTED
+    except ValueError as e:
+        # An invalid workspace name
+        resp = jsonify({"Error": f"{e}"})
+        resp.status_code = consts.HTTP_BAD_REQUEST
+    except Exception as e:
+        err = f"{e}"
+        log.error(f"Error: {err}")
+        resp = jsonify({"Error": err})
+        resp.status_code = consts.RESP_SERVER_ERROR_VAL
+
+    return resp
+
+
+@view.route(uri.BUILD_JOB, methods=[consts.GET_TOKEN])
+@swag_from(f'{consts.BUILD_JOB_SCHEMA_FILE_PATH}')
+def get_build(job_id):
+    try:
+        job = ServerInterface().get_build(job_id)
+        if job is None:
+            return _job_not_found(job_id)
+        ret = job.to_dict()
+        if job.status == DONE_STATUS:
+            ret["result"] = job_result(job)
         resp = jsonify(ret)
         resp.status_code = consts.HTTP_OK
     except Exception as e:
@@ -31,23 +56,152 @@ def get_graph():
 
     return resp
 
+
+@view.route(uri.BUILD_JOB, methods=[consts.DELETE_TOKEN])
+@swag_from(f'{consts.CANCEL_BUILD_JOB_SCHEMA_FILE_PATH}')
+def cancel_build(job_id):
+    try:
+        job = ServerInterface().cancel_build(job_id)
+        if job is None:
+            return _job_not_found(job_id)
+        resp = jsonify(job.to_dict())
+        resp.status_code = consts.HTTP_OK
+    except Exception as e:
+        err = f"{e}"
+        log.error(f"Error: {err}")
+        resp = jsonify({"Error": err})
+        resp.status_code = consts.RESP_SERVER_ERROR_VAL
+
+    return resp
+
+
+@view.route(uri.BUILD_JOB_RESULTS, methods=[consts.GET_TOKEN])
+@swag_from(f'{consts.BUILD_RESULTS_SCHEMA_FILE_PATH}')
+def stream_build(job_id):
+    try:
+        job = ServerInterface().get_build(job_id)
+        if job is None:
+            return _job_not_found(job_id)
+        return Response(stream_job(job), mimetype="application/x-ndjson")
+    except Exception as e:
+        err = f"{e}"
+        log.error(f"Error: {err}")
+        resp = jsonify({"Error": err})
+        resp.status_code = consts.RESP_SERVER_ERROR_VAL
+
+    return resp
+
+
+def stream_job(job: BuildJob, interval: float = consts.BUILD_STREAM_INTERVAL):
+    """
+    Stream the progress of a build as json lines. Every line has the progress of the build and the urls of the pages
+    that were fetched since the last line. The last line has the summary of the build as well
+    :param job: BuildJob
+    :param interval: float. The number of seconds between the lines
+    :return: generator of json lines
+    """
+    offsets = []
+    while True:
+        finished = job.wait(interval)
+        line = job.to_dict()
+        line["pages"] = job.get_fetched_urls(offsets)
+        if finished:
+            if job.status == DONE_STATUS:
+                line["result"] = job_result(job)
+            yield json.dumps(line) + "\n"
+            return
+        yield json.dumps(line) + "\n"
+
+
+def job_result(job: BuildJob) -> dict:
+    """
+    :param job: BuildJob that is done
+    :return: dict. The summary of the build, with the endpoints that read the graph of its workspace
+    """
+    query = f"?{consts.WORKSPACE_TOKEN}={job.workspace}"
+    return dict(job.result or {}, top_urls=uri.GET_TOP_URLS + query, export_gml=uri.EXPORT_GML + query)
+
+
+def _job_not_found(job_id: str):
+    resp = jsonify({"Error": f"Build job {job_id} not found"})
+    resp.status_code = consts.HTTP_NOT_FOUND
+    return resp
+
+
+def _workspace_not_found(workspace: str):
+    resp = jsonify({"Error": f"Workspace {workspace} has no graph"})
+    resp.status_code = consts.HTTP_NOT_FOUND
+    return resp
+
+
+@view.route(uri.WORKSPACES, methods=[consts.GET_TOKEN])
+@swag_from(f'{consts.WORKSPACES_SCHEMA_FILE_PATH}')
+def get_workspaces():
+    try:
+        resp = jsonify(ServerInterface().list_workspaces())
+        resp.status_code = consts.HTTP_OK
+    except Exception as e:
+        err = f"{e}"
+        log.error(f"Error: {err}")
+        resp = jsonify({"Error": err})
+        resp.status_code = consts.RESP_SERVER_ERROR_VAL
+
+    return resp
+
+
 @view.route(uri.VISUALIZE_GRAPH, methods=[consts.GET_TOKEN])
+@swag_from(f'{consts.VISUALIZE_SCHEMA_FILE_PATH}')
 def visualize_graph():
     try:
-        graph_path = consts.GRAPH_TEMPLATE_PATH
-        return send_file(graph_path)
+        workspace = request.args.get(consts.WORKSPACE_TOKEN, default=consts.DEFAULT_WORKSPACE)
+        html = ServerInterface().render_html(workspace)
+        if html is None:
+            return _workspace_not_found(workspace)
+        return Response(html, mimetype=consts.HTML_MIMETYPE)
+    except Exception as e:
+        err = f"{e}"
+        log.error(f"Error: {err}")
+        resp = jsonify({"Error": err})
+        resp.status_code = consts.RESP_SERVER_ERROR_VAL
+
+    return resp
+
+
+@view.route(uri.EXPORT_GML, methods=[consts.GET_TOKEN])
+@swag_from(f'{consts.EXPORT_GML_SCHEMA_FILE_PATH}')
+def export_gml():
+    try:
+        workspace = request.args.get(consts.WORKSPACE_TOKEN, default=consts.DEFAULT_WORKSPACE)
+        lines = ServerInterface().export_gml(workspace)
+        if lines is None:
+            return _workspace_not_found(workspace)
+        return Response(lines, mimetype=consts.GML_MIMETYPE,
+                        headers={"Content-Disposition": f"attachment; filename={workspace}.gml"})
     except Exception as e:
         err = f"{e}"
         log.error(f"Error: {err}")
         resp = jsonify({"Error": err})
         resp.status_code = consts.RESP_SERVER_ERROR_VAL
 
+    return resp
+
+
 @view.route(uri.GET_TOP_URLS, methods=[consts.GET_TOKEN])
 @swag_from(f'{consts.TOP_N_SCHEMA_FILE_PATH}')
 def get_top_urls():
     try:
         number_of_urls_to_get = request.args.get('n', default=5, type=int)
-        ret = ServerInterface().get_top_urls(number_of_urls_to_get)
+        if number_of_urls_to_get is None or number_of_urls_to_get <= 0:
+            resp = jsonify({"Error": "n must be a positive integer"})
+            resp.status_code = consts.HTTP_BAD_REQUEST
+            return resp
+        # The domains can be given as repeated parameters or as one comma separated list
+        domains = [domain for value in request.args.getlist(consts.DOMAINS_TOKEN)
+                   for domain in value.replace(" ", "").split(",") if domain]
+        workspace = request.args.get(consts.WORKSPACE_TOKEN, default=consts.DEFAULT_WORKSPACE)
+        ret = ServerInterface().get_top_urls(number_of_urls_to_get, domains=domains or None, workspace=workspace)
+        if ret is None:
+            return _workspace_not_found(workspace)
         resp = jsonify(ret)
         resp.status_code = consts.HTTP_OK
 
@@ -0,0 +1,425 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import logging as log
+
+import src.utils.constants as consts
+from src.data_structure.factory import combine_graphs
+from src.data_structure.graph.graph import load_graph
+from src.data_structure.mapped_graph import MappedGraph
+from src.data_structure.persistence import GraphLog, SnapshotWriter, load_snapshot, read_generation, read_log_sequence
+from src.utils.config import Config
+
+WORKSPACE_NAME_REGEX = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validate_workspace_name(name: str) -> str:
+    """
+    :param name: string. The name of a workspace
+    :return: The name
+    """
+    if not isinstance(name, str) or not WORKSPACE_NAME_REGEX.match(name):
+        log.error(f"Invalid workspace name: {name}")
+        raise ValueError(f"Invalid workspace name: {name}. Use up to 64 letters, digits, '_' and '-'")
+    return name
+
+
+@dataclass(frozen=True)
+class WorkspacePaths:
+    """The files of a workspace. The default workspace keeps the files of the server from before the workspaces"""
+    snapshot: str
+    index: str  # The read only index of the snapshot, mapped on startup
+    log: str  # The builds that were merged into the graph since the snapshot
+    graph: str  # The pickle of the graph, read when the workspace has no snapshot yet
+    checkpoint: str
+
+    @classmethod
+    def of(cls, name: str, directory: str = consts.WORKSPACES_DIR_PATH) -> "WorkspacePaths":
+        """
+        :param name: string. The name of the workspace
+        :param directory: string. The directory of the workspaces, other than the default one
+        :return: WorkspacePaths
+        """
+        if name == consts.DEFAULT_WORKSPACE:
+            return cls(consts.GRAPH_SNAPSHOT_FILE_PATH, consts.GRAPH_INDEX_FILE_PATH, consts.GRAPH_LOG_FILE_PATH,
+                       consts.GRAPH_OUTPUT_FILE_PATH, consts.CHECKPOINT_FILE_PATH)
+        directory = os.path.join(directory, validate_workspace_name(name))
+        return cls(os.path.join(directory, consts.GRAPH_SNAPSHOT_FILE_NAME),
+                   os.path.join(directory, consts.GRAPH_INDEX_FILE_NAME),
+                   os.path.join(directory, consts.GRAPH_LOG_FILE_NAME),
+                   os.path.join(directory, consts.GRAPH_OUTPUT_FILE_NAME),
+                   os.path.join(directory, consts.CHECKPOINT_FILE_NAME))
+
+
+class GraphLoader:
+    """
+    The graph of a workspace, loaded the first time it is asked for or in the background once it is started. It is
+    loaded once, whichever thread asks for it first
+    """
+
+    def __init__(self, load: Callable[[], object] = None, graph=None):
+        """
+        :param load: function that returns the graph
+        :param graph: The graph, when it is already loaded
+        """
+        self._load = load
+        self._graph = graph
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._graph is not None
+
+    def get(self):
+        """
+        :return: The graph. Wait for it to be loaded if it is not yet
+        """
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    graph = self._load()
+                    if graph is None:
+                        log.error("The graph to load does not exist anymore")
+                        raise FileNotFoundError("The graph to load does not exist anymore")
+                    self._graph = graph
+        return self._graph
+
+    def start(self) -> None:
+        """
+        Load the graph in a background thread
+        :return:
+        """
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                log.error(f"Could not load the graph in the background: {e}")
+
+        threading.Thread(target=load, name="graph-loader", daemon=True).start()
+
+
+class Readers:
+    """
+    The readers of a published graph. The readers never wait for the builds: a build that reuses the graph of a
+    workspace that is no longer published retires it, so no new reader enters, and waits for the readers in it to leave
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._retired = False
+        self._condition = threading.Condition()
+
+    def enter(self) -> bool:
+        """
+        :return: bool. False if the graph was retired, the reader must read the published graph instead
+        """
+        with self._condition:
+            if self._retired:
+                return False
+            self._count += 1
+            return True
+
+    def leave(self) -> None:
+        with self._condition:
+            self._count -= 1
+            self._condition.notify_all()
+
+    def retire(self) -> None:
+        """
+        Let no new reader in and wait for the readers to leave
+        :return:
+        """
+        with self._condition:
+            self._retired = True
+            self._condition.wait_for(lambda: self._count == 0)
+
+
+@dataclass(frozen=True)
+class Workspace:
+    """
+    The published graph of a workspace. It is not changed while it is published: the next build of the workspace
+    publishes a new Workspace, so a reader keeps a consistent graph for as long as it reads it through
+    WorkspaceRegistry.read. A workspace loaded on startup answers from the index of its snapshot until its graph was
+    loaded
+    """
+    name: str
+    version: int
+    published: float
+    loader: GraphLoader
+    index: Optional[MappedGraph] = None
+    readers: Readers = field(default_factory=Readers, compare=False, repr=False)
+
+    @property
+    def graph(self):
+        """The graph of the workspace. It is loaded, and waited for, if it was not yet"""
+        return self.loader.get()
+
+    @property
+    def ranked(self):
+        """The graph to read the ranking from: the graph once it was loaded, its index until then"""
+        if self.index is None or self.loader.loaded:
+            return self.loader.get()
+        return self.index
+
+    def to_dict(self) -> dict:
+        ranked = self.ranked
+        return {"name": self.name, "version": self.version, "published": self.published,
+                "nodes": ranked.number_of_nodes(), "edges": ranked.number_of_edges(), "loaded": self.loader.loaded}
+
+
+class WorkspaceRegistry:
+    """
+    The named graphs of the server. The builds write to their own graphs and merge them into the graphs of their
+    workspaces, or replace them, when they finish. Publishing swaps the whole map of workspaces, so the readers never
+    wait for a build and never see a half built graph. Every build is appended to the log of its workspace, and the log
+    is folded into the snapshot, saved with its index in the background, once it is large compared to it.
+    The merges do not copy the published graph: each workspace keeps the graph it published before as a spare, and the
+    next merge brings the spare up to date and publishes it, once the readers of that graph left and its snapshot was
+    written.
+    """
+
+    def __init__(self, directory: str = consts.WORKSPACES_DIR_PATH, config: Config = None):
+        """
+        :param directory: string. The directory of the saved workspaces, other than the default one
+        :param config: Config
+        """
+        self._config = config or Config()
+        self._directory = directory
+        self._workspaces: Dict[str, Workspace] = {}
+        self._logs: Dict[str, GraphLog] = {}
+        # The graph a workspace published before its current one, with the build graphs it misses
+        self._spares: Dict[str, Tuple[Workspace, List[object]]] = {}
+        self._lock = threading.Lock()  # Serializes the publishers only
+        self._compress = self._config.get(consts.GRAPH_SECTION, consts.SNAPSHOT_COMPRESSION_CONFIG_TOKEN,
+                                          default_value=True, return_as_string=False)
+        self._compaction_ratio = self._config.get(consts.GRAPH_SECTION, consts.LOG_COMPACTION_RATIO_CONFIG_TOKEN,
+                                                  default_value=0.5, return_as_string=False)
+        self._writer = SnapshotWriter(compress=self._compress)
+
+    def get(self, name: str = consts.DEFAULT_WORKSPACE) -> Optional[Workspace]:
+        """
+        :param name: string. The name of the workspace
+        :return: Workspace, None if nothing was published to it
+        """
+        return self._workspaces.get(name)
+
+    def paths(self, name: str) -> WorkspacePaths:
+        return WorkspacePaths.of(name, directory=self._directory)
+
+    def list(self) -> List[Workspace]:
+        workspaces = self._workspaces
+        return [workspaces[name] for name in sorted(workspaces)]
+
+    @contextmanager
+    def read(self, name: str = consts.DEFAULT_WORKSPACE) -> Iterator[Optional[Workspace]]:
+        """
+        Read the published graph of the workspace. The graph is not changed until the reader leaves
+        :param name: string. The name of the workspace
+        :return: Workspace, None if nothing was published to it
+        """
+        while True:
+            workspace = self._workspaces.get(name)
+            if workspace is None or workspace.readers.enter():
+                break
+        try:
+            yield workspace
+        finally:
+            if workspace is not None:
+                workspace.readers.leave()
+
+    def publish(self, name: str, graph, save: bool = True, on_saved: Callable[[], None] = None) -> Workspace:
+        """
+        Make the graph the graph of the workspace, in place of the graph it had. The ranking is computed first, so the
+        readers only read it
+        :param name: string. The name of the workspace
+        :param graph: The graph of a finished build. The registry owns it once it was published, it must not be changed
+         by the caller
+        :param save: bool. Save the snapshot of the graph in the background once it was published. The records of the
+         log of the workspace are dropped once it was saved
+        :param on_saved: function called after the snapshot was saved
+        :return: The new Workspace
+        """
+        validate_workspace_name(name)
+        graph.get_top_n_for_each_domain()
+        self._spares.pop(name, None)
+        workspace = self._swap(name, GraphLoader(graph=graph))
+        if save:
+            self._save(name, graph, self._log(name).last_sequence, on_saved=on_saved)
+        return workspace
+
+    def replace(self, name: str, graph, on_saved: Callable[[], None] = None) -> Workspace:
+        """
+        Replace the graph of the workspace with the graph of a build. The graph is appended to the log of the
+        workspace as a reset record before it is published, so the replace is not lost if the server stops before the
+        snapshot is saved
+        :param name: string. The name of the workspace
+        :param graph: The graph of a finished build. The registry owns it once it was published
+        :param on_saved: function called after the snapshot was saved
+        :return: The new Workspace
+        """
+        self._log(name).append(graph, reset=True)
+        return self.publish(name, graph, on_saved=on_saved)
+
+    def merge(self, name: str, graph) -> Workspace:
+        """
+        Merge the graph of a build into the graph of the workspace. The graph of the build is appended to the log of
+        the workspace before it is published, so it is not lost if the server stops before the next snapshot
+        :param name: string. The name of the workspace
+        :param graph: The graph of a finished build. The registry owns it once it was merged
+        :return: The new Workspace
+        """
+        graph_log = self._log(name)
+        sequence = graph_log.append(graph)
+        previous = self.get(name)
+        spare = self._spares.pop(name, None)
+        if previous is None:
+            merged = graph
+        elif spare is None:
+            # The first merge since the graph was published or loaded copies it, the next ones reuse the copies
+            merged = combine_graphs([previous.graph, graph], config=self._config)
+        else:
+            retired, missing = spare
+            retired.readers.retire()
+            merged = retired.graph
+            # The snapshot of the retired graph may still be queued or being written
+            self._writer.wait(merged)
+            for build_graph in missing + [graph]:
+                merged.merge_graph(build_graph)
+        merged.get_top_n_for_each_domain()
+        workspace = self._swap(name, GraphLoader(graph=merged))
+        if previous is not None and previous.loader.loaded:
+            self._spares[name] = (previous, [graph])
+        snapshot = self.paths(name).snapshot
+        if not os.path.exists(snapshot) or graph_log.size > self._compaction_ratio * os.path.getsize(snapshot):
+            self._save(name, merged, sequence)
+        return workspace
+
+    def flush(self, timeout: float = None, name: str = None) -> bool:
+        """
+        Wait until the snapshots of the published graphs were saved
+        :param timeout: float. The maximum number of seconds to wait, forever if None
+        :param name: string. Wait for the snapshot of this workspace only
+        :return: bool. True if the snapshots were saved
+        """
+        return self._writer.flush(timeout, path=self.paths(name).snapshot if name is not None else None)
+
+    def load(self) -> None:
+        """
+        Publish the saved graphs of the default workspace and of the workspaces directory. A workspace whose snapshot
+        has an index is published with the mapped index, and its graph is loaded when it is first asked for, or in the
+        background when the graph section of the config preloads it or when the log of the workspace has records that
+        the snapshot does not hold. Otherwise the graph is loaded now, from the snapshot or from the pickle when there
+        is no snapshot yet, and saved again with an index for the next start. The records of the log are replayed on
+        top of the snapshot
+        :return:
+        """
+        names = [consts.DEFAULT_WORKSPACE]
+        if os.path.isdir(self._directory):
+            names += [name for name in sorted(os.listdir(self._directory))
+                      if WORKSPACE_NAME_REGEX.match(name) and name != consts.DEFAULT_WORKSPACE]
+        preload = self._config.get(consts.GRAPH_SECTION, consts.PRELOAD_GRAPH_CONFIG_TOKEN, default_value=False,
+                                   return_as_string=False)
+        for name in names:
+            paths = self.paths(name)
+            index = self._open_index(paths)
+            if index is not None:
+                loader = GraphLoader(load=partial(self._recover, name))
+                self._swap(name, loader, index=index)
+                if preload or self._has_log_records(name):
+                    loader.start()
+                continue
+
+            graph = self._recover(name)
+            if graph is not None:
+                self.publish(name, graph)
+
+    def _recover(self, name: str):
+        """
+        :param name: string. The name of the workspace
+        :return: The saved graph of the workspace with the records of its log that the snapshot does not hold. None if
+         nothing was saved
+        """
+        paths = self.paths(name)
+        graph = load_snapshot(paths.snapshot, config=self._config)
+        if graph is None:
+            graph = load_graph(paths.graph)
+        if os.path.exists(paths.log):
+            graph = self._log(name).replay(graph, after=read_log_sequence(paths.snapshot), config=self._config)
+        if graph is not None:
+            graph.get_top_n_for_each_domain()
+        return graph
+
+    def _has_log_records(self, name: str) -> bool:
+        """
+        :param name: string. The name of the workspace
+        :return: bool. True if the log of the workspace has records that its snapshot does not hold
+        """
+        paths = self.paths(name)
+        return os.path.exists(paths.log) and self._log(name).last_sequence > read_log_sequence(paths.snapshot)
+
+    def _log(self, name: str) -> GraphLog:
+        """
+        :param name: string. The name of the workspace
+        :return: GraphLog of the workspace, opened the first time it is needed
+        """
+        with self._lock:
+            if name not in self._logs:
+                path = self.paths(name).log
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._logs[name] = GraphLog(path, compress=self._compress)
+            return self._logs[name]
+
+    def _save(self, name: str, graph, log_sequence: int, on_saved: Callable[[], None] = None) -> None:
+        """
+        Save the snapshot and the index of the graph in the background, then drop the records of the log it holds
+        :param name: string. The name of the workspace
+        :param graph: The published graph of the workspace
+        :param log_sequence: int. The sequence of the last record of the log that the graph holds
+        :param on_saved: function called after the snapshot was saved
+        :return:
+        """
+        paths, graph_log = self.paths(name), self._log(name)
+
+        def on_written():
+            graph_log.compact(log_sequence)
+            if on_saved:
+                on_saved()
+
+        os.makedirs(os.path.dirname(paths.snapshot), exist_ok=True)
+        self._writer.submit(paths.snapshot, graph, on_written=on_written, index_path=paths.index,
+                            log_sequence=log_sequence)
+
+    def _swap(self, name: str, loader: GraphLoader, index: MappedGraph = None) -> Workspace:
+        with self._lock:
+            previous = self._workspaces.get(name)
+            workspace = Workspace(name=name, version=previous.version + 1 if previous else 1, published=time.time(),
+                                  loader=loader, index=index)
+            workspaces = dict(self._workspaces)
+            workspaces[name] = workspace
+            self._workspaces = workspaces
+        log.info(f"Published version {workspace.version} of workspace {name}")
+        return workspace
+
+    @staticmethod
+    def _open_index(paths: WorkspacePaths) -> Optional[MappedGraph]:
+        """
+        :param paths: WorkspacePaths
+        :return: MappedGraph of the index of the workspace. None if it has none, or if it is not the index of its
+         snapshot
+        """
+        if not os.path.exists(paths.index):
+            return None
+        try:
+            index = MappedGraph(paths.index)
+        except Exception as e:
+            log.warning(f"Could not open the graph index {paths.index}: {e}")
+            return None
+        if index.generation is None or index.generation != read_generation(paths.snapshot):
+            log.warning(f"The graph index {paths.index} is not the index of the snapshot {paths.snapshot}")
+            return None
+        return index
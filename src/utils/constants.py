@@ -4,8 +4,9 @@ import sys
 WINDOWS_OS_STR = "nt"
 IS_WINDOWS_OS = (os.name == WINDOWS_OS_STR)
 
+# Interactive shells and some spawned worker processes don't have a main file. Use the working directory for them
 PROJECT_DIR = os.environ['PROJECT_DIR'] if 'PROJECT_DIR' in os.environ else os.path.dirname(
-    sys.modules['__main__'].__file__)
+    getattr(sys.modules['__main__'], '__file__', os.path.join(os.getcwd(), '__main__')))
 
 # -----------------
 # FILE PATHS
@@ -15,6 +16,14 @@ OUTPUT_DIR_PATH = os.path.join(PROJECT_DIR, OUTPUT_DIR)
 os.makedirs(OUTPUT_DIR_PATH, exist_ok=True)
 GRAPH_OUTPUT_FILE_NAME = "graph.pkl"
 GRAPH_OUTPUT_FILE_PATH = os.path.join(OUTPUT_DIR_PATH, GRAPH_OUTPUT_FILE_NAME)
+GRAPH_SNAPSHOT_FILE_NAME = "graph.npz"
+GRAPH_SNAPSHOT_FILE_PATH = os.path.join(OUTPUT_DIR_PATH, GRAPH_SNAPSHOT_FILE_NAME)
+GRAPH_INDEX_FILE_NAME = "graph.idx"
+GRAPH_INDEX_FILE_PATH = os.path.join(OUTPUT_DIR_PATH, GRAPH_INDEX_FILE_NAME)
+GRAPH_LOG_FILE_NAME = "graph.log"
+GRAPH_LOG_FILE_PATH = os.path.join(OUTPUT_DIR_PATH, GRAPH_LOG_FILE_NAME)
+WORKSPACES_DIR = "workspaces"
+WORKSPACES_DIR_PATH = os.path.join(OUTPUT_DIR_PATH, WORKSPACES_DIR)
 
 INPUT_DIR = "input"
 INPUT_PATH = os.path.join(PROJECT_DIR, INPUT_DIR)
@@ -25,6 +34,10 @@ CONFIG_PATH = os.path.join(INPUT_PATH, CONFIG_FILE_NAME)
 STORE_DIR = "store"
 STORE_PATH = os.path.join(PROJECT_DIR, STORE_DIR)
 os.makedirs(STORE_PATH, exist_ok=True)
+CHECKPOINT_FILE_NAME = "crawl_checkpoint.sqlite"
+CHECKPOINT_FILE_PATH = os.path.join(STORE_PATH, CHECKPOINT_FILE_NAME)
+ROBOTS_CACHE_FILE_NAME = "robots_cache.sqlite"
+ROBOTS_CACHE_FILE_PATH = os.path.join(STORE_PATH, ROBOTS_CACHE_FILE_NAME)
 
 TEMPLATES_DIR = "templates"
 TEMPLATES_PATH = os.path.join(PROJECT_DIR, TEMPLATES_DIR)
@@ -43,15 +56,24 @@ os.makedirs(SCHEMA_DIR_PATH, exist_ok=True)
 # -----------------
 SYSTEM_SECTION = "SYSTEM"
 NUMBER_OF_JOBS_CONFIG_TOKEN = 'number_of_jobs'
+NUMBER_OF_PARSE_WORKERS_CONFIG_TOKEN = 'number_of_parse_workers'
+MAX_BUILDS_CONFIG_TOKEN = 'max_builds'
 
 # -----------------
 # SERVER TOKENS
 # -----------------
 HTTP_OK = 200
+HTTP_ACCEPTED = 202
+HTTP_BAD_REQUEST = 400
+HTTP_NOT_FOUND = 404
 RESP_SERVER_ERROR_VAL = 500
 POST_TOKEN = "POST"
 GET_TOKEN = "GET"
+DELETE_TOKEN = "DELETE"
+BUILD_STREAM_INTERVAL = 1.0  # Seconds between the progress lines of a streamed build
 DEFAULT_URL_PREFIX = "/api/v1"
+GML_MIMETYPE = "text/gml"
+HTML_MIMETYPE = "text/html"
 
 # -----------------
 # SERVER CONFIG SECTION
@@ -75,6 +97,30 @@ MAX_DEPTH_CONFIG_TOKEN = "max_depth"
 TIMEOUT_CONFIG_TOKEN = "timeout"
 MAX_RETIRES_CONFIG_TOKEN = "max_retries"
 MAX_REQUEST_CONFIG_TOKEN = "max_requests"
+MAX_CONNECTIONS_CONFIG_TOKEN = "max_connections"
+MAX_HOST_CONNECTIONS_CONFIG_TOKEN = "max_host_connections"
+MAX_KEEPALIVE_CONNECTIONS_CONFIG_TOKEN = "max_keepalive_connections"
+KEEPALIVE_EXPIRY_CONFIG_TOKEN = "keepalive_expiry"
+HTTP2_CONFIG_TOKEN = "http2"
+CHECKPOINT_INTERVAL_CONFIG_TOKEN = "checkpoint_interval"
+HOST_RATE_CONFIG_TOKEN = "host_rate"
+HOST_BURST_CONFIG_TOKEN = "host_burst"
+TARGET_LATENCY_CONFIG_TOKEN = "target_latency"
+RETRY_BACKOFF_CONFIG_TOKEN = "retry_backoff"
+RETRY_MAX_BACKOFF_CONFIG_TOKEN = "retry_max_backoff"
+MAX_RETRY_AFTER_CONFIG_TOKEN = "max_retry_after"
+HOST_RETRY_BUDGET_CONFIG_TOKEN = "host_retry_budget"
+CRAWL_RETRY_BUDGET_CONFIG_TOKEN = "crawl_retry_budget"
+OBEY_ROBOTS_CONFIG_TOKEN = "obey_robots"
+ROBOTS_TTL_CONFIG_TOKEN = "robots_ttl"
+SITEMAPS_CONFIG_TOKEN = "sitemaps"
+MAX_SITEMAP_URLS_CONFIG_TOKEN = "max_sitemap_urls"
+RESUME_TOKEN = "resume"
+REPLACE_TOKEN = "replace"
+WORKSPACE_TOKEN = "workspace"
+DEFAULT_WORKSPACE = "default"
+
+URL_CACHE_SIZE = 2 ** 16  # The number of parsed urls kept in the LRU cache
 
 IGNORED_EXTENSIONS = [
     # archives
@@ -99,11 +145,24 @@ EMAIL_TYPE_TOKEN = "email"
 URL_TYPE_TOKEN = "url"
 GRAPH_CALLBACKS_TOKEN = "graph"
 REQUEST_NODES_TOKEN = "nodes"
+DOMAINS_TOKEN = "domains"
 DATA_TOKEN = "data"
 WEIGHT_TOKEN = 'weight'
 CALLBACK_ID_TOKEN = 'callback_id'
 GRAPH_NODES_CONFIG_TOKEN = "nodes"
 ALPHA_CONFIG_TOKEN = "alpha"
+GRAPH_BACKEND_CONFIG_TOKEN = "backend"
+NETWORKX_GRAPH_BACKEND_TOKEN = "networkx"
+ARRAY_GRAPH_BACKEND_TOKEN = "array"
+RANKING_ENGINE_CONFIG_TOKEN = "ranking_engine"
+RANKING_TOLERANCE_CONFIG_TOKEN = "ranking_tolerance"
+SNAPSHOT_COMPRESSION_CONFIG_TOKEN = "snapshot_compression"
+PRELOAD_GRAPH_CONFIG_TOKEN = "preload_graph"
+LOG_COMPACTION_RATIO_CONFIG_TOKEN = "log_compaction_ratio"
+SCIPY_RANKING_ENGINE_TOKEN = "scipy"
+NETWORKX_RANKING_ENGINE_TOKEN = "networkx"
+# The number of top n queries a graph keeps the results of
+TOP_N_CACHE_SIZE = 32
 
 # -----------------
 # FILTERS SECTION
@@ -112,11 +171,29 @@ FILTERS_SECTION = "FILTERS"
 DOMAIN_FILTER = "domain"
 SUBDOMAIN_FILTER = "subdomain"
 PATTERN_RULES = "pattern_rules"
+VISITED_BACKEND_FILTER = "visited_backend"
+VISITED_CAPACITY_FILTER = "visited_capacity"
+VISITED_ERROR_RATE_FILTER = "visited_error_rate"
+EXACT_VISITED_SET_TOKEN = "exact"
+FINGERPRINT_VISITED_SET_TOKEN = "fingerprint"
+BLOOM_VISITED_SET_TOKEN = "bloom"
 
 # -----------------
 # SCHEMAS FILES
 # -----------------
 GRAPH_BUILD_SCHEMA_FILE_NAME = "build.yml"
 GRAPH_BUILD_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, GRAPH_BUILD_SCHEMA_FILE_NAME)
+BUILD_JOB_SCHEMA_FILE_NAME = "build_job.yml"
+BUILD_JOB_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, BUILD_JOB_SCHEMA_FILE_NAME)
+CANCEL_BUILD_JOB_SCHEMA_FILE_NAME = "build_cancel.yml"
+CANCEL_BUILD_JOB_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, CANCEL_BUILD_JOB_SCHEMA_FILE_NAME)
+BUILD_RESULTS_SCHEMA_FILE_NAME = "build_results.yml"
+BUILD_RESULTS_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, BUILD_RESULTS_SCHEMA_FILE_NAME)
 TOP_N_SCHEMA_FILE_NAME = "top_n.yml"
 TOP_N_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, TOP_N_SCHEMA_FILE_NAME)
+WORKSPACES_SCHEMA_FILE_NAME = "workspaces.yml"
+WORKSPACES_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, WORKSPACES_SCHEMA_FILE_NAME)
+EXPORT_GML_SCHEMA_FILE_NAME = "export_gml.yml"
+EXPORT_GML_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, EXPORT_GML_SCHEMA_FILE_NAME)
+VISUALIZE_SCHEMA_FILE_NAME = "visualize.yml"
+VISUALIZE_SCHEMA_FILE_PATH = os.path.join(SCHEMA_DIR_PATH, VISUALIZE_SCHEMA_FILE_NAME)
@@ -1,12 +1,21 @@
 import os
 import pickle
+import posixpath
 import logging as log
+from functools import lru_cache
 from urllib.parse import urlsplit
 import re
+
+import tldextract
+
 import src.utils.constants as consts
 
 EMAIL_REGEX = r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"  # Get all string in the format of email
 EMAIL_NAME = "[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"
+FILE_SUFFIX_REGEX = re.compile(r"\.[a-zA-Z]{2,4}$")
+# Splits a host to its subdomain, domain and public suffix with the snapshot of the public suffix list that comes with
+# tldextract, so it never fetches the list over the network
+TLD_EXTRACTOR = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
 
 def load_pickle(path):
     try:
@@ -24,9 +33,10 @@ def load_pickle(path):
 
 def save_pickle(path, data):
     try:
-        # Save the graph as a pickle to be used later
-        with open(path, 'wb') as f:
+        # Save the graph as a pickle to be used later. The file is replaced at once, so a reader never sees half of it
+        with open(f"{path}.tmp", 'wb') as f:
             pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
 
         log.info(f"Saving pickle file to {path}")
 
@@ -44,13 +54,71 @@ def clean_url(url: str) -> str:
     return url.strip('/').replace("www.", "")
 
 
+class CanonicalUrl:
+    """
+    The parts of a url, split once. The registered domain and subdomain are extracted on first use, since only the
+    domain filters need them
+    """
+    __slots__ = ("url", "scheme", "netloc", "host", "path", "extension", "base_url", "is_web_page", "_domain_parts")
+
+    def __init__(self, url: str):
+        """
+        :param url: string. The raw url, like the href of a link
+        """
+        parts = urlsplit(url)
+        self.url = url
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.host = parts.hostname or ""  # The lowercase netloc without the port and credentials
+        self.path = parts.path
+        self.extension = posixpath.splitext(parts.path)[1].lower()
+        self.base_url = clean_url(parts.netloc + parts.path)
+        self.is_web_page = _is_web_page(url)
+        self._domain_parts = None
+
+    @property
+    def registered_domain(self) -> str:
+        return self._get_domain_parts().registered_domain
+
+    @property
+    def subdomain(self) -> str:
+        return self._get_domain_parts().subdomain
+
+    def _get_domain_parts(self):
+        if self._domain_parts is None:
+            self._domain_parts = TLD_EXTRACTOR(self.host)
+        return self._domain_parts
+
+    def __repr__(self) -> str:
+        return f"CanonicalUrl({self.url!r})"
+
+
+@lru_cache(maxsize=consts.URL_CACHE_SIZE)
+def parse_url(url: str) -> CanonicalUrl:
+    """
+    Parse the url once. The parsed urls are kept in a bounded LRU cache keyed by the raw url, since the same links
+    (navigation bars, footers) repeat on every page of a site
+    :param url: string. The url to parse
+    :return: CanonicalUrl
+    """
+    return CanonicalUrl(url)
+
+
+def get_url_cache_stats() -> dict:
+    """
+    :return: dict with the hits, misses and size of the cache of the parsed urls
+    """
+    info = parse_url.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+
 def extract_domain(url: str) -> str:
     """
     Extract the domain from the url. For example: https://www.example.com/bla/bla/bla -> example.com
     :param url: string. The url to extract the domain from
     :return: string. The domain of the url
     """
-    return urlsplit(url).netloc
+    return parse_url(url).netloc
 
 
 def extract_base_url(url: str) -> str:
@@ -59,7 +127,7 @@ def extract_base_url(url: str) -> str:
     :param url: string. The url to extract the base url from
     :return: string. The base url of the url
     """
-    return clean_url(urlsplit(url).netloc + urlsplit(url).path)
+    return parse_url(url).base_url
 
 
 def is_valid_url(url: str) -> bool:
@@ -69,28 +137,12 @@ def is_valid_url(url: str) -> bool:
     :param url: string. The url to check
     :return: bool. True if the url is valid, False otherwise
     """
-    match = re.findall(r"\.[a-zA-Z]{2,4}$", url)  # Look for a dot followed by 2-4 letters
-    if not match:
-        return True
+    return parse_url(url).is_web_page
 
-    suffix = match[0]
-    if suffix in consts.VALID_WEBSITE_SUFFIXES:
-        return True
-
-    return False
-
-# def req_with_retry(max_retries) -> requests.Session:
-#     session = requests.Session()
-#     retry = urllib3.Retry(
-#         total=max_retries,
-#         read=max_retries,
-#         connect=max_retries,
-#         backoff_factor=0.5,
-#         raise_on_status=False,
-#     )
-#     adapter = HTTPAdapter(max_retries=retry)
-#     session.mount("http://", adapter)
-#     session.mount("https://", adapter)
-#     return session
 
+def _is_web_page(url: str) -> bool:
+    match = FILE_SUFFIX_REGEX.search(url)  # Look for a dot followed by 2-4 letters
+    if not match:
+        return True
 
+    return match.group() in consts.VALID_WEBSITE_SUFFIXES
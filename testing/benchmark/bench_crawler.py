@@ -0,0 +1,67 @@
+"""
+Crawl a local fixture site and report pages/sec and peak RSS.
+
+Run from the project directory:
+    python -m testing.benchmark.bench_crawler --pages 500 --depth 3
+Peak RSS is a per-process figure, so run each configuration in a fresh process.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PROJECT_DIR", PROJECT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+import src.utils.constants as consts
+from src.crawler.crawler import WebSpider
+from src.crawler.filter import UrlFilter
+from src.crawler.parsers.pool import ParserPool
+from src.data_structure.graph.callbacks import CALLBACKS
+from src.utils.config import Config
+from testing.benchmark.fixture_site import FixtureSite
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--links", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--slow-ratio", type=float, default=0.02)
+    parser.add_argument("--slow-delay", type=float, default=1.0)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--host-rate", type=float, default=0, help="Requests per second to the site, 0 is unlimited")
+    args = parser.parse_args()
+
+    config = Config(config_file=consts.CONFIG_PATH)
+    config.config.set(consts.CRAWLER_SECTION, consts.MAX_DEPTH_CONFIG_TOKEN, str(args.depth))
+    config.config.set(consts.CRAWLER_SECTION, consts.MAX_REQUEST_CONFIG_TOKEN, str(args.requests))
+    config.config.set(consts.CRAWLER_SECTION, consts.HOST_RATE_CONFIG_TOKEN, str(args.host_rate))
+    config.config.set(consts.CRAWLER_SECTION, consts.MAX_HOST_CONNECTIONS_CONFIG_TOKEN, str(args.requests))
+
+    site = FixtureSite(pages=args.pages, links_per_page=args.links, slow_ratio=args.slow_ratio,
+                       slow_delay=args.slow_delay).start()
+    parser_pool = ParserPool(workers=args.parse_workers) if args.parse_workers else None
+    try:
+        spider = WebSpider(callbacks=[CALLBACKS[consts.EMAIL_TYPE_TOKEN]], url_filter=UrlFilter({}),
+                           start_seed=f"{site.url}/page0", config=config, parser_pool=parser_pool)
+        start = time.perf_counter()
+        graph = asyncio.run(spider.crawl())
+        elapsed = time.perf_counter() - start
+    finally:
+        site.stop()
+        if parser_pool:
+            parser_pool.shutdown()
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"pages fetched: {site.hits}")
+    print(f"graph: {len(graph.nodes)} nodes, {len(graph.edges)} edges")
+    print(f"elapsed: {elapsed:.2f}s, pages/sec: {site.hits / elapsed:.1f}, peak RSS: {peak_rss_mb:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
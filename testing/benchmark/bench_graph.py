@@ -0,0 +1,99 @@
+"""
+Compare the memory, the add and add_many speed and the ranking time of the graph data structures on a synthetic crawl.
+
+Run from the project directory:
+    python -m testing.benchmark.bench_graph --pages 100000 --links 10
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PROJECT_DIR", PROJECT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+import src.utils.constants as consts
+from src.data_structure.array_graph.array_graph import ArrayGraph
+from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.data_structure.graph.graph import WebGraph
+from src.utils.config import Config
+
+
+def crawl_results(pages: int, links: int, emails: int, seed: int = 0) -> list:
+    """The callback results of each page of a crawl of `pages` pages of 100 sites"""
+    rng = random.Random(seed)
+    crawl = []
+    for page in range(pages):
+        domain = f"university{page % 100}.edu"
+        url = f"https://www.{domain}/department/{page // 100}/staff"
+        results = []
+        for _ in range(links):
+            linked = rng.randrange(pages)
+            results.append(CallbackResult(domain, url, f"https://www.university{linked % 100}.edu/department/"
+                                                       f"{linked // 100}/staff", consts.URL_TYPE_TOKEN))
+        for _ in range(emails):
+            results.append(CallbackResult(domain, url, f"person{rng.randrange(pages)}@{domain}",
+                                          consts.EMAIL_TYPE_TOKEN))
+        crawl.append(results)
+    return crawl
+
+
+def build(graph_class, crawl, config, batch=False):
+    graph = graph_class(config=config)
+    for results in crawl:
+        if batch:
+            graph.add_many(results)
+        else:
+            for result in results:
+                graph.add(result)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100_000)
+    parser.add_argument("--links", type=int, default=10)
+    parser.add_argument("--emails", type=int, default=1)
+    args = parser.parse_args()
+
+    config = Config()
+    config.config.read_dict({consts.GRAPH_SECTION: {consts.ALPHA_CONFIG_TOKEN: "0.8"}})
+    crawl = crawl_results(args.pages, args.links, args.emails)
+    results = sum(len(page) for page in crawl)
+    print(f"{results} callback results of {args.pages} pages")
+
+    for graph_class in (WebGraph, ArrayGraph):
+        gc.collect()
+        start = time.perf_counter()
+        build(graph_class, crawl, config)
+        add_time = time.perf_counter() - start
+        gc.collect()
+        # All the links of a page in one call, like the parsers add them
+        start = time.perf_counter()
+        graph = build(graph_class, crawl, config, batch=True)
+        add_many_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        graph.get_top_n_for_each_domain(5)
+        rank_time = time.perf_counter() - start
+        del graph
+        gc.collect()
+
+        tracemalloc.start()
+        graph = build(graph_class, crawl, config, batch=True)
+        graph.number_of_edges()  # Compact the edges of the array graph
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{graph_class.__name__:<9} nodes: {graph.number_of_nodes()}  edges: {graph.number_of_edges()}  "
+              f"memory: {memory / 2 ** 20:7.1f} MB  adds: {results / add_time / 1000:6.1f}k/s  "
+              f"add_many: {results / add_many_time / 1000:6.1f}k/s  "
+              f"top 5 per domain: {rank_time:6.2f}s")
+        del graph
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Parse fixture pages in the crawler thread and in a ParserPool with 1 to N worker processes and report pages/sec.
+
+Run from the project directory:
+    python -m testing.benchmark.bench_parsing --pages 2000 --max-workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PROJECT_DIR", PROJECT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+from src.crawler.parsers.html import HTML_BACKEND
+from src.crawler.parsers.pool import ParserPool, parse_page
+from testing.benchmark.fixture_site import FixtureSite
+
+BASE_URL = "http://fixture.test"
+
+
+async def parse_all(pages, pool):
+    if pool is None:
+        return await asyncio.gather(*[asyncio.to_thread(parse_page, url, content) for url, content in pages])
+    return await asyncio.gather(*[pool.parse(url, content) for url, content in pages])
+
+
+def measure(pages, workers):
+    pool = ParserPool(workers=workers) if workers else None
+    try:
+        if pool:
+            asyncio.run(parse_all(pages[:workers * 4], pool))  # Warm up the worker processes
+        start = time.perf_counter()
+        asyncio.run(parse_all(pages, pool))
+        return len(pages) / (time.perf_counter() - start)
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    site = FixtureSite(pages=args.pages, links_per_page=40, emails_per_page=5)
+    pages = [(f"{BASE_URL}/page{i}", site.page(i, base_url=BASE_URL)) for i in range(args.pages)]
+    print(f"html backend: {HTML_BACKEND}, cpu count: {os.cpu_count()}")
+    print(f"in-process threads: {measure(pages, 0):.1f} pages/sec")
+    for workers in range(1, args.max_workers + 1):
+        print(f"{workers} worker processes: {measure(pages, workers):.1f} pages/sec")
+
+
+if __name__ == '__main__':
+    main()
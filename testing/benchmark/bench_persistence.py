@@ -0,0 +1,96 @@
+"""
+Compare the save time, the file size and the load time of the graph snapshots with the pickle and GML pair the builds
+used to write, the time to the first top urls of a server that starts from the mapped index with a server that
+loads the whole snapshot first, and the cost of a small recrawl appended to the graph log with rewriting the snapshot.
+
+Run from the project directory:
+    python -m testing.benchmark.bench_persistence --pages 20000 --links 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import networkx as nx
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PROJECT_DIR", PROJECT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+import src.utils.constants as consts
+from src.data_structure.array_graph.array_graph import ArrayGraph
+from src.data_structure.graph.graph import WebGraph, to_networkx
+from src.data_structure.mapped_graph import MappedGraph, save_index
+from src.data_structure.persistence import GraphLog, load_snapshot, save_snapshot
+from src.utils.config import Config
+from src.utils.tools import load_pickle, save_pickle
+from testing.benchmark.bench_graph import build, crawl_results
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def save_pickle_and_gml(directory: str, graph) -> int:
+    """The files save_graph writes, without the html of the top nodes"""
+    path = os.path.join(directory, consts.GRAPH_OUTPUT_FILE_NAME)
+    nx.write_gml(to_networkx(graph), path.replace(".pkl", ".gml"))
+    save_pickle(path, graph)
+    return os.path.getsize(path) + os.path.getsize(path.replace(".pkl", ".gml"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20_000)
+    parser.add_argument("--links", type=int, default=10)
+    parser.add_argument("--emails", type=int, default=1)
+    args = parser.parse_args()
+
+    config = Config()
+    config.config.read_dict({consts.GRAPH_SECTION: {consts.ALPHA_CONFIG_TOKEN: "0.8"}})
+    crawl = crawl_results(args.pages, args.links, args.emails)
+
+    for graph_class, backend in ((WebGraph, consts.NETWORKX_GRAPH_BACKEND_TOKEN),
+                                 (ArrayGraph, consts.ARRAY_GRAPH_BACKEND_TOKEN)):
+        config.config.set(consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN, backend)
+        graph = build(graph_class, crawl, config, batch=True)
+        graph.get_top_n_for_each_domain(5)
+        print(f"{graph_class.__name__}: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+        with tempfile.TemporaryDirectory() as directory:
+            size, save_time = timed(save_pickle_and_gml, directory, graph)
+            _, load_time = timed(load_pickle, os.path.join(directory, consts.GRAPH_OUTPUT_FILE_NAME))
+            print(f"  {'pickle + gml':<22} save: {save_time:6.2f}s  size: {size / 2 ** 20:7.1f} MB  "
+                  f"load: {load_time:6.2f}s")
+
+            path = os.path.join(directory, consts.GRAPH_SNAPSHOT_FILE_NAME)
+            for compress in (True, False):
+                size, save_time = timed(save_snapshot, path, graph, compress=compress)
+                _, load_time = timed(load_snapshot, path, config=config)
+                name = f"snapshot{' (compressed)' if compress else ''}"
+                print(f"  {name:<22} save: {save_time:6.2f}s  size: {size / 2 ** 20:7.1f} MB  "
+                      f"load: {load_time:6.2f}s")
+
+            index_path = os.path.join(directory, consts.GRAPH_INDEX_FILE_NAME)
+            size, save_time = timed(save_index, index_path, graph)
+            index, open_time = timed(MappedGraph, index_path)
+            _, top_n_time = timed(index.get_top_n_for_each_domain, 5)
+            print(f"  {'index':<22} save: {save_time:6.2f}s  size: {size / 2 ** 20:7.1f} MB  "
+                  f"open: {open_time:6.3f}s  first top urls: {open_time + top_n_time:6.3f}s")
+            loaded, load_time = timed(load_snapshot, path, config=config)
+            _, top_n_time = timed(loaded.get_top_n_for_each_domain, 5)
+            print(f"  {'full load':<22} first top urls: {load_time + top_n_time:6.2f}s")
+
+            # A recrawl of 1% of the pages
+            recrawl = build(graph_class, crawl[:max(1, len(crawl) // 100)], config, batch=True)
+            graph_log = GraphLog(os.path.join(directory, consts.GRAPH_LOG_FILE_NAME))
+            _, append_time = timed(graph_log.append, recrawl)
+            print(f"  {'recrawl log append':<22} save: {append_time:6.2f}s  size: {graph_log.size / 2 ** 10:7.1f} KB  "
+                  f"replay: {timed(graph_log.replay, loaded)[1]:6.2f}s")
+            graph_log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the pagerank of the CSR snapshot engine with nx.pagerank on random graphs of growing size.
+
+Run from the project directory:
+    python -m testing.benchmark.bench_ranking --edges 10000 100000 1000000 5000000
+"""
+import argparse
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PROJECT_DIR", PROJECT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+import networkx as nx
+import numpy as np
+
+from src.data_structure.graph.ranking import GraphSnapshot, pagerank
+
+
+def random_graph(edges: int, seed: int = 0) -> nx.Graph:
+    """A web like graph: url nodes of a few hundred domains with 4 edges per node on average"""
+    rng = np.random.default_rng(seed)
+    nodes = max(10, edges // 4)
+    names = [f"https://site{i % 500}.com/page{i}" for i in range(nodes)]
+    graph = nx.Graph()
+    graph.add_nodes_from((name, {"domain": f"site{i % 500}.com", "type": "url"}) for i, name in enumerate(names))
+    # Preferential attachment like degrees: the targets are skewed to the first nodes
+    sources = rng.integers(0, nodes, edges)
+    targets = (nodes * rng.random(edges) ** 3).astype(np.int64)
+    weights = rng.random(edges)
+    graph.add_weighted_edges_from((names[u], names[v], w) for u, v, w in zip(sources.tolist(), targets.tolist(),
+                                                                             weights.tolist()))
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edges", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--networkx-max-edges", type=int, default=1_000_000,
+                        help="Skip nx.pagerank on bigger graphs, it needs a lot of time and memory")
+    parser.add_argument("--tol", type=float, default=1.0e-6)
+    args = parser.parse_args()
+
+    for edges in args.edges:
+        graph = random_graph(edges)
+
+        start = time.perf_counter()
+        snapshot = GraphSnapshot.from_graph(graph)
+        snapshot_time = time.perf_counter() - start
+        start = time.perf_counter()
+        ranks = pagerank(snapshot, tol=args.tol)
+        rank_time = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot.top_k_per_domain(ranks, 5)
+        top_k_time = time.perf_counter() - start
+        line = (f"{graph.number_of_edges():>9} edges  snapshot: {snapshot_time:7.2f}s  pagerank: {rank_time:7.2f}s  "
+                f"top 5 per domain: {top_k_time:6.2f}s")
+
+        if graph.number_of_edges() <= args.networkx_max_edges:
+            start = time.perf_counter()
+            expected = nx.pagerank(graph, weight="weight", tol=args.tol)
+            nx_time = time.perf_counter() - start
+            error = max(abs(rank - expected[node]) for node, rank in snapshot.to_dict(ranks).items())
+            line += f"  nx.pagerank: {nx_time:7.2f}s  speedup: {nx_time / (snapshot_time + rank_time):5.1f}x  " \
+                    f"max error: {error:.1e}"
+        print(line)
+        del graph, snapshot
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Compare the memory and the speed of the visited set backends with a plain python set of urls.
+
+Run from the project directory:
+    python -m testing.benchmark.bench_visited --urls 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PROJECT_DIR", PROJECT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+from src.crawler.visited import BloomVisitedSet, ExactVisitedSet, FingerprintVisitedSet
+
+
+def measure(name, visited, urls, missing):
+    start = time.perf_counter()
+    for url in urls:
+        visited.add(url)
+    add_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for url in urls:
+        url in visited
+    hit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    false_positives = sum(url in visited for url in missing)
+    miss_time = time.perf_counter() - start
+
+    n = len(urls)
+    print(f"{name:<12} memory: {visited.memory_usage() / 2 ** 20:8.1f} MB  "
+          f"add: {n / add_time / 1000:7.0f}k/s  hit lookup: {n / hit_time / 1000:7.0f}k/s  "
+          f"miss lookup: {len(missing) / miss_time / 1000:7.0f}k/s  false positives: {false_positives}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    args = parser.parse_args()
+
+    urls = [f"university{i % 997}.edu/department/{i // 997}/staff/page-{i}" for i in range(args.urls)]
+    missing = [f"university{i % 997}.edu/missing/{i}" for i in range(args.urls // 10)]
+    measure("exact", ExactVisitedSet(), urls, missing)
+    measure("fingerprint", FingerprintVisitedSet(capacity=args.urls), urls, missing)
+    measure("bloom", BloomVisitedSet(capacity=args.urls, error_rate=args.error_rate), urls, missing)
+
+
+if __name__ == '__main__':
+    main()
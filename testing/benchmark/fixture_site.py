@@ -0,0 +1,71 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FixtureSite:
+    """
+    A small local web site used by the benchmarks. Every page links to `links_per_page` other pages of the site and
+    contains a few email addresses. Some of the pages can be made slow to simulate a slow host.
+    """
+
+    def __init__(self, pages=500, links_per_page=8, emails_per_page=2, slow_ratio=0.0, slow_delay=0.0,
+                 padding=20_000, seed=0):
+        self.pages = pages
+        self.links_per_page = links_per_page
+        self.emails_per_page = emails_per_page
+        self.slow_ratio = slow_ratio
+        self.slow_delay = slow_delay
+        self.padding = padding
+        self._random = random.Random(seed)
+        self._links = {
+            i: self._random.sample(range(pages), min(links_per_page, pages))
+            for i in range(pages)
+        }
+        self._slow = {i for i in range(pages) if self._random.random() < slow_ratio}
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def page(self, i: int, base_url: str = None) -> bytes:
+        base_url = base_url or self.url
+        links = "".join(f'<li><a href="{base_url}/page{j}">page {j}</a></li>' for j in self._links[i])
+        emails = " ".join(f"<p>contact: person{i}x{k}@site{k % 3}.org</p>" for k in range(self.emails_per_page))
+        filler = "<p>" + "lorem ipsum " * (self.padding // 12) + "</p>"
+        return f"<html><body><h1>Page {i}</h1><ul>{links}</ul>{emails}{filler}</body></html>".encode()
+
+    def start(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with site._lock:
+                    site.hits += 1
+                path = self.path.strip("/")
+                index = int(path[len("page"):]) if path.startswith("page") else 0
+                if index in site._slow:
+                    time.sleep(site.slow_delay)
+                body = site.page(index % site.pages)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,131 @@
+import pickle
+import random
+import unittest
+
+import src.utils.constants as consts
+from src.data_structure.array_graph.array_graph import ArrayGraph
+from src.data_structure.factory import combine_graphs, create_graph
+from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.data_structure.graph.graph import WebGraph, serialize_graph
+from src.utils.config import Config
+
+
+def crawl_results(pages: int, seed: int = 0) -> list:
+    """The callback results of a crawl of a few sites that link to each other and share some emails"""
+    rng = random.Random(seed)
+    results = []
+    for page in range(pages):
+        domain = f"site{page % 4}.com"
+        url = f"https://www.{domain}/page{page}"
+        results.append(CallbackResult(domain=domain, url=domain, data=url, type="url"))
+        for _ in range(3):
+            linked = rng.randrange(pages)
+            results.append(CallbackResult(domain=domain, url=url, data=f"https://site{linked % 4}.com/page{linked}",
+                                          type="url"))
+        for _ in range(rng.randrange(3)):
+            name = rng.choice(["john.doe", "jane", "info", "mary-ann", "a", f"user{page}"])
+            results.append(CallbackResult(domain=domain, url=url, data=f"{name}@{rng.choice(['gmail.com', domain])}",
+                                          type="email"))
+    return results
+
+
+class TestArrayGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        self.config.config.read_dict({consts.GRAPH_SECTION: {consts.ALPHA_CONFIG_TOKEN: "0.8",
+                                                             consts.RANKING_TOLERANCE_CONFIG_TOKEN: "1e-9"}})
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.ALPHA_CONFIG_TOKEN)
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.RANKING_TOLERANCE_CONFIG_TOKEN)
+
+    def _build(self, graph_class, results_parts):
+        graphs = []
+        for results in results_parts:
+            graph = graph_class(config=self.config)
+            for result in results:
+                graph.add(result)
+            graphs.append(graph)
+        combined = graph_class(config=self.config)
+        for graph in graphs:
+            combined.merge_graph(graph)
+        return combined
+
+    def test_same_graph_as_networkx(self):
+        results = crawl_results(60)
+        # Build the graph out of three crawls with overlapping results, like the crawlers of a build
+        parts = [results[:100], results[80:200], results[150:] + results[:10]]
+        web_graph, array_graph = self._build(WebGraph, parts), self._build(ArrayGraph, parts)
+        self.assertIsInstance(array_graph, ArrayGraph)
+
+        self.assertEqual(set(array_graph.nodes), set(web_graph.nodes))
+        self.assertEqual({frozenset(edge) for edge in array_graph.edges}, {frozenset(edge) for edge in web_graph.edges})
+        self.assertEqual(array_graph.cache[consts.EMAIL_TYPE_TOKEN], web_graph.cache[consts.EMAIL_TYPE_TOKEN])
+
+        top_n = {domain: nodes for result in web_graph.get_top_n_for_each_domain(3) for domain, nodes in result.items()}
+        ranking = web_graph.get_ranking()
+        array_ranking = array_graph.get_ranking()
+        for node, rank in ranking.items():
+            self.assertAlmostEqual(array_ranking[node], rank, places=7)
+
+        array_top_n = array_graph.get_top_n_for_each_domain(3)
+        self.assertEqual(len(array_top_n), len(top_n))
+        for result in array_top_n:
+            (domain, nodes), = result.items()
+            self.assertEqual([round(ranking[node], 7) for node in nodes],
+                             [round(ranking[node], 7) for node in top_n[domain]])
+        self.assertEqual(array_graph.get_top_n_for_each_domain(3, domains=["site1.com", "missing.com"]),
+                         [{"site1.com": [r for r in array_top_n if "site1.com" in r][0]["site1.com"]},
+                          {"missing.com": []}])
+
+        # The exports see the same graph with the same weights
+        weights = {frozenset((u, v)): w for u, v, w in array_graph.to_networkx().edges(data="weight")}
+        for u, v, w in web_graph.edges(data="weight"):
+            self.assertAlmostEqual(weights[frozenset((u, v))], w, places=12)
+        self.assertEqual(len(serialize_graph(array_graph)["nodes"]), len(web_graph))
+
+    def test_ranking_is_updated(self):
+        results = crawl_results(40)
+        graph = ArrayGraph(config=self.config)
+        for result in results[:60]:
+            graph.add(result)
+        top_n = graph.get_top_n_for_each_domain(2)
+        self.assertIs(graph.get_top_n_for_each_domain(2), top_n)
+
+        for result in results[60:]:
+            graph.add(result)
+        web_graph = self._build(WebGraph, [results])
+        # The networkx graph weights its edges for the top n queries only
+        web_graph.get_top_n_for_each_domain(2)
+        expected = web_graph.get_ranking()
+        ranking = graph.get_ranking()
+        for node, rank in expected.items():
+            self.assertAlmostEqual(ranking[node], rank, places=7)
+
+    def test_pickle(self):
+        graph = self._build(ArrayGraph, [crawl_results(20)])
+        graph.get_ranking()
+        graph.add(CallbackResult(domain="site0.com", url="https://site0.com/page0", data="new@site0.com",
+                                 type="email"))
+        loaded = pickle.loads(pickle.dumps(graph))
+        self.assertEqual(loaded.edges, graph.edges)
+        self.assertEqual(loaded.get_ranking(), graph.get_ranking())
+
+    def test_factory(self):
+        self.assertIsInstance(create_graph(self.config), WebGraph)
+        self.config.config.set(consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN, "array")
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN)
+        self.assertIsInstance(create_graph(self.config), ArrayGraph)
+        self.config.config.set(consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN, "missing")
+        self.assertRaises(ValueError, create_graph, self.config)
+
+    def test_combine_graphs(self):
+        results = crawl_results(40)
+        web_graph = self._build(WebGraph, [results[:30]])
+        array_graph = self._build(ArrayGraph, [results[30:]])
+        self.config.config.set(consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN, "array")
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN)
+        # The backend of the config is used whatever the order of the graphs, a crawler that failed has no graph
+        for graphs in ([None, web_graph, array_graph], [array_graph, web_graph]):
+            combined = combine_graphs(graphs, config=self.config)
+            self.assertIsInstance(combined, ArrayGraph)
+            self.assertEqual(set(combined.nodes), set(self._build(WebGraph, [results]).nodes))
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import src.utils.constants as consts
+from src.crawler.checkpoint import CrawlCheckpoint
+from src.crawler.crawler import WebSpider
+from src.crawler.filter import UrlFilter
+from src.crawler.frontier import Frontier
+from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.data_structure.graph.graph import WebGraph
+from src.utils.config import Config
+from testing.benchmark.fixture_site import FixtureSite
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "checkpoint.sqlite")
+        self.config = Config()
+        settings = {consts.MAX_DEPTH_CONFIG_TOKEN: "3",
+                    consts.MAX_REQUEST_CONFIG_TOKEN: "4",
+                    consts.MAX_RETIRES_CONFIG_TOKEN: "5",
+                    consts.TIMEOUT_CONFIG_TOKEN: "5",
+                    consts.HOST_RATE_CONFIG_TOKEN: "0"}
+        self.config.config.read_dict({consts.CRAWLER_SECTION: settings})
+        for token in settings:
+            self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, token)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_changes_are_written_every_interval(self):
+        checkpoint = CrawlCheckpoint(self.path, interval=3600)
+        frontier = Frontier(UrlFilter({}), checkpoint=checkpoint)
+        frontier.add_seeds(["https://www.test.com", "https://test.com/staff"])
+        checkpoint.append(CallbackResult("test.com", "test.com", "john@test.com", consts.EMAIL_TYPE_TOKEN))
+        frontier.task_done(frontier.pop()[0])
+
+        # The interval has not passed yet so nothing was written
+        self.assertEqual(CrawlCheckpoint(self.path).load(), ([], [], []))
+
+        checkpoint.flush()
+        queue, seen, records = CrawlCheckpoint(self.path).load()
+        self.assertEqual(queue, [("https://test.com/staff", 0)])
+        self.assertEqual(sorted(seen), ["test.com", "test.com/staff"])
+        self.assertEqual([record.data for record in records], ["john@test.com"])
+        checkpoint.close()
+
+    def test_resume_crawl(self):
+        site = FixtureSite(pages=30, links_per_page=3, padding=0).start()
+        try:
+            # First crawl, stopped after the seed page
+            checkpoint = CrawlCheckpoint(self.path, interval=0)
+            self.config.config.set(consts.CRAWLER_SECTION, consts.MAX_DEPTH_CONFIG_TOKEN, "0")
+            spider = WebSpider(callbacks=[], url_filter=UrlFilter({}), start_seed=f"{site.url}/page0",
+                               config=self.config, checkpoint=checkpoint)
+            first_graph = asyncio.run(spider.crawl())
+            checkpoint.flush()
+            self.assertEqual(site.hits, 1)
+
+            # Fake the links of the seed page waiting in the frontier, as if the crawl had been stopped there
+            checkpoint.push([f"{site.url}/page{i}" for i in site._links[0]],
+                            [f"127.0.0.1:{site.url.split(':')[-1]}/page{i}" for i in site._links[0]], depth=1)
+            checkpoint.close()
+
+            # Resume
+            checkpoint = CrawlCheckpoint(self.path, interval=0)
+            queue, seen, records = checkpoint.load()
+            url_filter = UrlFilter({})
+            frontier = Frontier(url_filter, checkpoint=checkpoint)
+            frontier.restore(queue, seen)
+            resumed_graph = WebGraph(config=self.config)
+            for record in records:
+                resumed_graph.add(record)
+            self.assertEqual(set(resumed_graph.edges), set(first_graph.edges))
+
+            self.config.config.set(consts.CRAWLER_SECTION, consts.MAX_DEPTH_CONFIG_TOKEN, "1")
+            spider = WebSpider(callbacks=[], url_filter=url_filter, start_seed=f"{site.url}/page0",
+                               config=self.config, frontier=frontier, checkpoint=checkpoint)
+            asyncio.run(spider.crawl())
+            checkpoint.close()
+        finally:
+            site.stop()
+
+        # The seed page was not fetched again
+        self.assertEqual(site.hits, 1 + len(set(site._links[0]) - {0}))
@@ -0,0 +1,52 @@
+import re
+import unittest
+
+import src.utils.constants as consts
+from src.crawler.filter import DomainRules, UrlFilter
+
+
+class TestUrlFilter(unittest.TestCase):
+
+    def test_domain_rules(self):
+        url_filter = UrlFilter({consts.DOMAIN_FILTER: "youtube.com, www.facebook.com, forms.gle",
+                                consts.SUBDOMAIN_FILTER: ""})
+        for url in ("https://youtube.com/watch", "https://www.youtube.com/watch", "https://m.YouTube.com:443/x",
+                    "https://facebook.com/page", "http://forms.gle/abc"):
+            self.assertFalse(url_filter.is_valid_domain(url), url)
+        # The rules match whole labels of the host only
+        for url in ("https://oo.com/", "https://myyoutube.com/", "https://youtube.com.evil.org/",
+                    "https://www.test.com/youtube.com", "https://gle/"):
+            self.assertTrue(url_filter.is_valid_domain(url), url)
+
+    def test_subdomain_rules(self):
+        rules = DomainRules("bbc.co.uk", "www, m")
+        self.assertTrue(rules.is_blocked("https://www.bbc.co.uk/news"))
+        self.assertTrue(rules.is_blocked("https://m.bbc.co.uk/news"))
+        self.assertFalse(rules.is_blocked("https://bbc.co.uk/news"))
+        self.assertFalse(rules.is_blocked("https://sport.bbc.co.uk/"))
+
+        rules = DomainRules("", "m")
+        self.assertTrue(rules.is_blocked("https://m.test.com/"))
+        self.assertFalse(rules.is_blocked("https://www.test.com/"))
+
+    def test_no_domain_rules(self):
+        url_filter = UrlFilter({})
+        self.assertFalse(url_filter.domain_rules)
+        self.assertTrue(url_filter.is_valid_domain("https://youtube.com/"))
+
+    def test_filter_drops(self):
+        url_filter = UrlFilter({consts.DOMAIN_FILTER: "youtube.com",
+                                consts.PATTERN_RULES: "^/people\n.*/staff$"})
+        urls = ["https://www.test.com/people/john", "https://www.test.com/about/staff", "https://www.test.com/about",
+                "ftp://www.test.com/people", "https://youtube.com/people", "https://www.test.com/people/cv.PDF",
+                "https://test.com/people/john/"]
+        self.assertEqual(url_filter.filter(urls), urls[:2])
+        self.assertEqual(url_filter.stats, {"path": 1, "scheme": 1, "domain": 1, "extension": 1, "duplicate": 1})
+        self.assertFalse(url_filter.is_allowed("https://www.test.com/staff/john"))
+        self.assertEqual(url_filter.stats["path"], 2)
+
+    def test_filter_batch(self):
+        url_filter = UrlFilter({consts.PATTERN_RULES: [re.compile("/a"), "/b"]})
+        links = [("x", "https://test.com/a"), ("y", "https://test.com/c"), ("z", "https://test.com/b.jpg")]
+        self.assertEqual(url_filter.filter_allowed(links, key=lambda link: link[1]), links[:1])
+        self.assertRaises(re.error, UrlFilter, {consts.PATTERN_RULES: "(unclosed"})
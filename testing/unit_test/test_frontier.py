@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import unittest
+
+import src.utils.constants as consts
+from src.crawler.crawler import WebSpider
+from src.crawler.filter import UrlFilter
+from src.crawler.frontier import Frontier
+from src.data_structure.factory import combine_graphs
+from src.utils.config import Config
+from testing.benchmark.fixture_site import FixtureSite
+
+
+class TestFrontier(unittest.TestCase):
+
+    def setUp(self):
+        self.frontier = Frontier(UrlFilter({}))
+
+    def test_duplicates_are_not_queued(self):
+        self.frontier.add_seeds(["https://www.test.com/", "https://test.com"])
+        self.frontier.push(["https://test.com/a", "https://www.test.com/a/", "https://test.com"], depth=1)
+        self.assertEqual(len(self.frontier), 2)
+
+    def test_done_only_when_nothing_in_progress(self):
+        self.frontier.add_seeds(["https://test.com"])
+        self.assertEqual(self.frontier.pop(), ("https://test.com", 0))
+        self.assertIsNone(self.frontier.pop())
+        self.assertFalse(self.frontier.is_done())
+        self.frontier.task_done("https://test.com")
+        self.assertTrue(self.frontier.is_done())
+
+
+class TestSharedFrontier(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        settings = {consts.MAX_DEPTH_CONFIG_TOKEN: "3",
+                    consts.MAX_REQUEST_CONFIG_TOKEN: "4",
+                    consts.MAX_RETIRES_CONFIG_TOKEN: "5",
+                    consts.TIMEOUT_CONFIG_TOKEN: "5",
+                    consts.HOST_RATE_CONFIG_TOKEN: "0"}
+        self.config.config.read_dict({consts.CRAWLER_SECTION: settings})
+        for token in settings:
+            self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, token)
+        self.site = FixtureSite(pages=60, links_per_page=4, padding=0).start()
+
+    def tearDown(self):
+        self.site.stop()
+
+    def test_empty_frontier_is_shared(self):
+        # The frontier of a build is handed to the crawlers before any seed is pushed to it
+        frontier = Frontier(UrlFilter({}))
+        spider = WebSpider(callbacks=[], url_filter=UrlFilter({}), start_seed=self.site.url, config=self.config,
+                           frontier=frontier)
+        self.assertIs(spider._frontier, frontier)
+
+    def test_overlapping_seeds_fetch_each_page_once(self):
+        seeds = [f"{self.site.url}/page0", f"{self.site.url}/page1"]
+        url_filter = UrlFilter({})
+        frontier = Frontier(url_filter)
+        frontier.add_seeds(seeds)
+        spiders = [WebSpider(callbacks=[], url_filter=url_filter, start_seed=seed, config=self.config,
+                             frontier=frontier)
+                   for seed in seeds]
+
+        graphs = [None] * len(spiders)
+
+        def run(i):
+            graphs[i] = asyncio.run(spiders[i].crawl())
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(spiders))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.site.hits, len(url_filter.seen))
+        graph = combine_graphs(graphs)
+        # Every crawled page is in the graph even though each page was fetched by one crawler only
+        self.assertTrue(set(url_filter.seen) <= set(graph.nodes))
@@ -1,8 +1,18 @@
 import unittest
+from unittest import mock
+
+import networkx as nx
+
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 
 from src.data_structure.graph.callbacks.callback import CallbackResult
 from src.data_structure.graph.graph import WebGraph
+from src.data_structure.graph.ranking import pagerank
+from src.data_structure.graph.utils import EMAIL_NAME_REGEX, EmailDomainDistributioner, EmailNameTFIDFTransformer, \
+    NodeDataNormalizer, email_domain_extractor, email_name_normalizer
 from src.utils.config import Config
+import src.utils.constants as consts
 
 
 class TestGraph(unittest.TestCase):
@@ -30,3 +40,179 @@ class TestGraph(unittest.TestCase):
         # Check that the caches were merged
         self.assertEqual(len(self.graph1.cache['url']), 2)
         self.assertEqual(len(self.graph1.cache['email']), 2)
+
+    EMAILS = {
+        "http://www.test.com/staff": ["john.doe@test.com", "jane@gmail.com", "a@test.com"],
+        "http://www.test.com/contact": ["john.doe@test.com", "info@test.com"],
+        "http://www.other.org/people": ["jane@gmail.com", "mary-ann@other.org", "JOHN.DOE@other.org"],
+        "http://www.other.org/about": ["info@other.org"],
+    }
+
+    @staticmethod
+    def _add_emails(graph: WebGraph, emails: dict):
+        for url, url_emails in emails.items():
+            domain = url.split("www.")[1].split("/")[0]
+            graph.add(CallbackResult(domain=domain, url=domain, data=url, type="url"))
+            for email in url_emails:
+                graph.add(CallbackResult(domain=domain, url=url, data=email, type="email"))
+
+    def test_edge_weights(self):
+        self._add_emails(self.graph1, self.EMAILS)
+        self.graph1._alpha = 0.8
+
+        expected = self._dense_edge_weights(self.graph1)
+        self.graph1._add_weights_scores()
+
+        weights = {(u, v): w for u, v, w in self.graph1.edges(data="weight")}
+        self.assertEqual(weights.keys(), expected.keys())
+        for edge, weight in expected.items():
+            self.assertAlmostEqual(weights[edge], weight, places=12, msg=edge)
+        self.assertTrue(any(weight > 0 for weight in weights.values()))
+
+    def test_corpus_is_updated(self):
+        self._add_emails(self.graph1, dict(list(self.EMAILS.items())[:2]))
+        self.graph1._corpus.get_tfidf()
+        self._add_emails(self.graph2, dict(list(self.EMAILS.items())[1:]))
+        self.graph2.add(CallbackResult(domain="test.com", url="http://www.test.com/staff", data="Bob@Gmail.com",
+                                       type="email"))
+        self.graph1.merge_graph(self.graph2)
+        # Adding an edge again does not count it twice
+        self._add_emails(self.graph1, self.EMAILS)
+
+        urls, name_corpus, domain_corpus = self._build_corpus(self.graph1)
+        tfidf_matrix, vocabulary, rows = self.graph1._corpus.get_tfidf()
+        expected_matrix = EmailNameTFIDFTransformer()
+        expected = expected_matrix.fit_transform(name_corpus).toarray()
+        self.assertEqual(set(vocabulary), set(expected_matrix.vocabulary_))
+        for url, row in zip(urls, expected):
+            for term, column in expected_matrix.vocabulary_.items():
+                self.assertAlmostEqual(tfidf_matrix[rows[url], vocabulary[term]], row[column], places=12)
+
+        expected_proba = EmailDomainDistributioner().fit_transform(domain_corpus)
+        domain_proba = self.graph1._corpus.get_domain_proba()
+        self.assertEqual(set(domain_proba), set(expected_proba.index))
+        for domain, proba in expected_proba.items():
+            self.assertAlmostEqual(domain_proba[domain], proba, places=12)
+
+    def test_ranking_is_cached(self):
+        self._add_emails(self.graph1, self.EMAILS)
+        self.graph1._alpha = 0.8
+        with mock.patch("src.data_structure.graph.graph.pagerank", wraps=pagerank) as ranking_engine:
+            top_n = self.graph1.get_top_n_for_each_domain(2)
+            self.assertIs(self.graph1.get_top_n_for_each_domain(2), top_n)
+            self.assertIs(self.graph1.get_ranking(), self.graph1.get_ranking())
+            self.assertEqual(ranking_engine.call_count, 1)
+            # Only the results of the last queries are kept
+            for n in range(1, consts.TOP_N_CACHE_SIZE + 10):
+                self.graph1.get_top_n_for_each_domain(n)
+            self.assertEqual(len(self.graph1._top_n), consts.TOP_N_CACHE_SIZE)
+            self.assertIsNot(self.graph1.get_top_n_for_each_domain(2), top_n)
+
+            version = self.graph1.version
+            self.graph1.add(CallbackResult(domain="test.com", url="http://www.test.com/staff",
+                                           data="http://www.test.com/jobs", type="url"))
+            self.assertGreater(self.graph1.version, version)
+            self.graph1.get_top_n_for_each_domain(2)
+            self.assertEqual(ranking_engine.call_count, 2)
+            # The second ranking started from the first one
+            self.assertIsNotNone(ranking_engine.call_args.kwargs["nstart"])
+
+        expected = nx.pagerank(self.graph1, weight="weight")
+        ranking = self.graph1.get_ranking()
+        for node, rank in expected.items():
+            self.assertAlmostEqual(ranking[node], rank, places=5)
+
+    def test_domain_index(self):
+        self._add_emails(self.graph1, self.EMAILS)
+        self._add_emails(self.graph2, {"http://www.new.net/team": ["team@new.net"]})
+        self.graph2.add(CallbackResult(domain="new.net", url="http://www.new.net/team",
+                                       data="http://www.new.net/jobs", type="url"))
+        self.graph1.merge_graph(self.graph2)
+        # A node that moves to another domain leaves the cluster of its old domain
+        self.graph1.add_domain_attr_to_node("test.com/contact", "contact.test.com")
+
+        clusters = {}
+        for node, attributes in self.graph1.nodes(data=True):
+            if attributes["type"] == "url":
+                clusters.setdefault(attributes["domain"], set()).add(node)
+        self.assertEqual(self.graph1._domains, clusters)
+        self.assertIn("contact.test.com", clusters)
+
+        self.graph1._alpha = 0.8
+        ranking = self.graph1.get_ranking()
+        top_n = self.graph1.get_top_n_for_each_domain(2)
+        self.assertEqual(len(top_n), len(clusters))
+        for result in top_n:
+            (domain, nodes), = result.items()
+            self.assertEqual([ranking[node] for node in nodes],
+                             sorted((ranking[node] for node in clusters[domain]), reverse=True)[:2])
+
+        self.assertEqual(self.graph1.get_top_n_for_each_domain(2, domains=["new.net", "missing.com"]),
+                         [{"new.net": [r["new.net"] for r in top_n if "new.net" in r][0]}, {"missing.com": []}])
+
+    @staticmethod
+    def _build_corpus(graph: WebGraph):
+        """A corpus of the emails of every url, built from the whole graph"""
+        urls, name_corpus, domain_corpus = [], [], []
+        for url in graph.nodes:
+            if graph.nodes[url]['type'] != "url":
+                continue
+            emails = [n for n in graph.neighbors(url) if graph.nodes[n]['type'] != "url"]
+            if emails:
+                urls.append(url)
+                name_corpus.append(" ".join(email_name_normalizer(email) for email in emails))
+                domain_corpus.append(" ".join(email.split("@")[1] for email in emails))
+        return urls, name_corpus, domain_corpus
+
+    @classmethod
+    def _dense_edge_weights(cls, graph: WebGraph) -> dict:
+        """The edge weights as they were computed with dense pandas frames, one cell at a time"""
+        urls, name_corpus, domain_corpus = cls._build_corpus(graph)
+        vectorizer = TfidfVectorizer(use_idf=True, lowercase=False, smooth_idf=True)
+        tfidf_df = pd.DataFrame(vectorizer.fit_transform(name_corpus).toarray(),
+                                columns=vectorizer.get_feature_names_out())
+        vectorizer = CountVectorizer(token_pattern=EMAIL_NAME_REGEX)
+        count_df = pd.DataFrame(vectorizer.fit_transform(domain_corpus).toarray(),
+                                columns=vectorizer.get_feature_names_out())
+        domain_proba = count_df.sum() / count_df.sum().sum()
+
+        weights = {(u, v): w for u, v, w in graph.edges(data="weight")}
+        for idx, url in enumerate(urls):
+            if url == graph.nodes[url]['domain']:
+                continue
+            for neighbor in graph.neighbors(url):
+                try:
+                    if graph.nodes[neighbor]['type'] != "url":
+                        score = tfidf_df.loc[idx, email_name_normalizer(neighbor)].item() * graph._alpha + \
+                                domain_proba[email_domain_extractor(neighbor)] * (1 - graph._alpha)
+                    else:
+                        score = 0
+                except KeyError:
+                    continue
+                edge = (url, neighbor) if (url, neighbor) in weights else (neighbor, url)
+                weights[edge] = score
+        return weights
+
+    def test_add_many(self):
+        results = [CallbackResult(domain="test.com", url="http://www.test.com/staff", data="http://www.test.com/a/",
+                                  type="url"),
+                   CallbackResult(domain="test.com", url="http://www.test.com/staff", data="john.doe@test.com",
+                                  type="email"),
+                   CallbackResult(domain="test.com", url="http://www.test.com/contact", data="https://other.org/b",
+                                  type="url")]
+        for result in results:
+            self.graph1.add(result)
+        journal = mock.Mock()
+        self.graph2.journal = journal
+        self.graph2.add_many(iter(results))
+
+        self.assertEqual(dict(self.graph2.nodes(data=True)), dict(self.graph1.nodes(data=True)))
+        self.assertEqual(set(self.graph2.edges), set(self.graph1.edges))
+        self.assertIn("test.com/a", self.graph2)
+        self.assertEqual(self.graph2.version, 1)
+        # The records are normalized once and the results themselves are left as they are
+        records = journal.extend.call_args.args[0]
+        self.assertEqual(records[0].url, "test.com/staff")
+        self.assertEqual(results[0].data, "http://www.test.com/a/")
+        self.assertIs(NodeDataNormalizer.normalize(records[0]), records[0])
+        self.assertRaises(TypeError, self.graph2.add, {"url": "test.com"})
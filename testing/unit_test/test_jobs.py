@@ -0,0 +1,86 @@
+import asyncio
+import json
+import threading
+import unittest
+
+import src.utils.constants as consts
+from src.crawler.crawler import WebSpider
+from src.crawler.filter import UrlFilter
+from src.crawler.frontier import Frontier
+from src.server.jobs import BuildJobManager, CANCELLED_STATUS, DONE_STATUS, FAILED_STATUS, RUNNING_STATUS
+from src.server.views.view import stream_job
+from src.utils.config import Config
+from testing.benchmark.fixture_site import FixtureSite
+
+
+class TestBuildJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        settings = {consts.MAX_DEPTH_CONFIG_TOKEN: "10",
+                    consts.MAX_REQUEST_CONFIG_TOKEN: "2",
+                    consts.TIMEOUT_CONFIG_TOKEN: "5",
+                    consts.HOST_RATE_CONFIG_TOKEN: "0"}
+        self.config.config.read_dict({consts.CRAWLER_SECTION: settings})
+        for token in settings:
+            self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, token)
+        self.manager = BuildJobManager()
+
+    def test_jobs_run_in_the_background(self):
+        release = threading.Event()
+        first = self.manager.submit({}, build=lambda job: release.wait(5) and {"nodes": []})
+        failing = self.manager.submit({}, build=lambda job: 1 / 0)
+        queued = self.manager.submit({}, build=lambda job: {"nodes": []})
+        self.assertTrue(self.manager.cancel(queued.id).cancelled)
+        self.assertEqual(queued.status, CANCELLED_STATUS)
+
+        release.set()
+        self.assertTrue(first.wait(5) and failing.wait(5))
+        self.assertEqual((first.status, first.result), (DONE_STATUS, {"nodes": []}))
+        self.assertEqual(failing.status, FAILED_STATUS)
+        self.assertIn("division by zero", failing.error)
+        self.assertIs(self.manager.get(first.id), first)
+        self.assertIsNone(self.manager.get("missing"))
+        # A finished job can not be cancelled
+        self.assertFalse(first.cancel())
+
+    def test_result_points_to_the_graph(self):
+        job = self.manager.submit({}, build=lambda job: {"workspace": "team-a", "version": 2, "nodes": 3},
+                                  workspace="team-a")
+        self.assertTrue(job.wait(5))
+        result = json.loads(list(stream_job(job, interval=0.05))[-1])["result"]
+        # The job keeps the summary of the build, the graph is read from the endpoints of its workspace
+        self.assertEqual(result["nodes"], 3)
+        self.assertEqual(result["top_urls"], "/top_urls?workspace=team-a")
+        self.assertEqual(result["export_gml"], "/export/gml?workspace=team-a")
+
+    def test_cancel_a_running_crawl(self):
+        site = FixtureSite(pages=300, links_per_page=4, padding=0, slow_ratio=1.0, slow_delay=0.02).start()
+        self.addCleanup(site.stop)
+        started = threading.Event()
+
+        def build(job):
+            url_filter = UrlFilter({})
+            frontier = Frontier(url_filter)
+            spider = WebSpider(callbacks=[], url_filter=url_filter, start_seed=f"{site.url}/page0",
+                               config=self.config, frontier=frontier)
+            job.attach([spider], frontier)
+            started.set()
+            return asyncio.run(spider.crawl())
+
+        job = self.manager.submit({}, build=build)
+        self.assertTrue(started.wait(5))
+        lines = stream_job(job, interval=0.05)
+        progress = json.loads(next(lines))
+        self.assertEqual(progress["status"], RUNNING_STATUS)
+        self.assertTrue(job.cancel())
+        self.assertTrue(job.wait(10))
+
+        lines = [progress] + [json.loads(line) for line in lines]
+        self.assertEqual(lines[-1]["status"], CANCELLED_STATUS)
+        self.assertNotIn("result", lines[-1])
+        # Every fetched page was streamed once, and the crawl stopped before the whole site was fetched
+        pages = [page for line in lines for page in line["pages"]]
+        self.assertEqual(len(pages), len(set(pages)))
+        self.assertEqual(len(pages), lines[-1]["progress"]["pages"])
+        self.assertLess(len(pages), 300)
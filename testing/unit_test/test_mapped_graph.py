@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+import src.utils.constants as consts
+from src.data_structure.array_graph.array_graph import ArrayGraph
+from src.data_structure.graph.graph import WebGraph
+from src.data_structure.mapped_graph import MappedGraph, save_index
+from src.data_structure.persistence import load_snapshot, save_snapshot
+from src.utils.config import Config
+from testing.unit_test.test_array_graph import crawl_results
+
+
+class TestMappedGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        self.config.config.read_dict({consts.GRAPH_SECTION: {consts.ALPHA_CONFIG_TOKEN: "0.8",
+                                                             consts.RANKING_TOLERANCE_CONFIG_TOKEN: "1e-9"}})
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.ALPHA_CONFIG_TOKEN)
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.RANKING_TOLERANCE_CONFIG_TOKEN)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, consts.GRAPH_INDEX_FILE_NAME)
+
+    def test_queries(self):
+        for graph_class in (WebGraph, ArrayGraph):
+            graph = graph_class(config=self.config)
+            graph.add_many(crawl_results(60))
+            self.assertGreater(save_index(self.path, graph, generation=12.5), 0)
+            index = MappedGraph(self.path)
+            self.assertEqual(index.generation, 12.5)
+            self.assertEqual((index.number_of_nodes(), index.number_of_edges()),
+                             (graph.number_of_nodes(), graph.number_of_edges()))
+
+            ranking = graph.get_ranking()
+            for node, rank in index.get_ranking().items():
+                self.assertAlmostEqual(rank, ranking[node], places=9)
+            # The top n of a domain are its url nodes with the highest ranks, whatever the order of the ties
+            for top_n in index.get_top_n_for_each_domain(3):
+                (domain, nodes), = top_n.items()
+                expected = graph.get_top_n_for_each_domain(3, domains=[domain])[0][domain]
+                for node, expected_node in zip(nodes, expected):
+                    self.assertAlmostEqual(ranking[node], ranking[expected_node], places=9)
+                self.assertEqual(len(nodes), len(expected))
+            self.assertEqual(index.get_top_n_for_each_domain(2, domains=["missing.com"]), [{"missing.com": []}])
+            self.assertEqual(len(index.get_ranking(top_k=1)), 4)
+
+            node = "site1.com"
+            self.assertEqual(index.node(index.find(node)), node)
+            neighbors = {v if u == node else u for u, v in graph.edges if node in (u, v)}
+            self.assertEqual(set(index.neighbors(node)), neighbors)
+            self.assertIsNone(index.find("https://missing.com"))
+            self.assertRaises(KeyError, index.get_rank, "https://missing.com")
+
+    def test_same_top_n_as_webgraph(self):
+        graph = WebGraph(config=self.config)
+        graph.add_many(crawl_results(60))
+        # An url node without a domain is not in any domain
+        graph.add_edge("https://www.site1.com/page1", "no-domain", weight=0)
+        graph.nodes["no-domain"]["type"] = consts.URL_TYPE_TOKEN
+        save_index(self.path, graph)
+        index = MappedGraph(self.path)
+        # The graph the server swaps in for the index once it was loaded from the snapshot
+        snapshot = os.path.join(os.path.dirname(self.path), consts.GRAPH_SNAPSHOT_FILE_NAME)
+        save_snapshot(snapshot, graph)
+        graph = load_snapshot(snapshot, config=self.config)
+
+        ranking = graph.get_ranking()
+        for domains in (None, ["site2.com", "missing.com", "site0.com"]):
+            expected, top_n = graph.get_top_n_for_each_domain(3, domains=domains), \
+                index.get_top_n_for_each_domain(3, domains=domains)
+            self.assertEqual([list(result) for result in top_n], [list(result) for result in expected])
+            # The nodes of a domain are the same but for the order of the ties
+            for result, expected_result in zip(top_n, expected):
+                (domain, nodes), = result.items()
+                self.assertEqual([round(ranking[node], 9) for node in nodes],
+                                 [round(ranking[node], 9) for node in expected_result[domain]])
+        self.assertNotIn("", [domain for result in index.get_top_n_for_each_domain(3) for domain in result])
+        self.assertEqual(set(index.get_ranking(top_k=2)),
+                         {node for result in index.get_top_n_for_each_domain(2) for nodes in result.values()
+                          for node in nodes})
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b"x" * 64)
+        self.assertRaises(ValueError, MappedGraph, self.path)
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from src.crawler.parsers import html
+from src.crawler.parsers.html import extract_page
+from src.crawler.parsers.pool import ParserPool, parse_page
+from src.crawler.parsers.url import URLsParser
+from src.data_structure.graph.callbacks.email import EmailParser
+
+PAGE = b"""
+<html>
+  <head><title>Staff</title><style>p { color: red; }</style></head>
+  <body>
+    <script>var hidden = "hidden@script.com";</script>
+    <a href="https://www.test.com/people/">People</a>
+    <a href="/relative">Relative</a>
+    <a>No href</a>
+    <a href="https://test.com/file.pdf">File</a>
+    <p>Contact: john.doe@test.com</p><p>Office</p>
+  </body>
+</html>
+"""
+
+
+class TestParsers(unittest.TestCase):
+
+    def test_extract_page(self):
+        page = extract_page("https://www.test.com/staff", PAGE)
+        self.assertEqual(page.url, "https://www.test.com/staff")
+        self.assertEqual(page.links, ["https://www.test.com/people/", "/relative", "https://test.com/file.pdf"])
+        self.assertIn("john.doe@test.com", page.text)
+        self.assertNotIn("hidden@script.com", page.text)
+
+    def test_backends_agree(self):
+        backends = [html._extract_with_bs4]
+        if html.lxml is not None:
+            backends.append(html._extract_with_lxml)
+        if html.LexborHTMLParser is not None:
+            backends.append(html._extract_with_selectolax)
+
+        expected_links, expected_text = backends[0](PAGE)
+        for backend in backends[1:]:
+            links, text = backend(PAGE)
+            self.assertEqual([link for link in links if link], [link for link in expected_links if link])
+            self.assertEqual(text.split(), expected_text.split())
+
+    def test_empty_page(self):
+        page = extract_page("https://test.com", b"")
+        self.assertEqual(page.links, [])
+        self.assertEqual(page.text, "")
+
+    def test_parsers_share_page(self):
+        page = extract_page("https://www.test.com/staff", PAGE)
+        links = URLsParser().parse(page)
+        self.assertEqual([link.data for link in links], ["https://test.com/people"])
+        self.assertEqual(links[0].url, "test.com/staff")
+        emails = list(EmailParser().process(page))
+        self.assertEqual([email.data for email in emails], ["john.doe@test.com"])
+
+    def test_parse_page_in_pool(self):
+        expected = parse_page("https://www.test.com/staff", PAGE)
+        self.assertEqual(expected.links, ["https://www.test.com/people/"])
+        self.assertEqual(expected.emails, ["john.doe@test.com"])
+        self.assertEqual(expected.text, "")
+
+        pool = ParserPool(workers=1)
+        try:
+            page = asyncio.run(pool.parse("https://www.test.com/staff", PAGE))
+        finally:
+            pool.shutdown()
+        self.assertEqual(page, expected)
+        # The email callback uses the emails found by the worker
+        self.assertEqual([email.data for email in EmailParser().process(page)], ["john.doe@test.com"])
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import src.utils.constants as consts
+from src.data_structure.array_graph.array_graph import ArrayGraph
+from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.data_structure.graph.graph import WebGraph, generate_gml
+from src.data_structure.graph.utils import decode_strings, encode_strings
+from src.data_structure.persistence import GraphLog, SnapshotWriter, load_snapshot, read_log_sequence, save_snapshot
+from src.utils.config import Config
+from testing.unit_test.test_array_graph import crawl_results
+
+
+class TestPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        self.config.config.read_dict({consts.GRAPH_SECTION: {consts.ALPHA_CONFIG_TOKEN: "0.8",
+                                                             consts.RANKING_TOLERANCE_CONFIG_TOKEN: "1e-9"}})
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.ALPHA_CONFIG_TOKEN)
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.RANKING_TOLERANCE_CONFIG_TOKEN)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, consts.GRAPH_SNAPSHOT_FILE_NAME)
+
+    def _set_backend(self, backend: str):
+        self.config.config.set(consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN, backend)
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.GRAPH_BACKEND_CONFIG_TOKEN)
+
+    def _build(self, graph_class):
+        graph = graph_class(config=self.config)
+        graph.add_many(crawl_results(50))
+        # The networkx graph weights its edges for the top n queries only
+        graph.get_top_n_for_each_domain(3)
+        return graph
+
+    def test_strings(self):
+        strings = ["", "https://www.site.com/page", "jöhn@site.com", "a\nb"]
+        self.assertEqual(decode_strings(*encode_strings(strings)), strings)
+
+    def test_round_trip(self):
+        for graph_class, backend in ((WebGraph, consts.NETWORKX_GRAPH_BACKEND_TOKEN),
+                                     (ArrayGraph, consts.ARRAY_GRAPH_BACKEND_TOKEN)):
+            graph = self._build(graph_class)
+            for compress in (True, False):
+                self.assertGreater(save_snapshot(self.path, graph, compress=compress), 0)
+                # A snapshot loads into the backend of the config, whichever saved it
+                for loaded_backend in (backend, consts.ARRAY_GRAPH_BACKEND_TOKEN):
+                    self._set_backend(loaded_backend)
+                    loaded = load_snapshot(self.path, config=self.config)
+                    self.assertEqual(set(loaded.nodes), set(graph.nodes))
+                    self.assertEqual({frozenset(edge) for edge in loaded.edges},
+                                     {frozenset(edge) for edge in graph.edges})
+                    self.assertEqual(loaded.cache[consts.EMAIL_TYPE_TOKEN], graph.cache[consts.EMAIL_TYPE_TOKEN])
+                    loaded.get_top_n_for_each_domain(3)
+                    ranking, loaded_ranking = graph.get_ranking(), loaded.get_ranking()
+                    for node, rank in ranking.items():
+                        self.assertAlmostEqual(loaded_ranking[node], rank, places=7)
+
+        loaded = load_snapshot(self.path, config=self.config)
+        self.assertEqual(loaded.to_networkx().nodes["site1.com"], {"domain": "site1.com", "type": "url"})
+        self.assertIsNone(load_snapshot(self.path + ".missing", config=self.config))
+        self.assertTrue(next(generate_gml(loaded)).startswith("graph ["))
+
+    def test_writer(self):
+        writer = SnapshotWriter()
+        self.addCleanup(writer.close)
+        written = threading.Event()
+        graphs = [self._build(WebGraph), WebGraph(config=self.config)]
+        graphs[1].add(CallbackResult(domain="new.com", url="https://new.com", data="info@new.com", type="email"))
+        writer.submit(self.path, graphs[0], on_written=written.set)
+        writer.submit(self.path, graphs[1])
+        self.assertTrue(writer.flush(10))
+        self.assertTrue(written.is_set())
+        self.assertEqual(set(load_snapshot(self.path, config=self.config).nodes), set(graphs[1].nodes))
+
+        # A failed write is logged and does not call back
+        failed = threading.Event()
+        writer.submit(os.path.join(self.path, "missing", "graph.npz"), graphs[1], on_written=failed.set)
+        self.assertTrue(writer.flush(10))
+        self.assertFalse(failed.is_set())
+
+    def test_log(self):
+        path = os.path.join(os.path.dirname(self.path), consts.GRAPH_LOG_FILE_NAME)
+        graph_log = GraphLog(path)
+        graphs = [self._build(WebGraph), WebGraph(config=self.config)]
+        graphs[1].add(CallbackResult(domain="new.com", url="https://new.com", data="info@new.com", type="email"))
+        self.assertEqual([graph_log.append(graph) for graph in graphs], [1, 2])
+        self.assertEqual([sequence for sequence, *_ in graph_log.read()], [1, 2])
+        replayed = graph_log.replay(None, config=self.config)
+        self.assertEqual(set(replayed.nodes), set(graphs[0].nodes) | set(graphs[1].nodes))
+        self.assertEqual(set(graph_log.replay(WebGraph(config=self.config), after=1).nodes), set(graphs[1].nodes))
+        # A reset record replaces the graph of the records and of the snapshot before it
+        graph_log.append(graphs[1], reset=True)
+        self.assertEqual(set(graph_log.replay(self._build(WebGraph)).nodes), set(graphs[1].nodes))
+
+        # A record that was cut short is dropped when the log is opened again
+        graph_log.close()
+        with open(path, 'ab') as f:
+            f.write(b"\x03\x00\x00")
+        graph_log = GraphLog(path)
+        self.addCleanup(graph_log.close)
+        self.assertEqual(graph_log.last_sequence, 3)
+        self.assertEqual(graph_log.append(graphs[1]), 4)
+
+        # The compacted records are dropped and the sequence goes on after them
+        graph_log.compact(3)
+        self.assertEqual([sequence for sequence, *_ in graph_log.read()], [4])
+        graph_log.compact(4)
+        self.assertEqual(graph_log.size, 0)
+        reopened = GraphLog(path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.last_sequence, 4)
+
+        save_snapshot(self.path, graphs[0], log_sequence=4)
+        self.assertEqual(read_log_sequence(self.path), 4)
+        self.assertEqual(read_log_sequence(self.path + ".missing"), 0)
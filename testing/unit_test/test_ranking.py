@@ -0,0 +1,83 @@
+import random
+import unittest
+
+import networkx as nx
+import numpy as np
+
+import src.utils.constants as consts
+from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.data_structure.graph.graph import WebGraph
+from src.data_structure.graph.ranking import GraphSnapshot, pagerank
+from src.utils.config import Config
+
+
+def random_graph(nodes: int, edges: int, seed: int = 0) -> nx.Graph:
+    """Random weighted graph with zero weight edges, a self loop and isolated nodes"""
+    rng = random.Random(seed)
+    graph = nx.Graph()
+    for node in range(nodes):
+        graph.add_node(f"n{node}", domain=f"d{node % 7}", type="url" if node % 3 else "email")
+    for _ in range(edges):
+        graph.add_edge(f"n{rng.randrange(nodes)}", f"n{rng.randrange(nodes // 2)}",
+                       weight=rng.choice([0, 0.1, 0.5, 1, 3]))
+    graph.add_edge("n1", "n1", weight=2)
+    return graph
+
+
+class TestRanking(unittest.TestCase):
+
+    def test_same_ranks_as_networkx(self):
+        for seed in range(3):
+            graph = random_graph(nodes=300, edges=900, seed=seed)
+            snapshot = GraphSnapshot.from_graph(graph)
+            ranks = snapshot.to_dict(pagerank(snapshot, tol=1e-10))
+            expected = nx.pagerank(graph, weight="weight", tol=1e-10)
+            self.assertEqual(ranks.keys(), expected.keys())
+            for node, rank in expected.items():
+                self.assertAlmostEqual(ranks[node], rank, places=9)
+
+    def test_warm_start(self):
+        graph = random_graph(nodes=300, edges=900)
+        snapshot = GraphSnapshot.from_graph(graph)
+        ranks = pagerank(snapshot, tol=1e-10)
+        np.testing.assert_allclose(pagerank(snapshot, tol=1e-10, nstart=ranks), ranks, atol=1e-8)
+        # Too few iterations fail the same way as networkx
+        self.assertRaises(nx.PowerIterationFailedConvergence, pagerank, snapshot, tol=1e-20, max_iter=1)
+
+    def test_empty_graph(self):
+        self.assertEqual(len(pagerank(GraphSnapshot.from_graph(nx.Graph()))), 0)
+
+    def test_top_k_per_domain(self):
+        graph = random_graph(nodes=300, edges=900)
+        snapshot = GraphSnapshot.from_graph(graph)
+        ranks = pagerank(snapshot)
+        ranking = snapshot.to_dict(ranks)
+
+        top_k = snapshot.top_k_per_domain(ranks, 4)
+        for domain in {graph.nodes[node]["domain"] for node in graph}:
+            urls = [node for node in graph if graph.nodes[node]["domain"] == domain
+                    and graph.nodes[node]["type"] == "url"]
+            self.assertEqual(top_k[domain], sorted(urls, key=lambda node: ranking[node], reverse=True)[:4])
+
+    def test_graph_engines_agree(self):
+        config = Config()
+        self.addCleanup(config.config.remove_option, consts.GRAPH_SECTION, consts.RANKING_ENGINE_CONFIG_TOKEN)
+        self.addCleanup(config.config.remove_option, consts.GRAPH_SECTION, consts.RANKING_TOLERANCE_CONFIG_TOKEN)
+        rankings = {}
+        for engine in (consts.SCIPY_RANKING_ENGINE_TOKEN, consts.NETWORKX_RANKING_ENGINE_TOKEN):
+            config.config.read_dict({consts.GRAPH_SECTION: {consts.RANKING_ENGINE_CONFIG_TOKEN: engine,
+                                                            consts.RANKING_TOLERANCE_CONFIG_TOKEN: "1e-10"}})
+            graph = WebGraph(config=config)
+            for page in range(20):
+                domain = f"site{page % 3}.com"
+                graph.add(CallbackResult(domain=domain, url=domain, data=f"https://{domain}/page{page}", type="url"))
+                graph.add(CallbackResult(domain=domain, url=f"https://{domain}/page{page}",
+                                         data=f"user{page % 4}@{domain}", type="email"))
+            rankings[engine] = (graph.get_ranking(), graph.get_ranking(top_k=2))
+
+        (scipy_ranking, scipy_top), (nx_ranking, nx_top) = rankings.values()
+        for node, rank in nx_ranking.items():
+            self.assertAlmostEqual(scipy_ranking[node], rank, places=9)
+        # Pages with the same rank can be picked in any order, compare the ranks of the picked nodes
+        self.assertEqual(len(scipy_top), 6)
+        np.testing.assert_allclose(sorted(scipy_top.values()), sorted(nx_top.values()), atol=1e-9)
@@ -0,0 +1,172 @@
+import asyncio
+import socket
+import threading
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+import src.utils.constants as consts
+from src.crawler.crawler import WebSpider
+from src.crawler.filter import UrlFilter
+from src.crawler.retry import GAVE_UP_COUNTER, PERMANENT_FAILURES_COUNTER, RECOVERED_COUNTER, RETRIES_COUNTER, \
+    RETRYABLE_FAILURES_COUNTER, RetryPolicy
+from src.utils.config import Config
+
+
+class FlakyServer:
+    """
+    The seed page links to `pages` pages. Each page answers 503 `failures` times, with the `retry_after` header if it
+    is given, before it answers 200, and the `missing` page always answers 404
+    """
+
+    def __init__(self, pages: int, failures: int, retry_after: str = None):
+        self.hits = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits[self.path] += 1
+                if self.path == "/missing":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if self.path != "/" and server.hits[self.path] <= failures:
+                    self.send_response(503)
+                    if retry_after:
+                        self.send_header("Retry-After", retry_after)
+                    self.end_headers()
+                    return
+
+                links = "".join(f'<a href="{server.url}/page{i}">{i}</a>' for i in range(pages))
+                body = f'<html><body>{links}<a href="{server.url}/missing">x</a></body></html>'.encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        settings = {consts.MAX_DEPTH_CONFIG_TOKEN: "1",
+                    consts.MAX_REQUEST_CONFIG_TOKEN: "4",
+                    consts.TIMEOUT_CONFIG_TOKEN: "5",
+                    consts.HOST_RATE_CONFIG_TOKEN: "0",
+                    consts.MAX_RETIRES_CONFIG_TOKEN: "3",
+                    consts.RETRY_BACKOFF_CONFIG_TOKEN: "0.01",
+                    consts.RETRY_MAX_BACKOFF_CONFIG_TOKEN: "0.05",
+                    consts.HOST_RETRY_BUDGET_CONFIG_TOKEN: "50",
+                    consts.CRAWL_RETRY_BUDGET_CONFIG_TOKEN: "500"}
+        self.config.config.read_dict({consts.CRAWLER_SECTION: settings})
+        for token in settings:
+            self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, token)
+
+    def test_is_retryable(self):
+        request = httpx.Request("GET", "http://test.com")
+        self.assertTrue(RetryPolicy.is_retryable("GET", status_code=503))
+        self.assertTrue(RetryPolicy.is_retryable("GET", status_code=429))
+        self.assertTrue(RetryPolicy.is_retryable("GET", error=httpx.ConnectTimeout("timeout", request=request)))
+        self.assertTrue(RetryPolicy.is_retryable("GET", error=httpx.ReadError("reset", request=request)))
+        self.assertFalse(RetryPolicy.is_retryable("GET", status_code=404))
+        self.assertFalse(RetryPolicy.is_retryable("GET", error=httpx.UnsupportedProtocol("ftp")))
+        self.assertFalse(RetryPolicy.is_retryable("POST", status_code=503))
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(self.config)
+        for attempt in range(10):
+            self.assertLessEqual(policy.get_backoff(attempt), min(0.05, 0.01 * 2 ** attempt))
+
+    def test_delay(self):
+        policy = RetryPolicy(self.config)
+        self.assertLessEqual(policy.get_delay(0), 0.01)
+        self.assertEqual(policy.get_delay(0, retry_after=0.04), 0.04)
+        # Longer waits than retry_max_backoff are not spent inside a request
+        self.assertIsNone(policy.get_delay(0, retry_after=86400))
+
+    def test_budgets(self):
+        self.config.config.set(consts.CRAWLER_SECTION, consts.HOST_RETRY_BUDGET_CONFIG_TOKEN, "2")
+        self.config.config.set(consts.CRAWLER_SECTION, consts.CRAWL_RETRY_BUDGET_CONFIG_TOKEN, "3")
+        policy = RetryPolicy(self.config)
+        self.assertFalse(policy.acquire("a.com", attempt=3))
+        self.assertTrue(policy.acquire("a.com", attempt=0))
+        self.assertTrue(policy.acquire("a.com", attempt=0))
+        # The budget of the host is exhausted, other hosts can still retry until the crawl budget is exhausted
+        self.assertFalse(policy.acquire("a.com", attempt=0))
+        self.assertTrue(policy.acquire("b.com", attempt=0))
+        self.assertFalse(policy.acquire("c.com", attempt=0))
+        self.assertEqual(policy.stats[RETRIES_COUNTER], 3)
+
+    def test_transient_failures_are_retried(self):
+        site = FlakyServer(pages=5, failures=2)
+        try:
+            policy = RetryPolicy(self.config)
+            spider = WebSpider(callbacks=[], url_filter=UrlFilter({}), start_seed=site.url, config=self.config,
+                               retry_policy=policy)
+            graph = asyncio.run(spider.crawl())
+        finally:
+            site.stop()
+
+        # Every page was fetched after two 503 responses, the missing page was requested once
+        self.assertEqual(site.hits, Counter({"/": 1, "/missing": 1, **{f"/page{i}": 3 for i in range(5)}}))
+        self.assertEqual(policy.stats, {RETRYABLE_FAILURES_COUNTER: 10, RETRIES_COUNTER: 10, RECOVERED_COUNTER: 5,
+                                        PERMANENT_FAILURES_COUNTER: 1})
+        self.assertEqual(len(graph.nodes), 7)
+
+    def test_retries_give_up(self):
+        site = FlakyServer(pages=2, failures=10)
+        try:
+            policy = RetryPolicy(self.config)
+            spider = WebSpider(callbacks=[], url_filter=UrlFilter({}), start_seed=site.url, config=self.config,
+                               retry_policy=policy)
+            asyncio.run(spider.crawl())
+        finally:
+            site.stop()
+
+        self.assertEqual(site.hits["/page0"], 4)
+        self.assertEqual(policy.stats[GAVE_UP_COUNTER], 2)
+
+    def test_long_retry_after_gives_up(self):
+        self.config.config.set(consts.CRAWLER_SECTION, consts.MAX_RETRY_AFTER_CONFIG_TOKEN, "0.1")
+        self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, consts.MAX_RETRY_AFTER_CONFIG_TOKEN)
+        site = FlakyServer(pages=2, failures=10, retry_after="86400")
+        try:
+            policy = RetryPolicy(self.config)
+            spider = WebSpider(callbacks=[], url_filter=UrlFilter({}), start_seed=site.url, config=self.config,
+                               retry_policy=policy)
+            asyncio.run(asyncio.wait_for(spider.crawl(), timeout=10))
+        finally:
+            site.stop()
+
+        # The pages were not retried, the host was paused for max_retry_after seconds only
+        self.assertEqual((site.hits["/page0"], site.hits["/page1"]), (1, 1))
+        self.assertEqual(policy.stats[GAVE_UP_COUNTER], 2)
+        self.assertNotIn(RETRIES_COUNTER, policy.stats)
+
+    def test_connection_errors_are_retried(self):
+        # A port with nothing listening on it
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        policy = RetryPolicy(self.config)
+        spider = WebSpider(callbacks=[], url_filter=UrlFilter({}), start_seed=url, config=self.config,
+                           retry_policy=policy)
+        asyncio.run(spider.crawl())
+        self.assertEqual(policy.stats, {RETRYABLE_FAILURES_COUNTER: 4, RETRIES_COUNTER: 3, GAVE_UP_COUNTER: 1})
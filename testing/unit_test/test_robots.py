@@ -0,0 +1,220 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+
+import src.utils.constants as consts
+from src.crawler.crawler import WebSpider
+from src.crawler.filter import ROBOTS_DROP, UrlFilter
+from src.crawler.frontier import Frontier
+from src.crawler.robots import RobotsCache, parse_robots, parse_sitemap
+from src.crawler.scheduler import HostScheduler
+from src.utils.config import Config
+
+URLSET = '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{}</urlset>'
+SITEMAP_INDEX = '<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{}</sitemapindex>'
+
+
+class SitemapServer:
+    """
+    The seed page links to /page and /private/page. The robots.txt file disallows /private and lists a sitemap index
+    of two sitemaps, one of them gzipped, with deep pages that no page links to
+    """
+
+    def __init__(self, deep_pages: int):
+        self.hits = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits[self.path] += 1
+                url = server.url
+                if self.path == "/robots.txt":
+                    body = (f"User-agent: *\nDisallow: /private\n\nUser-agent: slowbot\nCrawl-delay: 5\n\n"
+                            f"Sitemap: {url}/sitemap_index.xml\n").encode()
+                elif self.path == "/sitemap_index.xml":
+                    body = SITEMAP_INDEX.format(f"<sitemap><loc>{url}/sitemap1.xml</loc></sitemap>"
+                                                f"<sitemap><loc>{url}/sitemap2.xml.gz</loc></sitemap>").encode()
+                elif self.path in ("/sitemap1.xml", "/sitemap2.xml.gz"):
+                    pages = range(deep_pages) if self.path == "/sitemap1.xml" else ["private/deep"]
+                    body = URLSET.format("".join(f"<url><loc>{url}/deep/{page}</loc></url>" if page != "private/deep"
+                                                 else f"<url><loc>{url}/{page}</loc></url>" for page in pages)).encode()
+                    if self.path.endswith(".gz"):
+                        body = gzip.compress(body)
+                elif self.path == "/" or self.path.startswith("/deep/") or self.path == "/page":
+                    body = f'<html><a href="{url}/page">a</a><a href="{url}/private/page">b</a></html>'.encode()
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TestRobots(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        settings = {consts.MAX_DEPTH_CONFIG_TOKEN: "1",
+                    consts.MAX_REQUEST_CONFIG_TOKEN: "4",
+                    consts.TIMEOUT_CONFIG_TOKEN: "5",
+                    consts.HOST_RATE_CONFIG_TOKEN: "0"}
+        self.config.config.read_dict({consts.CRAWLER_SECTION: settings})
+        for token in settings:
+            self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, token)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "robots.sqlite")
+
+    def test_parse_sitemap(self):
+        urls, sitemaps = parse_sitemap(gzip.compress(URLSET.format("<url><loc> https://a.com/x </loc></url>").encode()))
+        self.assertEqual((urls, sitemaps), (["https://a.com/x"], []))
+        self.assertEqual(parse_sitemap(b"<html>not a sitemap"), ([], []))
+
+    def test_sitemap_size_is_capped(self):
+        sitemap = URLSET.format("".join(f"<url><loc>https://a.com/{page}</loc></url>" for page in range(1000)))
+        with mock.patch("src.crawler.robots.MAX_SITEMAP_SIZE", len(sitemap)):
+            self.assertEqual(len(parse_sitemap(gzip.compress(sitemap.encode()))[0]), 1000)
+        # A gzipped sitemap that expands past the limit is dropped without being decompressed whole
+        with mock.patch("src.crawler.robots.MAX_SITEMAP_SIZE", len(sitemap) - 1):
+            self.assertEqual(parse_sitemap(gzip.compress(sitemap.encode())), ([], []))
+        self.assertEqual(parse_sitemap(b"\x1f\x8b not gzip"), ([], []))
+
+    def test_crawl_delay(self):
+        scheduler = HostScheduler(self.config)
+        scheduler.set_crawl_delay("a.com", parse_robots("User-agent: *\nCrawl-delay: 2").crawl_delay("*"))
+        self.assertTrue(scheduler.reserve("a.com"))
+        scheduler.release("a.com", 200, 0.1)
+        # One request every two seconds
+        self.assertFalse(scheduler.reserve("a.com"))
+        self.assertTrue(scheduler.reserve("b.com"))
+
+    def test_failed_check_releases_the_slot(self):
+        robots = RobotsCache(self.config, path=self.path)
+        self.addCleanup(robots.close)
+        url_filter = UrlFilter({}, robots=robots)
+        self.config.config.read_dict({consts.CRAWLER_SECTION: {consts.MAX_HOST_CONNECTIONS_CONFIG_TOKEN: "1"}})
+        self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION,
+                        consts.MAX_HOST_CONNECTIONS_CONFIG_TOKEN)
+        scheduler = HostScheduler(self.config)
+        frontier = Frontier(url_filter, scheduler=scheduler)
+        spider = WebSpider(callbacks=[], url_filter=url_filter, start_seed="http://a.com/", config=self.config,
+                           frontier=frontier)
+
+        def broken(site):
+            raise OSError("disk error")
+
+        robots.get = broken
+        self.assertTrue(scheduler.reserve("a.com"))
+        with self.assertRaises(OSError):
+            asyncio.run(spider._obey_robots("http://a.com/page", 1))
+        # The slot reserved by the frontier was given back
+        self.assertTrue(scheduler.reserve("a.com"))
+
+    def test_robots_and_sitemaps(self):
+        site = SitemapServer(deep_pages=20)
+        robots = RobotsCache(self.config, path=self.path)
+        try:
+            url_filter = UrlFilter({}, robots=robots)
+            scheduler = HostScheduler(self.config)
+            frontier = Frontier(url_filter, scheduler=scheduler)
+            spider = WebSpider(callbacks=[], url_filter=url_filter, start_seed=f"{site.url}/", config=self.config,
+                               frontier=frontier)
+            graph = asyncio.run(spider.crawl())
+        finally:
+            site.stop()
+            robots.close()
+
+        # The deep pages were reached from the sitemaps at depth 1, the disallowed pages were never fetched
+        self.assertEqual(site.hits["/robots.txt"], 1)
+        self.assertTrue(all(site.hits[f"/deep/{page}"] == 1 for page in range(20)))
+        self.assertEqual(site.hits["/page"], 1)
+        self.assertFalse([path for path in site.hits if path.startswith("/private")])
+        self.assertGreater(url_filter.stats[ROBOTS_DROP], 0)
+        self.assertIn(f"{site.url.split('//')[1]}/page", graph)
+
+        # The rules are kept on the disk for the next builds
+        robots = RobotsCache(self.config, path=self.path)
+        self.addCleanup(robots.close)
+        self.assertFalse(robots.is_allowed(f"{site.url}/private/page"))
+        self.assertTrue(robots.is_allowed(f"{site.url}/page"))
+        self.assertIsNone(robots.is_allowed("http://unknown.com/page"))
+
+    def test_sitemaps_of_cached_rules(self):
+        site = SitemapServer(deep_pages=5)
+        self.addCleanup(site.stop)
+        for build in range(2):
+            # Every build opens the cache again, the second one finds the rules of the host in it
+            robots = RobotsCache(self.config, path=self.path)
+            try:
+                url_filter = UrlFilter({}, robots=robots)
+                spider = WebSpider(callbacks=[], url_filter=url_filter, start_seed=f"{site.url}/", config=self.config)
+                asyncio.run(spider.crawl())
+            finally:
+                robots.close()
+
+        self.assertEqual(site.hits["/robots.txt"], 1)
+        self.assertEqual(site.hits["/sitemap_index.xml"], 2)
+        self.assertTrue(all(site.hits[f"/deep/{page}"] == 2 for page in range(5)))
+
+    def test_only_fetched_or_missing_rules_are_kept(self):
+        robots = RobotsCache(self.config, path=self.path)
+        url_filter = UrlFilter({}, robots=robots)
+        spider = WebSpider(callbacks=[], url_filter=url_filter, start_seed="http://a.com/", config=self.config,
+                           frontier=Frontier(url_filter))
+        responses = {"http://forbidden.com/robots.txt": (403, {}, ""),
+                     "http://missing.com/robots.txt": (404, {}, ""),
+                     "http://moved.com/robots.txt": (301, {"location": "https://www.moved.com/robots.txt"}, ""),
+                     "https://www.moved.com/robots.txt": (200, {}, "User-agent: *\nDisallow: /private"),
+                     "http://loop.com/robots.txt": (302, {"location": "/robots.txt"}, "")}
+
+        async def fetch(url):
+            if url.startswith("http://cancelled.com"):
+                raise asyncio.CancelledError()
+            status_code, headers, text = responses[url]
+            return httpx.Response(status_code, headers=headers, text=text, request=httpx.Request("GET", url))
+
+        spider._fetch = fetch
+        try:
+            for site in ("http://forbidden.com", "http://missing.com", "http://moved.com", "http://loop.com"):
+                asyncio.run(spider._fetch_robots(site))
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(spider._fetch_robots("http://cancelled.com"))
+            # The rules are used by this crawl in any case
+            self.assertTrue(robots.is_allowed("http://cancelled.com/page"))
+            self.assertFalse(robots.is_allowed("http://moved.com/private"))
+        finally:
+            robots.close()
+
+        # Only the missing file and the file that was fetched after its redirect are kept for the next builds
+        robots = RobotsCache(self.config, path=self.path)
+        self.addCleanup(robots.close)
+        self.assertTrue(robots.is_allowed("http://missing.com/page"))
+        self.assertFalse(robots.is_allowed("http://moved.com/private"))
+        for site in ("http://forbidden.com", "http://loop.com", "http://cancelled.com"):
+            self.assertIsNone(robots.is_allowed(f"{site}/page"))
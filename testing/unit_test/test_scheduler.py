@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import src.utils.constants as consts
+from src.crawler.crawler import WebSpider
+from src.crawler.filter import UrlFilter
+from src.crawler.frontier import Frontier
+from src.crawler.scheduler import HostScheduler, parse_retry_after
+from src.utils.config import Config
+
+
+class StubServer:
+    """Serve a seed page that links to `pages` pages. Every request to a throttled server gets a 429 at first"""
+
+    def __init__(self, pages: int, throttled: bool = False, retry_after: int = 2):
+        self.hits = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits.append(time.monotonic())
+                if throttled and len(server.hits) > 1 and not server.throttled_once:
+                    server.throttled_once = True
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(retry_after))
+                    self.end_headers()
+                    return
+
+                links = "".join(f'<a href="{server.url}/page{i}">{i}</a>' for i in range(pages))
+                body = f"<html><body>{links}</body></html>".encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.throttled_once = False
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TestHostScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        settings = {consts.MAX_DEPTH_CONFIG_TOKEN: "1",
+                    consts.MAX_REQUEST_CONFIG_TOKEN: "4",
+                    consts.TIMEOUT_CONFIG_TOKEN: "5",
+                    consts.HOST_RATE_CONFIG_TOKEN: "0",
+                    consts.MAX_HOST_CONNECTIONS_CONFIG_TOKEN: "4",
+                    consts.MAX_CONNECTIONS_CONFIG_TOKEN: "100"}
+        self.config.config.read_dict({consts.CRAWLER_SECTION: settings})
+        for token in settings:
+            self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, token)
+
+    def test_concurrency_grows_and_halves(self):
+        scheduler = HostScheduler(self.config)
+        self.assertTrue(scheduler.reserve("a.com"))
+        self.assertTrue(scheduler.reserve("a.com"))
+        self.assertFalse(scheduler.reserve("a.com"))
+        # Another host is not affected by the limit of a.com
+        self.assertTrue(scheduler.reserve("b.com"))
+
+        scheduler.release("a.com", 200, latency=0.1)
+        scheduler.release("a.com", 200, latency=0.1)
+        self.assertAlmostEqual(scheduler.get_host_limit("a.com"), 2.9)
+        self.assertTrue(scheduler.reserve("a.com"))
+        self.assertTrue(scheduler.reserve("a.com"))
+
+        scheduler.release("a.com", 503, latency=0.1)
+        self.assertAlmostEqual(scheduler.get_host_limit("a.com"), 1.45)
+        self.assertFalse(scheduler.reserve("a.com"))
+
+    def test_retry_after_pauses_only_its_host(self):
+        scheduler = HostScheduler(self.config)
+        self.assertTrue(scheduler.reserve("a.com"))
+        scheduler.release("a.com", 429, latency=0.1, retry_after=0.2)
+        self.assertFalse(scheduler.reserve("a.com"))
+        self.assertTrue(scheduler.reserve("b.com"))
+        time.sleep(0.25)
+        self.assertTrue(scheduler.reserve("a.com"))
+
+    def test_retry_after_is_capped(self):
+        self.config.config.set(consts.CRAWLER_SECTION, consts.MAX_RETRY_AFTER_CONFIG_TOKEN, "0.2")
+        self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, consts.MAX_RETRY_AFTER_CONFIG_TOKEN)
+        scheduler = HostScheduler(self.config)
+        self.assertTrue(scheduler.reserve("a.com"))
+        scheduler.release("a.com", 429, latency=0.1, retry_after=86400)
+        self.assertFalse(scheduler.reserve("a.com"))
+        time.sleep(0.25)
+        self.assertTrue(scheduler.reserve("a.com"))
+
+    def test_token_bucket(self):
+        self.config.config.set(consts.CRAWLER_SECTION, consts.HOST_RATE_CONFIG_TOKEN, "20")
+        self.config.config.set(consts.CRAWLER_SECTION, consts.HOST_BURST_CONFIG_TOKEN, "1")
+        self.addCleanup(self.config.config.remove_option, consts.CRAWLER_SECTION, consts.HOST_BURST_CONFIG_TOKEN)
+        scheduler = HostScheduler(self.config)
+        self.assertTrue(scheduler.reserve("a.com"))
+        scheduler.release("a.com", 200, latency=0.01)
+        self.assertFalse(scheduler.reserve("a.com"))
+        time.sleep(0.06)
+        self.assertTrue(scheduler.reserve("a.com"))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3)
+        self.assertEqual(parse_retry_after(None), 0)
+        self.assertEqual(parse_retry_after("not a date"), 0)
+        self.assertEqual(parse_retry_after("inf"), 0)
+        self.assertEqual(parse_retry_after("nan"), 0)
+        self.assertGreater(parse_retry_after(time.strftime("%a, %d %b %Y %H:%M:%S GMT",
+                                                           time.gmtime(time.time() + 60))), 50)
+
+    def test_throttled_host_does_not_slow_other_hosts(self):
+        throttled, healthy = StubServer(pages=10, throttled=True, retry_after=2), StubServer(pages=30)
+        try:
+            url_filter = UrlFilter({})
+            scheduler = HostScheduler(self.config)
+            frontier = Frontier(url_filter, scheduler=scheduler)
+            spider = WebSpider(callbacks=[], url_filter=url_filter, start_seed=throttled.url, config=self.config,
+                               frontier=frontier)
+            start = time.monotonic()
+            asyncio.run(spider.crawl(start_seed=[throttled.url, healthy.url]))
+        finally:
+            throttled.stop()
+            healthy.stop()
+
+        self.assertEqual(len(healthy.hits), 31)
+        # The throttled page was sent again after the pause
+        self.assertEqual(len(throttled.hits), 12)
+        # The healthy host was crawled while the throttled host was paused
+        self.assertLess(max(healthy.hits) - start, 2)
+        self.assertGreaterEqual(max(throttled.hits) - start, 2)
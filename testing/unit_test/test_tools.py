@@ -0,0 +1,32 @@
+import unittest
+
+from src.utils.tools import CanonicalUrl, extract_base_url, extract_domain, get_url_cache_stats, is_valid_url, \
+    parse_url
+
+
+class TestTools(unittest.TestCase):
+
+    def test_parse_url(self):
+        url = parse_url("https://www.test.com/people/Staff.PDF")
+        self.assertIsInstance(url, CanonicalUrl)
+        self.assertEqual((url.scheme, url.netloc, url.path), ("https", "www.test.com", "/people/Staff.PDF"))
+        self.assertEqual(url.extension, ".pdf")
+        self.assertEqual(url.base_url, "test.com/people/Staff.PDF")
+        self.assertFalse(url.is_web_page)
+
+        self.assertEqual(extract_domain("https://www.test.com/people/"), "www.test.com")
+        self.assertEqual(extract_base_url("https://www.test.com/people/"), "test.com/people")
+        self.assertFalse(is_valid_url("https://www.test.com/people.html"))
+        self.assertTrue(is_valid_url("https://www.test.com/people"))
+
+    def test_cache(self):
+        href = "https://www.test.com/navigation/cached"
+        before = get_url_cache_stats()
+        first = parse_url(href)
+        for _ in range(10):
+            self.assertIs(parse_url(href), first)
+            extract_base_url(href)
+
+        stats = get_url_cache_stats()
+        self.assertEqual(stats["misses"] - before["misses"], 1)
+        self.assertEqual(stats["hits"] - before["hits"], 20)
@@ -0,0 +1,44 @@
+import unittest
+
+import src.utils.constants as consts
+from src.crawler.filter import UrlFilter
+from src.crawler.visited import BloomVisitedSet, ExactVisitedSet, FingerprintVisitedSet, create_visited_set
+
+URLS = [f"test{i % 7}.com/page/{i}" for i in range(5000)]
+
+
+class TestVisitedSets(unittest.TestCase):
+
+    def test_exact_backends(self):
+        for visited in (ExactVisitedSet(), FingerprintVisitedSet(capacity=8)):
+            for url in URLS[:2500]:
+                visited.add(url)
+                visited.add(url)
+            self.assertEqual(len(visited), 2500)
+            self.assertTrue(all(url in visited for url in URLS[:2500]))
+            self.assertFalse(any(url in visited for url in URLS[2500:]))
+            self.assertGreater(visited.memory_usage(), 0)
+
+    def test_bloom_false_positive_rate(self):
+        visited = BloomVisitedSet(capacity=2500, error_rate=0.01)
+        for url in URLS[:2500]:
+            visited.add(url)
+        self.assertTrue(all(url in visited for url in URLS[:2500]))
+        false_positives = sum(url in visited for url in URLS[2500:])
+        self.assertLess(false_positives / 2500, 0.03)
+
+    def test_fingerprints_use_less_memory(self):
+        exact, fingerprints = ExactVisitedSet(), FingerprintVisitedSet(capacity=len(URLS))
+        for url in URLS:
+            exact.add(url)
+            fingerprints.add(url)
+        self.assertLess(fingerprints.memory_usage(), exact.memory_usage())
+
+    def test_filter_uses_configured_backend(self):
+        url_filter = UrlFilter({consts.VISITED_BACKEND_FILTER: consts.BLOOM_VISITED_SET_TOKEN,
+                                consts.VISITED_CAPACITY_FILTER: "1000"})
+        self.assertIsInstance(url_filter.seen, BloomVisitedSet)
+        self.assertEqual(url_filter.filter(["https://www.test.com/a", "https://test.com/a/"]), ["https://www.test.com/a"])
+        self.assertFalse(url_filter.is_new("https://test.com/a"))
+        with self.assertRaises(ValueError):
+            create_visited_set({consts.VISITED_BACKEND_FILTER: "unknown"})
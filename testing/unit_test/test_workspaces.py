@@ -0,0 +1,196 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import src.utils.constants as consts
+from src.data_structure.graph.callbacks.callback import CallbackResult
+from src.data_structure import persistence
+from src.data_structure.graph.graph import WebGraph
+from src.data_structure.persistence import LOG_HEADER
+from src.server.jobs import BuildJobManager, DONE_STATUS
+from src.server.workspaces import WorkspaceRegistry, validate_workspace_name
+from src.utils.config import Config
+
+
+def build_graph(config: Config, pages: int) -> WebGraph:
+    graph = WebGraph(config=config)
+    graph.add_many(CallbackResult(domain="site.com", url=f"https://site.com/page{page}",
+                                  data=f"https://site.com/page{page + 1}", type="url") for page in range(pages))
+    return graph
+
+
+class TestWorkspaces(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        self.config.config.read_dict({consts.GRAPH_SECTION: {consts.ALPHA_CONFIG_TOKEN: "0.8"}})
+        self.addCleanup(self.config.config.remove_option, consts.GRAPH_SECTION, consts.ALPHA_CONFIG_TOKEN)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_publish(self):
+        registry = WorkspaceRegistry(directory=self.directory)
+        self.assertIsNone(registry.get("team-a"))
+        first = registry.publish("team-a", build_graph(self.config, 3))
+        registry.publish("team_b", build_graph(self.config, 5))
+
+        # A reader that holds the published workspace keeps its graph after the next build is published
+        second = registry.publish("team-a", build_graph(self.config, 8))
+        self.assertEqual((first.version, second.version), (1, 2))
+        self.assertEqual(first.graph.number_of_nodes(), 4)
+        self.assertIs(registry.get("team-a"), second)
+        self.assertEqual([workspace.name for workspace in registry.list()], ["team-a", "team_b"])
+        self.assertEqual(registry.get("team_b").to_dict()["nodes"], 6)
+        # The snapshots are saved in the background
+        self.assertTrue(registry.flush(10))
+        self.assertTrue(os.path.exists(registry.paths("team-a").snapshot))
+
+        # The saved workspaces answer from their indexes, their graphs are loaded when they are asked for
+        loaded = WorkspaceRegistry(directory=self.directory)
+        loaded.load()
+        workspace = loaded.get("team-a")
+        self.assertFalse(workspace.loader.loaded)
+        self.assertEqual(workspace.to_dict()["nodes"], 9)
+        (domain, nodes), = workspace.ranked.get_top_n_for_each_domain(2)[0].items()
+        self.assertTrue(domain == "site.com" and len(nodes) == 2 and set(nodes) <= set(second.graph.nodes))
+        self.assertEqual(workspace.graph.number_of_nodes(), 9)
+        self.assertIs(workspace.ranked, workspace.graph)
+        self.assertEqual(loaded.get("team_b").graph.number_of_nodes(), 6)
+
+        # An index that is not the index of the snapshot is not used
+        os.replace(registry.paths("team-a").index, registry.paths("team_b").index)
+        loaded = WorkspaceRegistry(directory=self.directory)
+        loaded.load()
+        self.assertTrue(loaded.get("team_b").loader.loaded)
+        self.assertEqual(loaded.get("team_b").ranked.number_of_nodes(), 6)
+        self.assertTrue(loaded.flush(10))
+
+    def test_merge(self):
+        registry = WorkspaceRegistry(directory=self.directory)
+        first = registry.merge("team-a", build_graph(self.config, 3))
+        self.assertTrue(registry.flush(10))
+        # The graphs of the next builds are merged into the published graph, which is not changed
+        graph = WebGraph(config=self.config)
+        graph.add(CallbackResult(domain="other.com", url="https://other.com/page", data="https://site.com/page1",
+                                 type="url"))
+        second = registry.merge("team-a", graph)
+        self.assertEqual((first.graph.number_of_nodes(), second.graph.number_of_nodes()), (4, 5))
+        self.assertTrue(registry.flush(10))
+
+        # The graphs that were not folded into the snapshot yet are replayed from the log
+        paths = registry.paths("team-a")
+        self.assertGreater(os.path.getsize(paths.log), 0)
+        loaded = WorkspaceRegistry(directory=self.directory)
+        loaded.load()
+        self.assertEqual(set(loaded.get("team-a").graph.nodes), set(second.graph.nodes))
+
+        # A build that replaces the graph drops the log once its snapshot was saved
+        replaced = loaded.replace("team-a", build_graph(self.config, 2))
+        self.assertTrue(loaded.flush(10))
+        self.assertEqual(os.path.getsize(paths.log), LOG_HEADER.size)
+        loaded = WorkspaceRegistry(directory=self.directory)
+        loaded.load()
+        self.assertEqual(set(loaded.get("team-a").graph.nodes), set(replaced.graph.nodes))
+
+    def test_replace_is_logged(self):
+        registry = WorkspaceRegistry(directory=self.directory)
+        registry.merge("team-a", build_graph(self.config, 3))
+        self.assertTrue(registry.flush(10))
+        registry.merge("team-a", build_graph(self.config, 6))
+        self.assertTrue(registry.flush(10))
+        # The server stops before the snapshot of the replaced graph is saved
+        with mock.patch.object(registry, "_save"):
+            replaced = registry.replace("team-a", build_graph(self.config, 1))
+        loaded = WorkspaceRegistry(directory=self.directory)
+        loaded.load()
+        self.assertEqual(set(loaded.get("team-a").graph.nodes), set(replaced.graph.nodes))
+
+    def test_merges_reuse_the_previous_graph(self):
+        registry = WorkspaceRegistry(directory=self.directory)
+        first = registry.merge("team-a", build_graph(self.config, 3))
+        reader = registry.read("team-a")
+        self.assertIs(reader.__enter__(), first)
+        second = registry.merge("team-a", build_graph(self.config, 5))
+        self.assertIsNot(second.graph, first.graph)
+
+        # The graph of the first build is brought up to date and published again, once its reader left
+        merged = threading.Event()
+        with mock.patch("src.server.workspaces.combine_graphs") as combine_graphs:
+            thread = threading.Thread(target=lambda: registry.merge("team-a", build_graph(self.config, 7)) and
+                                      merged.set())
+            thread.start()
+            self.assertFalse(merged.wait(0.1))
+            self.assertIs(registry.get("team-a"), second)
+            self.assertEqual(first.graph.number_of_nodes(), 4)
+            reader.__exit__(None, None, None)
+            thread.join(5)
+        self.assertTrue(merged.is_set())
+        combine_graphs.assert_not_called()
+        third = registry.get("team-a")
+        self.assertIs(third.graph, first.graph)
+        self.assertEqual(third.graph.number_of_nodes(), 8)
+        # A new reader reads the published graph, not the retired one
+        with registry.read("team-a") as workspace:
+            self.assertIs(workspace, third)
+        self.assertTrue(registry.flush(10))
+
+    def test_merge_waits_for_the_snapshot_of_the_spare(self):
+        registry = WorkspaceRegistry(directory=self.directory)
+        written = threading.Event()
+        save_snapshot = persistence.save_snapshot
+
+        def slow_save_snapshot(path, graph, **kwargs):
+            if graph is first.graph:
+                written.wait(5)
+            return save_snapshot(path, graph, **kwargs)
+
+        with mock.patch("src.data_structure.persistence.save_snapshot", side_effect=slow_save_snapshot):
+            first = registry.merge("team-a", build_graph(self.config, 3))
+            registry.merge("team-a", build_graph(self.config, 5))
+
+            # The spare is not changed while its snapshot is being written
+            merged = threading.Event()
+            thread = threading.Thread(target=lambda: registry.merge("team-a", build_graph(self.config, 7)) and
+                                      merged.set())
+            thread.start()
+            self.assertFalse(merged.wait(0.2))
+            self.assertEqual(first.graph.number_of_nodes(), 4)
+            written.set()
+            thread.join(5)
+            self.assertTrue(merged.is_set())
+            self.assertTrue(registry.flush(10))
+        self.assertIs(registry.get("team-a").graph, first.graph)
+        self.assertEqual(first.graph.number_of_nodes(), 8)
+
+    def test_invalid_names(self):
+        for name in ("", "../other", "a b", "x" * 65, None):
+            self.assertRaises(ValueError, validate_workspace_name, name)
+        self.assertRaises(ValueError, WorkspaceRegistry(directory=self.directory).publish, "../other",
+                          build_graph(self.config, 1))
+
+    def test_builds_of_a_workspace_run_in_order(self):
+        manager = BuildJobManager(max_builds=2)
+        release = threading.Event()
+        running = []
+
+        def build(name):
+            def run(job):
+                running.append(name)
+                return release.wait(5) and name
+            return run
+
+        first = manager.submit({}, build=build("a1"), workspace="a")
+        second = manager.submit({}, build=build("a2"), workspace="a")
+        other = manager.submit({}, build=build("b1"), workspace="b")
+        # The build of the other workspace runs next to the first one, the second build of the workspace waits
+        self.assertTrue(other.wait(0.05) is False and not second.started)
+        self.assertEqual(sorted(running), ["a1", "b1"])
+
+        release.set()
+        self.assertTrue(first.wait(5) and second.wait(5) and other.wait(5))
+        self.assertEqual([job.status for job in (first, second, other)], [DONE_STATUS] * 3)
+        self.assertEqual(running.index("a2"), 2)
+        self.assertEqual(second.to_dict()["workspace"], "a")